@@ -0,0 +1,251 @@
+"""
+Lock bundles: lock files and every pinned artifact in one file.
+
+A bundle is an uncompressed zip archive. Its first member, MANIFEST, lists
+each env's lock and the artifacts it installs, with their sha256 and size;
+the zip central directory gives the offset of every member, so an env's
+artifacts are read directly from a mounted bundle without unpacking the rest.
+
+A bundle is built on a host with index access (`tox-pin-deps bundle`), and
+installed from with `--pip-compile-bundle` where there is none: the env's
+lock is staged with `--no-index --find-links` pointing at its artifacts.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import threading
+import typing as t
+import zipfile
+
+from .inputs import file_digest
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+LOCKS_DIR = "locks"
+ARTIFACTS_DIR = "artifacts"
+STAGE_DIR = Path("tox-pin-deps", "bundle")
+DEFAULT_WORKERS = 4
+# lock file options replaced by the bundle's --no-index --find-links
+INDEX_OPTIONS = ("-i", "--index-url", "--extra-index-url", "-f", "--find-links")
+CHUNK_SIZE = 1024**2
+
+
+class BundleError(Exception):
+    """A bundle could not be built, or is inconsistent."""
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def download_artifacts(
+    lock: t.Union[str, Path],
+    dest: t.Union[str, Path],
+    python: t.Union[str, Path] = sys.executable,
+    pip_opts: t.Sequence[str] = (),
+) -> None:
+    """`pip download` the pins of `lock` into `dest`, checking their hashes."""
+    result = subprocess.run(
+        [
+            str(python),
+            "-m",
+            "pip",
+            "download",
+            "--no-deps",
+            "--quiet",
+            "--dest",
+            str(dest),
+            *pip_opts,
+            "-r",
+            str(lock),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    if result.returncode:
+        raise BundleError(f"pip download failed for {lock}:\n{result.stdout}")
+
+
+def build(
+    requirements_directory: t.Union[str, Path],
+    output: t.Union[str, Path],
+    envs: t.Sequence[str] = (),
+    python: t.Union[str, Path] = sys.executable,
+    pip_opts: t.Sequence[str] = (),
+    max_workers: int = DEFAULT_WORKERS,
+) -> t.Dict[str, t.Any]:
+    """
+    Download the artifacts of each lock in `requirements_directory` and bundle them.
+
+    Artifacts are downloaded for the interpreter `python` (or the platform
+    selected by `pip_opts`, such as `--platform`), once per env, and stored
+    once in the bundle.
+
+    :return: the manifest
+    """
+    requirements_directory = Path(requirements_directory)
+    locks = {
+        lock.stem: lock
+        for lock in sorted(requirements_directory.glob("*.txt"))
+        if not envs or lock.stem in envs
+    }
+    missing = sorted(set(envs) - set(locks))
+    if missing:
+        raise BundleError(f"no lock file for {', '.join(missing)}")
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".tox-pin-deps-bundle.") as td:
+
+        def _download(envname: str) -> t.List[Path]:
+            dest = Path(td, envname)
+            dest.mkdir()
+            download_artifacts(locks[envname], dest, python=python, pip_opts=pip_opts)
+            return sorted(dest.iterdir())
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            downloaded = dict(zip(locks, executor.map(_download, locks)))
+
+        manifest: t.Dict[str, t.Any] = {
+            "version": FORMAT_VERSION,
+            "envs": {},
+            "artifacts": {},
+        }
+        sources: t.Dict[str, Path] = {}
+        for envname, paths in downloaded.items():
+            for path in paths:
+                digest = _sha256(path)
+                known = manifest["artifacts"].get(path.name)
+                if known is not None and known["sha256"] != digest:
+                    raise BundleError(f"{path.name}: downloaded with different content")
+                manifest["artifacts"][path.name] = {
+                    "sha256": digest,
+                    "size": path.stat().st_size,
+                }
+                sources[path.name] = path
+            manifest["envs"][envname] = {
+                "lock": f"{LOCKS_DIR}/{envname}.txt",
+                "lock_digest": file_digest(locks[envname]),
+                "artifacts": [path.name for path in paths],
+            }
+
+        fd, tmp = tempfile.mkstemp(dir=output.parent, prefix=f".{output.name}.")
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED) as zf:
+                zf.writestr(MANIFEST, json.dumps(manifest, indent=1, sort_keys=True))
+                for envname, lock in locks.items():
+                    zf.write(lock, manifest["envs"][envname]["lock"])
+                for name in sorted(sources):
+                    zf.write(sources[name], f"{ARTIFACTS_DIR}/{name}")
+            os.replace(tmp, output)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return manifest
+
+
+class Bundle:
+    """A bundle opened for installing."""
+
+    def __init__(self, path: t.Union[str, Path]):
+        self.path = Path(path)
+        try:
+            with zipfile.ZipFile(self.path) as zf:
+                self.manifest: t.Dict[str, t.Any] = json.loads(zf.read(MANIFEST))
+        except (KeyError, ValueError, zipfile.BadZipFile):
+            raise BundleError(f"{self.path}: not a lock bundle") from None
+        except OSError as exc:
+            raise BundleError(f"{self.path}: cannot open bundle: {exc}") from exc
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise BundleError(
+                f"{self.path}: unsupported bundle version {self.manifest.get('version')}"
+            )
+
+    @property
+    def envs(self) -> t.List[str]:
+        return sorted(self.manifest["envs"])
+
+    def lock_text(self, envname: str) -> str:
+        with zipfile.ZipFile(self.path) as zf:
+            return zf.read(self.manifest["envs"][envname]["lock"]).decode()
+
+    def lock_digest(self, envname: str) -> t.Optional[str]:
+        return t.cast(t.Optional[str], self.manifest["envs"][envname]["lock_digest"])
+
+    def extract(self, envname: str, wheelhouse: t.Union[str, Path]) -> t.List[Path]:
+        """
+        Copy the artifacts of `envname` into `wheelhouse`, verifying their sha256.
+
+        Artifacts already present with the expected size are not copied again,
+        so envs sharing a wheelhouse only extract what they add.
+        """
+        wheelhouse = Path(wheelhouse)
+        wheelhouse.mkdir(parents=True, exist_ok=True)
+        paths = []
+        with zipfile.ZipFile(self.path) as zf:
+            for name in self.manifest["envs"][envname]["artifacts"]:
+                info = self.manifest["artifacts"][name]
+                dest = wheelhouse / name
+                paths.append(dest)
+                if dest.exists() and dest.stat().st_size == info["size"]:
+                    continue
+                fd, tmp = tempfile.mkstemp(dir=wheelhouse, prefix=f".{name}.")
+                try:
+                    h = hashlib.sha256()
+                    with zf.open(f"{ARTIFACTS_DIR}/{name}") as src, os.fdopen(
+                        fd, "wb"
+                    ) as dst:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                            h.update(chunk)
+                            dst.write(chunk)
+                    if h.hexdigest() != info["sha256"]:
+                        raise BundleError(f"{self.path}: {name} is corrupt")
+                    os.replace(tmp, dest)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+        return paths
+
+    def stage(self, envname: str, directory: t.Union[str, Path]) -> Path:
+        """
+        Extract the artifacts of `envname` and write its lock for offline install.
+
+        :return: the lock, with the index options replaced by `--no-index` and
+            `--find-links` to the extracted artifacts
+        """
+        directory = Path(directory)
+        wheelhouse = directory / "wheelhouse"
+        self.extract(envname, wheelhouse)
+        lines = [
+            line
+            for line in self.lock_text(envname).splitlines()
+            if line.split("=", 1)[0].split(" ", 1)[0] not in INDEX_OPTIONS
+        ]
+        staged = directory / f"{envname}.txt"
+        staged.write_text(
+            "\n".join(["--no-index", f"--find-links {wheelhouse}", *lines]) + "\n"
+        )
+        return staged
+
+
+_bundles: t.Dict[Path, Bundle] = {}
+_bundles_lock = threading.Lock()
+
+
+def open_bundle(path: t.Union[str, Path]) -> Bundle:
+    """The session's Bundle at `path`."""
+    path = Path(path).resolve()
+    with _bundles_lock:
+        if path not in _bundles:
+            _bundles[path] = Bundle(path)
+        return _bundles[path]
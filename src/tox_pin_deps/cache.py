@@ -0,0 +1,211 @@
+"""A content-addressed cache of lock files, keyed by the digest of their inputs."""
+import abc
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import threading
+import typing as t
+
+ENV_CACHE = "TOX_PIN_DEPS_CACHE"
+ENV_CACHE_MAX_SIZE = "TOX_PIN_DEPS_CACHE_MAX_SIZE"
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+STATS_FILE = "stats.json"
+
+
+def parse_size(size: t.Union[str, int, None]) -> t.Optional[int]:
+    """Parse a size like `512M` or `2G` into bytes."""
+    if size is None or size == "":
+        return None
+    match = re.match(r"^\s*(\d+)\s*([KMG]?)i?B?\s*$", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()]
+
+
+class CacheBackend(abc.ABC):
+    """Storage for cached lock files."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> t.Optional[bytes]:  # pragma: no cover
+        """Return the entry stored under `key`, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes) -> None:  # pragma: no cover
+        """Store `data` under `key`, replacing any existing entry."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def evict(self, max_size: int) -> int:  # pragma: no cover
+        """Remove least recently used entries until under `max_size` bytes."""
+        raise NotImplementedError
+
+    def record_stats(self, **counts: int) -> None:
+        """Add `counts` to the backend's cumulative counters, if supported."""
+
+    def stats(self) -> t.Dict[str, int]:
+        """Cumulative counters of the backend, if supported."""
+        return {}
+
+
+class DirectoryBackend(CacheBackend):
+    """
+    Entries stored as files in a local or shared directory.
+
+    Writes are atomic (write to a temporary file, then rename), so several
+    hosts may share the directory. Reading an entry updates its mtime, which
+    orders entries for LRU eviction.
+    """
+
+    def __init__(self, root: t.Union[str, Path]):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.txt"
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key: str) -> t.Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._write_atomic(self._path(key), data)
+
+    def entries(self) -> t.List[t.Tuple[float, int, Path]]:
+        """(mtime, size, path) of each entry, least recently used first."""
+        entries = []
+        for path in self.root.glob("*/*.txt"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return sorted(entries)
+
+    def evict(self, max_size: int) -> int:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        return evicted
+
+    def stats(self) -> t.Dict[str, int]:
+        try:
+            return t.cast(
+                t.Dict[str, int],
+                json.loads((self.root / STATS_FILE).read_text()),
+            )
+        except (OSError, ValueError):
+            return {}
+
+    def record_stats(self, **counts: int) -> None:
+        # read-modify-write: concurrent writers may drop an increment, which is
+        # acceptable for monitoring counters
+        stats = self.stats()
+        for name, count in counts.items():
+            stats[name] = stats.get(name, 0) + count
+        self._write_atomic(self.root / STATS_FILE, json.dumps(stats).encode())
+
+
+BACKENDS: t.Dict[str, t.Callable[[str], CacheBackend]] = {
+    "file": DirectoryBackend,
+}
+
+
+def backend_from_spec(spec: str) -> CacheBackend:
+    """
+    Create the backend named by `spec`.
+
+    `spec` is a path, or `scheme://location` where scheme is a key of BACKENDS.
+    """
+    scheme, sep, location = spec.partition("://")
+    if not sep:
+        return DirectoryBackend(spec)
+    try:
+        factory = BACKENDS[scheme]
+    except KeyError:
+        raise ValueError(f"Unknown lock cache backend {scheme!r} in {spec!r}")
+    return factory(location)
+
+
+class LockCache:
+    """Lock files keyed by input digest, with hit/miss counters."""
+
+    def __init__(self, backend: CacheBackend, max_size: t.Optional[int] = None):
+        self.backend = backend
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def restore(self, key: str, lock_file: Path) -> bool:
+        """Write the cached lock for `key` to `lock_file`, if there is one."""
+        data = self.backend.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.backend.record_stats(**{"misses" if data is None else "hits": 1})
+        if data is None:
+            return False
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        lock_file.write_bytes(data)
+        return True
+
+    def store(self, key: str, lock_file: Path) -> None:
+        """Save `lock_file` under `key`, then evict down to `max_size`."""
+        self.backend.put(key, lock_file.read_bytes())
+        evicted = self.backend.evict(self.max_size) if self.max_size else 0
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+        self.backend.record_stats(stores=1, evictions=evicted)
+
+    @property
+    def counters(self) -> t.Dict[str, int]:
+        """This session's counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+_caches: t.Dict[t.Tuple[str, t.Optional[int]], LockCache] = {}
+
+
+def open_cache(spec: str, max_size: t.Optional[int] = None) -> LockCache:
+    """The session's LockCache for `spec`, shared by all testenvs."""
+    key = (spec, max_size)
+    if key not in _caches:
+        _caches[key] = LockCache(backend_from_spec(spec), max_size=max_size)
+    return _caches[key]
@@ -0,0 +1,474 @@
+"""Command line tools operating on a project's lock files."""
+import argparse
+import json
+import logging
+from pathlib import Path
+import shlex
+import subprocess
+import sys
+import typing as t
+
+from . import bundle, cache, graph, outdated, pipcache, shard, watch
+from .common import DEFAULT_REQUIREMENTS_DIRECTORY
+
+
+def _requirements_directory(args: argparse.Namespace) -> Path:
+    return Path(args.root, args.requirements_directory)
+
+
+def _index_path(args: argparse.Namespace) -> Path:
+    """The graph index given by --index, or the one in the tox work dir."""
+    index = getattr(args, "index", None)
+    if index:
+        return Path(args.root, index)
+    return Path(args.root, args.work_dir, graph.INDEX_PATH)
+
+
+def query(args: argparse.Namespace) -> int:
+    """Report which envs pin a package, at which versions, and why."""
+    index = graph.load_index(
+        requirements_directory=_requirements_directory(args),
+        index_path=_index_path(args),
+    )
+    if args.spread:
+        spread = index.spread()
+        if args.json:
+            print(json.dumps(spread, indent=2))
+            return 0
+        for name, versions in spread.items():
+            print(name)
+            for version, envs in versions.items():
+                print(f"    {version}: {', '.join(envs)}")
+        return 0
+    missing = [package for package in args.packages if not index.pins(package)]
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    package: {
+                        pin.envname: {"version": pin.version, "via": list(pin.via)}
+                        for pin in index.pins(package)
+                    }
+                    for package in args.packages
+                },
+                indent=2,
+            )
+        )
+        return 1 if missing else 0
+    for package in args.packages:
+        pins = index.pins(package)
+        if not pins:
+            print(f"{package}: not pinned in any env")
+            continue
+        for version in index.versions(package):
+            print(f"{pins[0].name}=={version}")
+            for pin in pins:
+                if pin.version == version:
+                    via = f" (via {', '.join(pin.via)})" if pin.via else ""
+                    print(f"    {pin.envname}{via}")
+    return 1 if missing else 0
+
+
+def watch_envs(args: argparse.Namespace) -> int:
+    """Re-lock envs in the background whenever their inputs change."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    watcher = watch.Watcher(
+        root=args.root,
+        envs=[e for e in (args.envs or "").split(",") if e],
+        tox_cmd=shlex.split(args.tox) if args.tox else watch.DEFAULT_TOX_CMD,
+        tox_args=args.tox_args,
+        debounce=args.debounce,
+        interval=args.interval,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def merge_shards(args: argparse.Namespace) -> int:
+    """Combine the lock files compiled by each `--pip-compile-shard`."""
+    problems = shard.merge(
+        shard_directories=args.shard_directories,
+        requirements_directory=_requirements_directory(args),
+    )
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+def outdated_pins(args: argparse.Namespace) -> int:
+    """Report pins with newer releases allowed by each env's deps."""
+    envs = [e for e in (args.envs or "").split(",") if e]
+    locks = outdated.read_locks(_requirements_directory(args), envs)
+    constraints = {}
+    if not args.no_tox:
+        try:
+            configs = watch.read_tox_config(
+                root=args.root,
+                tox_cmd=shlex.split(args.tox) if args.tox else watch.DEFAULT_TOX_CMD,
+                envs=sorted(locks),
+                keys=("deps",),
+            )
+        except RuntimeError as exc:
+            print(f"{exc}, comparing pins to the latest releases", file=sys.stderr)
+            configs = {}
+        constraints = {
+            envname: outdated.deps_specifiers(
+                watch.deps_lines(config.get("deps", "")), args.root
+            )
+            for envname, config in configs.items()
+        }
+    client = outdated.IndexClient(
+        args.index_url or outdated.index_urls(), timeout=args.timeout
+    )
+    try:
+        result = outdated.scan(
+            locks,
+            client,
+            constraints=constraints,
+            pre=args.pre,
+            max_workers=args.workers,
+        )
+    finally:
+        client.close()
+    if args.json:
+        report: t.Dict[str, t.Dict[str, t.Any]] = {}
+        for item in result.outdated:
+            report.setdefault(item.envname, {})[item.name] = {
+                "current": item.current,
+                "allowed": item.allowed,
+                "latest": item.latest,
+            }
+        print(json.dumps(report, indent=2))
+    elif result.outdated:
+        print(outdated.format_report(result.outdated))
+    for name, error in sorted(result.errors.items()):
+        print(f"{name}: {error}", file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def upgrade(args: argparse.Namespace) -> int:
+    """Re-lock only the envs pinning the given packages, upgrading them."""
+    index = graph.load_index(
+        requirements_directory=_requirements_directory(args),
+        index_path=_index_path(args),
+    )
+    selected = [e for e in (args.envs or "").split(",") if e]
+    envs = sorted(
+        {
+            envname
+            for package in args.packages
+            for envname in index.envs_containing(package)
+            if not selected or envname in selected
+        }
+    )
+    if not envs:
+        print(f"{', '.join(args.packages)}: not pinned in any env", file=sys.stderr)
+        return 1
+    print(
+        f"upgrading {', '.join(args.packages)} in {len(envs)} envs: {', '.join(envs)}"
+    )
+    if args.dry_run:
+        return 0
+    tox_args = args.tox_args[1:] if args.tox_args[:1] == ["--"] else args.tox_args
+    cmd = [
+        *(shlex.split(args.tox) if args.tox else watch.DEFAULT_TOX_CMD),
+        "-e",
+        ",".join(envs),
+        "--notest",
+        *(["-p", args.parallel] if len(envs) > 1 else []),
+        *(
+            opt
+            for package in args.packages
+            for opt in ("--pip-compile-upgrade-package", package)
+        ),
+        *tox_args,
+    ]
+    return subprocess.run(cmd, cwd=args.root).returncode
+
+
+def build_bundle(args: argparse.Namespace) -> int:
+    """Package the lock files and their artifacts for offline installs."""
+    try:
+        manifest = bundle.build(
+            requirements_directory=_requirements_directory(args),
+            output=args.output,
+            envs=[e for e in (args.envs or "").split(",") if e],
+            python=args.python,
+            pip_opts=args.pip_args,
+            max_workers=args.workers,
+        )
+    except bundle.BundleError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    artifacts = manifest["artifacts"].values()
+    print(
+        f"{args.output}: {len(manifest['envs'])} envs, {len(artifacts)} artifacts, "
+        f"{sum(a['size'] for a in artifacts) / 1024**2:.1f} MiB"
+    )
+    return 0
+
+
+def prune_cache(args: argparse.Namespace) -> int:
+    """Evict the cache entries no lock file references, down to a budget."""
+    locks = pipcache.lock_files(
+        _requirements_directory(args), Path(args.root, args.work_dir)
+    )
+    if args.cache_dir:
+        cache_dirs = [Path(args.cache_dir)]
+    else:
+        cache_dirs = [d for d in pipcache.cache_dirs() if d.is_dir()]
+    for cache_dir in cache_dirs:
+        result = pipcache.prune(
+            cache_dir, locks, max_size=args.max_size, dry_run=args.dry_run
+        )
+        print(
+            pipcache.format_result(result, cache_dir)
+            + (" (dry run)" if args.dry_run else "")
+        )
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tox-pin-deps", description=__doc__)
+    parser.add_argument(
+        "--root",
+        default=".",
+        help="Directory containing `tox.ini` (default: current directory)",
+    )
+    parser.add_argument(
+        "--requirements-directory",
+        default=DEFAULT_REQUIREMENTS_DIRECTORY,
+        help="Directory of lock files, relative to --root",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser(
+        "query",
+        help="Show the envs, versions and reverse dependencies of packages",
+    )
+    query_parser.add_argument("packages", nargs="*", metavar="PACKAGE")
+    query_parser.add_argument(
+        "--spread",
+        action="store_true",
+        help="List the packages pinned at more than one version across envs",
+    )
+    query_parser.add_argument(
+        "--index",
+        help="Path of the cached graph index, relative to --root "
+        "(default: tox-pin-deps/graph-index.json in --work-dir)",
+    )
+    query_parser.add_argument(
+        "--work-dir",
+        default=".tox",
+        help="tox work dir, relative to --root",
+    )
+    query_parser.add_argument("--json", action="store_true", help="Output JSON")
+    query_parser.set_defaults(func=query)
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Re-lock envs whenever tox.ini, dist sources or -r files change",
+    )
+    watch_parser.add_argument(
+        "-e",
+        dest="envs",
+        help="Comma separated envs to watch (default: the tox envlist)",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=watch.DEFAULT_DEBOUNCE,
+        help="Seconds the inputs must be unchanged before re-locking",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=watch.DEFAULT_INTERVAL,
+        help="Seconds between polls of the watched files",
+    )
+    watch_parser.add_argument(
+        "--tox",
+        help="Command used to run tox (default: `python -m tox`)",
+    )
+    watch_parser.add_argument(
+        "tox_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments passed to `tox --pip-compile`",
+    )
+    watch_parser.set_defaults(func=watch_envs)
+
+    merge_parser = subparsers.add_parser(
+        "merge-shards",
+        help="Copy the locks of every --pip-compile-shard into the requirements "
+        "directory, checking that each env was compiled exactly once",
+    )
+    merge_parser.add_argument(
+        "shard_directories",
+        nargs="+",
+        metavar="DIRECTORY",
+        help="The requirements directory produced by each shard",
+    )
+    merge_parser.set_defaults(func=merge_shards)
+
+    outdated_parser = subparsers.add_parser(
+        "outdated",
+        help="List pins with newer releases allowed by the env's deps, "
+        "without re-locking",
+    )
+    outdated_parser.add_argument(
+        "-e",
+        dest="envs",
+        help="Comma separated envs to scan (default: every lock file)",
+    )
+    outdated_parser.add_argument(
+        "--index-url",
+        action="append",
+        help="Simple index to query, may be repeated "
+        "(default: $PIP_INDEX_URL and $PIP_EXTRA_INDEX_URL, or PyPI)",
+    )
+    outdated_parser.add_argument(
+        "--pre",
+        action="store_true",
+        help="Include pre-releases of packages pinned at a final release",
+    )
+    outdated_parser.add_argument(
+        "--workers",
+        type=int,
+        default=outdated.DEFAULT_WORKERS,
+        help="Number of concurrent index requests",
+    )
+    outdated_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=outdated.DEFAULT_TIMEOUT,
+        help="Seconds to wait for the index",
+    )
+    outdated_parser.add_argument(
+        "--tox",
+        help="Command used to run tox (default: `python -m tox`)",
+    )
+    outdated_parser.add_argument(
+        "--no-tox",
+        action="store_true",
+        help="Don't read deps from the tox config; compare pins to the latest "
+        "releases only",
+    )
+    outdated_parser.add_argument("--json", action="store_true", help="Output JSON")
+    outdated_parser.set_defaults(func=outdated_pins)
+
+    upgrade_parser = subparsers.add_parser(
+        "upgrade",
+        help="Upgrade packages in the envs whose lock pins them, keeping every "
+        "other pin, with `tox --pip-compile-upgrade-package`",
+    )
+    upgrade_parser.add_argument(
+        "-P",
+        "--package",
+        dest="packages",
+        action="append",
+        required=True,
+        metavar="PACKAGE",
+        help="Package to upgrade, may be repeated",
+    )
+    upgrade_parser.add_argument(
+        "-e",
+        dest="envs",
+        help="Comma separated envs to consider (default: every lock file)",
+    )
+    upgrade_parser.add_argument(
+        "-p",
+        "--parallel",
+        default="auto",
+        help="Number of envs re-locked concurrently, passed to `tox -p`",
+    )
+    upgrade_parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="Only list the envs that would be re-locked",
+    )
+    upgrade_parser.add_argument(
+        "--work-dir",
+        default=".tox",
+        help="tox work dir, which keeps the cached graph index, relative to --root",
+    )
+    upgrade_parser.add_argument(
+        "--tox",
+        help="Command used to run tox (default: `python -m tox`)",
+    )
+    upgrade_parser.add_argument(
+        "tox_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments passed to `tox`",
+    )
+    upgrade_parser.set_defaults(func=upgrade)
+
+    bundle_parser = subparsers.add_parser(
+        "bundle",
+        help="Package each env's lock and every pinned artifact into one file, "
+        "for `tox --pip-compile-bundle` on hosts without index access",
+    )
+    bundle_parser.add_argument("output", metavar="BUNDLE", help="File to write")
+    bundle_parser.add_argument(
+        "-e",
+        dest="envs",
+        help="Comma separated envs to bundle (default: every lock file)",
+    )
+    bundle_parser.add_argument(
+        "--python",
+        default=sys.executable,
+        help="Interpreter whose pip downloads the artifacts (default: this one)",
+    )
+    bundle_parser.add_argument(
+        "--workers",
+        type=int,
+        default=bundle.DEFAULT_WORKERS,
+        help="Number of envs downloaded concurrently",
+    )
+    bundle_parser.add_argument(
+        "pip_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments passed to `pip download`, "
+        "e.g. `-- --platform manylinux2014_x86_64 --only-binary :all:`",
+    )
+    bundle_parser.set_defaults(func=build_bundle)
+
+    prune_parser = subparsers.add_parser(
+        "prune-cache",
+        help="Evict the pip and pip-tools cache entries that no lock file "
+        "references, least recently used first, until each cache fits in a size "
+        "budget",
+    )
+    prune_parser.add_argument(
+        "--max-size",
+        type=cache.parse_size,
+        required=True,
+        metavar="SIZE",
+        help="Size budget of the cache, e.g. 2G",
+    )
+    prune_parser.add_argument(
+        "--cache-dir",
+        help="Cache directory to prune (default: pip's and pip-tools' caches, "
+        "$PIP_CACHE_DIR and $PIP_TOOLS_CACHE_DIR)",
+    )
+    prune_parser.add_argument(
+        "--work-dir",
+        default=".tox",
+        help="tox work dir, whose staged lock files are also kept, relative to --root",
+    )
+    prune_parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be evicted",
+    )
+    prune_parser.set_defaults(func=prune_cache)
+    return parser
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    args = parser().parse_args(argv)
+    return int(args.func(args))
@@ -1,6 +1,9 @@
 """Common elements for tox3 and tox4."""
+from argparse import ArgumentTypeError, Namespace
+import os
 from pathlib import Path
 import typing as t
+import uuid
 
 try:
     from tox.config.cli.parser import ToxParser
@@ -9,6 +12,11 @@ except ImportError:  # pragma: no cover
 
 DIST_REQUIREMENTS_SOURCES = ["pyproject.toml", "setup.cfg", "setup.py"]
 DEFAULT_REQUIREMENTS_DIRECTORY = "requirements"
+ENV_BUNDLE = "TOX_PIN_DEPS_BUNDLE"
+ENV_PRUNE_PIP_CACHE = "TOX_PIN_DEPS_PRUNE_PIP_CACHE"
+# shared by tox3 with the tox processes that `tox -p` starts for each env
+ENV_SESSION = "TOX_PIN_DEPS_SESSION"
+ENV_SESSION_ENVS = "TOX_PIN_DEPS_SESSION_ENVS"
 
 
 def requirements_file(
@@ -35,6 +43,89 @@ def other_sources(root: t.Union[str, Path]) -> t.Sequence[Path]:
     ]
 
 
+def session_id() -> str:
+    """An id of this tox session, inherited by the tox processes it starts."""
+    return os.environ.setdefault(ENV_SESSION, uuid.uuid4().hex)
+
+
+def bundle_path(options: Namespace) -> t.Optional[str]:
+    """The lock bundle given by --pip-compile-bundle or TOX_PIN_DEPS_BUNDLE."""
+    return options.pip_compile_bundle or os.environ.get(ENV_BUNDLE) or None
+
+
+def prune_pip_cache_size(options: Namespace) -> t.Optional[str]:
+    """The pip cache budget given by --pip-compile-prune-pip-cache or its variable."""
+    return (
+        options.pip_compile_prune_pip_cache
+        or os.environ.get(ENV_PRUNE_PIP_CACHE)
+        or None
+    )
+
+
+def upgrade_packages(options: Namespace) -> t.Set[str]:
+    """Canonical names given by --pip-compile-upgrade-package."""
+    from .lockfile import canonical_name
+
+    return {
+        canonical_name(name.strip())
+        for value in options.pip_compile_upgrade_package or ()
+        for name in value.split(",")
+        if name.strip()
+    }
+
+
+def slim_platforms(options: Namespace) -> t.List[str]:
+    """Platform tags given by --pip-compile-slim-platform, normalized and sorted."""
+    return sorted(
+        {
+            name.strip().lower().replace("-", "_").replace(".", "_")
+            for value in options.pip_compile_slim_platform or ()
+            for name in value.split(",")
+            if name.strip()
+        }
+    )
+
+
+def pins_upgrade(options: Namespace, lock: t.Union[str, Path]) -> t.List[str]:
+    """Packages given by --pip-compile-upgrade-package that `lock` pins, sorted."""
+    names = upgrade_packages(options)
+    if not names:
+        return []
+    from .lockfile import read_lock
+
+    return sorted(names & {entry.name for entry in read_lock(lock)})
+
+
+def checked(parse: t.Callable[[str], t.Any]) -> t.Callable[[str], str]:
+    """
+    An argparse `type` rejecting values that `parse` fails on.
+
+    The value is kept as given, so that the parser reports a usage error
+    without changing the option's type.
+    """
+
+    def check(value: str) -> str:
+        try:
+            parse(value)
+        except ValueError as exc:
+            raise ArgumentTypeError(str(exc)) from None
+        return value
+
+    return check
+
+
+def _parse_size(value: str) -> t.Any:
+    from .cache import parse_size
+
+    return parse_size(value)
+
+
+def _parse_shard(value: str) -> t.Any:
+    from .shard import parse_shard
+
+    return parse_shard(value)
+
+
 def tox_add_argument(parser: ToxParser) -> None:
     """Add plugin arguments to an ArgumentParser."""
     parser.add_argument(
@@ -61,3 +152,156 @@ def tox_add_argument(parser: ToxParser) -> None:
             "Also specify via environment variable PIP_COMPILE_OPTS."
         ),
     )
+    parser.add_argument(
+        "--pip-compile-prefetch",
+        action="store_true",
+        default=False,
+        help=(
+            "Before running `pip-compile`, concurrently fetch the packages pinned "
+            "in the existing lock file to warm pip's cache"
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-superset",
+        action="store_true",
+        default=False,
+        help=(
+            "Resolve the deps of all envs sharing an interpreter and compile "
+            "options together, and project each env's lock from the result"
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-cache",
+        action="store",
+        default="",
+        help=(
+            "Directory (or backend URL) of a lock cache shared across runs and "
+            "hosts, keyed by each env's inputs. "
+            "Also specify via environment variable TOX_PIN_DEPS_CACHE."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-cache-max-size",
+        action="store",
+        default="",
+        type=checked(_parse_size),
+        help=(
+            "Evict least recently used lock cache entries above this size "
+            "(e.g. 500M). "
+            "Also specify via environment variable TOX_PIN_DEPS_CACHE_MAX_SIZE."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-metrics",
+        action="store",
+        default="",
+        help=(
+            "Write session statistics in Prometheus text format to this path "
+            "(e.g. for node-exporter's textfile collector). "
+            "Also specify via environment variable TOX_PIN_DEPS_METRICS."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-hotspots",
+        action="store_true",
+        default=False,
+        help=(
+            "Report the packages that `pip-compile` spent the most time and "
+            "backtracks on, and save the full report as JSON under "
+            "tox-pin-deps/hotspots in the tox work dir."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-shard",
+        action="store",
+        default="",
+        type=checked(_parse_shard),
+        metavar="K/N",
+        help=(
+            "With --pip-compile, only compile the envs assigned to shard K of N, "
+            "balanced by recorded compile times; other envs use their existing "
+            "lock files. Combine the shards with `tox-pin-deps merge-shards`."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-memory-budget",
+        action="store",
+        default="",
+        type=checked(_parse_size),
+        help=(
+            "Only start `pip-compile` when the peak memory measured for the env "
+            "in earlier runs fits in this budget (e.g. 4G) alongside the compiles "
+            "already running. "
+            "Also specify via environment variable TOX_PIN_DEPS_MEMORY_BUDGET."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-slim",
+        action="store_true",
+        default=False,
+        help=(
+            "After `pip-compile`, drop the hashes of wheels the env's interpreter "
+            "cannot install, unless a --pip-compile-slim-platform can."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-slim-platform",
+        action="append",
+        default=[],
+        metavar="PLATFORM",
+        help=(
+            "With --pip-compile-slim, also keep the hashes of wheels built for "
+            "this platform tag (e.g. win_amd64). May be repeated or comma separated."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-slim-drop-excluded",
+        action="store_true",
+        default=False,
+        help=(
+            "With --pip-compile-slim, also drop the entries whose markers exclude "
+            "the env's interpreter."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-upgrade-package",
+        action="append",
+        default=[],
+        metavar="PACKAGE",
+        help=(
+            "Re-lock only the envs whose lock file pins PACKAGE, upgrading it and "
+            "keeping every other pin. May be repeated or comma separated."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-keep-satisfied",
+        action="store_true",
+        default=False,
+        help=(
+            "With --pip-compile, keep an env's existing lock without resolving "
+            "when its pins still satisfy the deps, dist requirements and markers."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-bundle",
+        action="store",
+        default="",
+        help=(
+            "Install from the lock files and artifacts in this bundle, built by "
+            "`tox-pin-deps bundle`, without using a package index. "
+            "Also specify via environment variable TOX_PIN_DEPS_BUNDLE."
+        ),
+    )
+    parser.add_argument(
+        "--pip-compile-prune-pip-cache",
+        action="store",
+        default="",
+        type=checked(_parse_size),
+        metavar="SIZE",
+        help=(
+            "When tox exits, evict the pip cache entries that no lock file "
+            "references, least recently used first, until the cache fits in SIZE "
+            "(e.g. 2G). "
+            "Also specify via environment variable TOX_PIN_DEPS_PRUNE_PIP_CACHE."
+        ),
+    )
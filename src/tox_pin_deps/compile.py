@@ -1,20 +1,61 @@
 """Generic plugin implementation."""
 import abc
 from argparse import Namespace
+import contextlib
+import logging
 from pathlib import Path
 import os
 import shlex
 import tempfile
+import time
 import typing as t
 
 from .common import (
+    bundle_path,
+    pins_upgrade,
     requirements_file,
+    slim_platforms,
     other_sources,
 )
+from . import (
+    bundle,
+    cache,
+    drift,
+    history,
+    hotspots,
+    localdeps,
+    memory,
+    metrics,
+    preflight,
+    satisfy,
+    shard,
+    slim,
+    superset,
+)
+from .profiling import profiled
+from .inputs import file_digest, interpreter_info, referenced_files
+from .lockfile import (
+    lock_editables,
+    lock_header,
+    lock_options,
+    parse_lock,
+    read_lock,
+    read_sidecar,
+    render_lock,
+    write_sidecar,
+)
+from .plan import PIP_COMPILE_SCRIPT, CompilePlan, digests, extra_opts
+from .prefetch import index_opts, prefetch, prefetch_requirements
 
+logger = logging.getLogger(__name__)
 
 ENV_PIP_COMPILE_OPTS = "PIP_COMPILE_OPTS"
 CUSTOM_COMPILE_COMMAND = "tox -e {envname} --pip-compile"
+# `report["lock"]` outcomes that (re)locked the env this session
+LOCK_WRITTEN = ("compiled", "cache", "current", "satisfied")
+# state of the local project trees scanned by `localdeps`, under the work dir
+LOCAL_TREES_DIR = Path("tox-pin-deps", "trees")
+SHARD_LOCK_DIR = Path("tox-pin-deps")
 
 
 def custom_command(envname: str, pip_compile_opts: t.Optional[str] = None) -> str:
@@ -45,10 +86,17 @@ class PipCompile(abc.ABC):
 
     def __init__(self, venv: t.Any, *args: t.Any, **kwargs: t.Any):
         self.venv = venv
+        self._interpreter_info: t.Optional[t.Dict[str, t.Optional[str]]] = None
+        # what pinning did for this env, see `pip_compile`
+        self.report: t.Dict[str, t.Any] = {"lock": None, "durations": {}}
         self.env_requirements = requirements_file(
             toxinidir=self.toxinidir,
             envname=self.envname,
         )
+        # the lock file installed, if any
+        self._lock_file = self.env_requirements
+        self._plans: t.Dict[t.Tuple[str, ...], CompilePlan] = {}
+        self._upgrade_packages: t.Optional[t.List[str]] = None
         super().__init__(venv, *args, **kwargs)  # type: ignore
 
     @property
@@ -63,6 +111,12 @@ class PipCompile(abc.ABC):
         """The current testenv's name."""
         raise NotImplementedError
 
+    @property
+    @abc.abstractmethod
+    def work_dir(self) -> Path:  # pragma: no cover
+        """The tox work dir (`.tox`)."""
+        raise NotImplementedError
+
     @property
     @abc.abstractmethod
     def toxinidir(self) -> Path:  # pragma: no cover
@@ -93,6 +147,32 @@ class PipCompile(abc.ABC):
         """Extras defined for the local package in [testenv] extras key."""
         raise NotImplementedError
 
+    @property
+    @abc.abstractmethod
+    def env_python(self) -> Path:  # pragma: no cover
+        """Path to the testenv's python interpreter."""
+        raise NotImplementedError
+
+    @property
+    @abc.abstractmethod
+    def env_environment(self) -> t.Dict[str, str]:  # pragma: no cover
+        """Environment variables used when executing commands in the testenv."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def selected_envs(self) -> t.Sequence[str]:  # pragma: no cover
+        """Names of the testenvs selected for this session, except "." envs."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def superset_members(self) -> t.Mapping[str, t.Sequence[str]]:  # pragma: no cover
+        """
+        Deps of each selected testenv which may share a resolution with this one.
+
+        Members share the same interpreter and compile options.
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def execute(
         self,
@@ -110,8 +190,213 @@ class PipCompile(abc.ABC):
 
     @property
     def want_pip_compile(self) -> bool:
-        """True when session used --pip-compile."""
-        return bool(self.options.pip_compile)
+        """
+        True when session used --pip-compile, and this env is in the shard.
+
+        With --pip-compile-upgrade-package, also true for envs whose lock pins
+        one of the packages.
+        """
+        requested = self.options.pip_compile or self.upgrade_packages
+        return bool(requested) and self.in_shard
+
+    @property
+    def upgrade_packages(self) -> t.List[str]:
+        """Packages given by --pip-compile-upgrade-package that this env's lock pins."""
+        if self._upgrade_packages is None:
+            self._upgrade_packages = pins_upgrade(self.options, self.env_requirements)
+        return self._upgrade_packages
+
+    @property
+    def compile_shard(self) -> t.Optional[shard.Shard]:
+        """The shard given by --pip-compile-shard, if any."""
+        return shard.parse_shard(self.options.pip_compile_shard)
+
+    @property
+    def shard_assignment(self) -> t.Dict[str, int]:
+        """The shard of each selected env, balanced by recorded compile times."""
+        current = self.compile_shard
+        if current is None:
+            return {}
+        return shard.assign(
+            [*self.selected_envs(), self.envname],
+            durations=self.history.estimates([history.COMPILE]),
+            count=current.total,
+        )
+
+    @property
+    def in_shard(self) -> bool:
+        """True unless --pip-compile-shard assigns this env to another shard."""
+        current = self.compile_shard
+        if current is None:
+            return True
+        return self.shard_assignment[self.envname] == current.number
+
+    @property
+    def want_prefetch(self) -> bool:
+        """True when session used --pip-compile-prefetch."""
+        return bool(self.options.pip_compile_prefetch)
+
+    @property
+    def want_superset(self) -> bool:
+        """True when session used --pip-compile-superset."""
+        return bool(self.options.pip_compile_superset)
+
+    @property
+    def want_hotspots(self) -> bool:
+        """True when session used --pip-compile-hotspots."""
+        return bool(self.options.pip_compile_hotspots)
+
+    @property
+    def slim_platforms(self) -> t.List[str]:
+        """Platforms given by --pip-compile-slim-platform, with --pip-compile-slim."""
+        return slim_platforms(self.options) if self.want_slim else []
+
+    @property
+    def want_slim_drop_excluded(self) -> bool:
+        """True when session used --pip-compile-slim and --pip-compile-slim-drop-excluded."""
+        return self.want_slim and bool(self.options.pip_compile_slim_drop_excluded)
+
+    @property
+    def want_keep_satisfied(self) -> bool:
+        """True when session used --pip-compile-keep-satisfied."""
+        return bool(self.options.pip_compile_keep_satisfied)
+
+    @property
+    def lock_bundle(self) -> t.Optional[bundle.Bundle]:
+        """The bundle given by --pip-compile-bundle, if it has this env's lock."""
+        path = bundle_path(self.options)
+        if not path:
+            return None
+        opened = bundle.open_bundle(Path(self.toxinidir, path))
+        if self.envname not in opened.envs:
+            return None
+        return opened
+
+    @property
+    def want_slim(self) -> bool:
+        """True when session used --pip-compile-slim."""
+        return bool(self.options.pip_compile_slim)
+
+    @property
+    def lock_cache(self) -> t.Optional[cache.LockCache]:
+        """The shared lock cache from --pip-compile-cache, if configured."""
+        spec = self.options.pip_compile_cache or os.environ.get(cache.ENV_CACHE)
+        if not spec:
+            return None
+        return cache.open_cache(
+            spec,
+            max_size=cache.parse_size(
+                self.options.pip_compile_cache_max_size
+                or os.environ.get(cache.ENV_CACHE_MAX_SIZE)
+            ),
+        )
+
+    @property
+    def memory_ledger(self) -> t.Optional[memory.MemoryLedger]:
+        """The shared ledger of --pip-compile-memory-budget, if configured."""
+        budget = cache.parse_size(
+            self.options.pip_compile_memory_budget
+            or os.environ.get(memory.ENV_MEMORY_BUDGET)
+        )
+        if not budget:
+            return None
+        return memory.open_ledger(self.work_dir, budget)
+
+    @property
+    def history(self) -> history.History:
+        """Recorded compile and install durations of the project's envs."""
+        return history.History(self.work_dir)
+
+    def record_duration(self, phase: str, seconds: float) -> None:
+        """
+        Add a run of `phase` to the env's history.
+
+        A compile much slower than its recent runs is logged, and recorded in
+        `report["regression"]`.
+        """
+        envhistory = self.history
+        previous = envhistory.recent(phase).get(self.envname, [])
+        envhistory.record(self.envname, phase, seconds)
+        median = (
+            history.regression(previous, seconds) if phase == history.COMPILE else None
+        )
+        if median is None:
+            return
+        logger.warning(
+            "%s: pip-compile took %s, %.1fx its median of %s over the last %d runs",
+            self.envname,
+            history.format_seconds(seconds),
+            seconds / median,
+            history.format_seconds(median),
+            len(previous),
+        )
+        metrics.inc("compile_regressions", env=self.envname)
+        self.report["regression"] = {"seconds": seconds, "median": median}
+
+    @property
+    def interpreter_info(self) -> t.Dict[str, t.Optional[str]]:
+        """Version and platform of the testenv's interpreter, pip and pip-tools."""
+        if self._interpreter_info is None:
+            self._interpreter_info = interpreter_info(
+                self.env_python,
+                env=self.env_environment,
+            )
+        return self._interpreter_info
+
+    def compile_plan(self, deps: t.Sequence[str]) -> CompilePlan:
+        """
+        The inputs of compiling `deps` for this env, captured once.
+
+        Source files and the trees of local projects in `deps` are digested,
+        and options read from the tox config, when the plan is first made.
+        """
+        key = tuple(deps)
+        if key not in self._plans:
+            self._plans[key] = CompilePlan(
+                envname=self.envname,
+                deps=key,
+                sources=digests(self.other_sources),
+                included=digests(referenced_files(deps, root=self.toxinidir)),
+                opts=(
+                    *self.user_pip_compile_opts,
+                    *(
+                        opt
+                        for name in self.upgrade_packages
+                        for opt in ("--upgrade-package", name)
+                    ),
+                ),
+                extras=tuple(self.compile_extras),
+                pre=self.env_pip_pre,
+                output_file=str(self.env_requirements),
+                toxinidir=str(self.toxinidir),
+                custom_compile_command=custom_command(
+                    envname=self.envname,
+                    pip_compile_opts=self.options.pip_compile_opts,
+                ),
+                slim=self.want_slim,
+                slim_platforms=tuple(self.slim_platforms),
+                slim_drop_excluded=self.want_slim_drop_excluded,
+                local=tuple(
+                    (
+                        str(dep.path),
+                        localdeps.session_tree_digest(
+                            dep.path, Path(self.work_dir, LOCAL_TREES_DIR)
+                        ),
+                    )
+                    for dep in localdeps.local_deps(deps, root=self.toxinidir)
+                ),
+            )
+        return self._plans[key]
+
+    def input_digest(self, deps: t.Sequence[str]) -> str:
+        """
+        Digest of everything that determines this env's lock file.
+
+        deps, the content of dist sources, included requirement files and local
+        projects, compile options, and the interpreter, pip and pip-tools versions.
+        """
+        interpreter = tuple(sorted(self.interpreter_info.items()))
+        return self.compile_plan(deps)._replace(interpreter=interpreter).digest
 
     @property
     def other_sources(self) -> t.Sequence[Path]:
@@ -134,16 +419,24 @@ class PipCompile(abc.ABC):
         Additional internal options are added here:
         * extras
         """
+        return [*self.user_pip_compile_opts, *extra_opts(self.compile_extras)]
+
+    @property
+    def user_pip_compile_opts(self) -> t.List[str]:
+        """The pip_compile_opts sources, without internal options."""
         sources = [
             self.env_pip_compile_opts_env,
             self.options.pip_compile_opts,
             os.environ.get(ENV_PIP_COMPILE_OPTS),
         ]
-        opts = [opt for source in sources for opt in shlex.split(source or "")]
-        if not self.skipsdist:
-            for extra in self.env_extras:
-                opts.extend(["--extra", extra])
-        return opts
+        return [opt for source in sources for opt in shlex.split(source or "")]
+
+    @property
+    def compile_extras(self) -> t.Sequence[str]:
+        """Extras of the local package to lock; none without a dist."""
+        if self.skipsdist:
+            return []
+        return self.env_extras
 
     @property
     def _has_pinned_deps(self) -> bool:
@@ -155,6 +448,126 @@ class PipCompile(abc.ABC):
         """The deps line for per-environment requirements file."""
         return f"-r{self.env_requirements}"
 
+    @contextlib.contextmanager
+    def timed(self, phase: str) -> t.Iterator[None]:
+        """Record the duration of `phase` in `report`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            durations = self.report["durations"]
+            durations[phase] = durations.get(phase, 0) + time.monotonic() - start
+
+    def prefetch(self) -> None:
+        """
+        Warm pip's cache with the packages pinned in the existing lock file.
+
+        Index pages and artifacts for every pin are fetched by a single
+        `pip download`, so the following `pip-compile` run mostly reads them
+        from the cache.
+        """
+        requirements = prefetch_requirements(read_lock(self.env_requirements))
+        if not requirements:
+            return
+        with tempfile.TemporaryDirectory(
+            prefix=f".tox-pin-deps-{self.envname}-prefetch.",
+        ) as dest:
+            fetched = prefetch(
+                python=self.env_python,
+                requirements=requirements,
+                dest=dest,
+                pip_opts=index_opts(self.pip_compile_opts),
+                env=self.env_environment,
+            )
+        if fetched:
+            logger.info(
+                "%s: prefetched %d locked packages", self.envname, len(requirements)
+            )
+        else:
+            logger.info(
+                "%s: prefetching the locked packages failed, resolving without",
+                self.envname,
+            )
+
+    def check_conflicts(self, deps: t.Sequence[str]) -> None:
+        """
+        Fail fast if `deps` and the dist requirements contradict each other.
+
+        :raises preflight.ConflictError: naming the conflicting requirements,
+            see `preflight.find_conflicts`
+        """
+        conflicts = preflight.preflight(
+            deps,
+            root=self.toxinidir,
+            dist=satisfy.dist_requirements(self.other_sources, self.compile_extras),
+        )
+        if conflicts:
+            metrics.inc("preflight_conflicts", env=self.envname)
+            raise preflight.ConflictError(self.envname, conflicts)
+
+    def lock_satisfies(self, deps: t.Sequence[str]) -> bool:
+        """
+        True if the existing lock still satisfies `deps` and the dist requirements.
+
+        The lock must have been written by this plugin with the same compile
+        options, per its sidecar. Requirements are checked against the pins
+        with the markers of the env's interpreter, see `satisfy.unsatisfied`.
+        """
+        sidecar = read_sidecar(self.env_requirements) or {}
+        if sidecar.get("options_digest") != self.compile_plan(deps).options_digest:
+            logger.info("%s: compile options changed, resolving", self.envname)
+            return False
+        requirements = satisfy.deps_requirements(deps, root=self.toxinidir)
+        dist = satisfy.dist_requirements(self.other_sources, self.compile_extras)
+        if requirements is None or dist is None:
+            logger.info(
+                "%s: deps cannot be checked against pins, resolving", self.envname
+            )
+            return False
+        problems = satisfy.unsatisfied(
+            requirements._replace(requirements=[*requirements.requirements, *dist]),
+            read_lock(self.env_requirements),
+            slim.interpreter_target(self.env_python, env=self.env_environment).markers,
+        )
+        if problems:
+            logger.info(
+                "%s: lock no longer satisfies deps, resolving: %s",
+                self.envname,
+                "; ".join(problems),
+            )
+            return False
+        return True
+
+    def slim(self) -> None:
+        """Prune what this env cannot install from its lock file."""
+        from .outdated import IndexClient, index_urls
+
+        client = IndexClient(
+            index_urls(self.pip_compile_opts, environ=self.env_environment)
+        )
+        try:
+            result = slim.slim_lock(
+                self.env_requirements,
+                target=slim.with_platforms(
+                    slim.interpreter_target(self.env_python, env=self.env_environment),
+                    self.slim_platforms,
+                ),
+                client=client,
+                drop_excluded=self.want_slim_drop_excluded,
+            )
+        finally:
+            client.close()
+        self.report["slim"] = {
+            "hashes_removed": result.hashes_removed,
+            "entries_removed": result.entries_removed,
+        }
+        logger.info(
+            "%s: slimmed lock, removed %d hashes and %d entries",
+            self.envname,
+            result.hashes_removed,
+            result.entries_removed,
+        )
+
     def pip_compile(self, deps: t.Sequence[str]) -> t.Optional[str]:
         """
         Lock `deps` using `pip-compile` under certain circumstances.
@@ -164,51 +577,413 @@ class PipCompile(abc.ABC):
 
         Otherwise, install `pip-tools` and proceed to `pip-compile` the given `deps`
         and any project dist sources (setup.py or pyproject.toml), then return the
-        new lock file for pip to install.
+        new lock file for pip to install. With --pip-compile-prefetch, packages
+        pinned by the existing lock file are fetched concurrently beforehand.
+        With --pip-compile-superset, see `pip_compile_superset`.
+
+        With --pip-compile-cache, a lock previously compiled from identical
+        inputs is restored from the cache instead of running `pip-compile`.
+
+        With --pip-compile-slim, the new lock is pruned by `slim` before it is
+        cached.
+
+        With --pip-compile-bundle and without --pip-compile, an env found in
+        the bundle installs its bundled lock and artifacts without an index.
+
+        With --pip-compile-keep-satisfied, an existing lock that still
+        satisfies the deps is kept without running `pip-compile`, see
+        `lock_satisfies`; only its sidecar is updated.
+
+        With --pip-compile-upgrade-package, envs whose lock pins one of the
+        packages are compiled with `--upgrade-package`, keeping their other
+        pins, and bypassing the lock cache.
+
+        A lock written by this session gets a sidecar of its parsed entries, see
+        `lockfile.write_sidecar`.
 
         If --ignore-pins if given, then the deps list is not modified.
 
+        `report["lock"]` records the outcome: "used" (existing lock file),
+        "bundle", "compiled", "cache", "current" (already locked by a superset resolution
+        this session), "satisfied" (existing lock kept), or None if the env is not
+        pinned. When pinned, the report also has the lock path, digest and package
+        count.
+
         :return: replacement item for the `deps` list
         """
+        metrics.enable(
+            self.options.pip_compile_metrics or os.environ.get(metrics.ENV_METRICS)
+        )
+        with profiled(self.envname, "pip_compile"), self.timed("pip_compile"):
+            pinned_deps = self._pip_compile(deps)
+            written = self.report["lock"] in LOCK_WRITTEN
+            if written and self._has_pinned_deps:
+                plan = self.compile_plan(deps)
+                write_sidecar(
+                    self.env_requirements,
+                    input_digest=plan.digest,
+                    options_digest=plan.options_digest,
+                )
+        if pinned_deps:
+            packages = len(read_lock(self._lock_file))
+            self.report.update(
+                lock_path=str(self._lock_file),
+                lock_digest=file_digest(self._lock_file),
+                packages=packages,
+            )
+            if metrics.enabled():
+                metrics.set_gauge("lock_packages", packages, env=self.envname)
+        current = self.compile_shard
+        if current is not None and self.report["lock"] in LOCK_WRITTEN:
+            shard.record_compiled(
+                self.env_requirements.parent,
+                shard=current,
+                assignment=self.shard_assignment,
+                envname=self.envname,
+                lock_dir=Path(self.work_dir, SHARD_LOCK_DIR),
+            )
+        return pinned_deps
+
+    def repair_drift(self, site_packages: t.Sequence[Path]) -> None:
+        """
+        Reinstall the pins of the installed lock that the env no longer matches.
+
+        A reused env may have had packages changed by hand, or a failed install.
+        Only the drifted pins are installed, with `--no-deps`, using the lock's
+        index options and hashes. `report["drift"]` lists them.
+        """
+        site_packages = [path for path in site_packages if path.is_dir()]
+        if not site_packages:
+            return
+        found = drift.find_drift(
+            read_lock(self._lock_file),
+            drift.installed_distributions(site_packages),
+        )
+        self.report["drift"] = [d.entry.name for d in found]
+        if not found:
+            return
+        logger.warning(
+            "%s: reinstalling packages that differ from %s: %s",
+            self.envname,
+            self._lock_file,
+            ", ".join(
+                f"{d.entry.name} {d.installed or '(missing)'} -> {d.entry.version}"
+                for d in found
+            ),
+        )
+        with tempfile.NamedTemporaryFile(
+            "w",
+            prefix=f".tox-pin-deps-{self.envname}-repair.",
+            suffix=".txt",
+            # relative --find-links in the lock resolve from its directory
+            dir=self._lock_file.parent,
+        ) as tf:
+            tf.write(
+                render_lock(
+                    [d.entry for d in found],
+                    options=lock_options(self._lock_file.read_text()),
+                )
+            )
+            tf.flush()
+            self.execute(
+                cmd=["pip", "install", "--no-deps", "-r", tf.name],
+                run_id="tox-pin-deps-repair",
+            )
+
+    def install_from_bundle(self, lock_bundle: bundle.Bundle) -> str:
+        """Stage this env's lock and artifacts from `lock_bundle` for offline install."""
+        if lock_bundle.lock_digest(self.envname) != file_digest(self.env_requirements):
+            logger.warning(
+                "%s: lock in %s differs from %s, installing the bundled lock",
+                self.envname,
+                lock_bundle.path,
+                self.env_requirements,
+            )
+        staged = lock_bundle.stage(
+            self.envname,
+            Path(self.work_dir, bundle.STAGE_DIR),
+        )
+        self._lock_file = staged
+        return f"-r{staged}"
+
+    def _pip_compile(self, deps: t.Sequence[str]) -> t.Optional[str]:
         if self.ignore_pins:
             return None
         if not self.want_pip_compile:
+            lock_bundle = self.lock_bundle
+            if lock_bundle is not None:
+                self.report["lock"] = "bundle"
+                with self.timed("bundle"):
+                    return self.install_from_bundle(lock_bundle)
             if self._has_pinned_deps:
                 # if we have a lock file, use it
+                self.report["lock"] = "used"
                 return self._pinned_deps
             # otherwise, regular deps processing
             return None
-        self.execute(
-            cmd=["pip", "install", "pip-tools"],
-            run_id="tox-pin-deps",
+        if self.want_superset and superset.is_projected(self.env_requirements):
+            # already locked by a superset resolution during this session
+            metrics.inc("envs_skipped", reason="superset")
+            self.report["lock"] = "current"
+            if self.want_slim:
+                with self.timed("slim"):
+                    self.slim()
+            return self._pinned_deps
+        with self.timed("preflight"):
+            self.check_conflicts(deps)
+        if (
+            self.want_keep_satisfied
+            and not self.want_superset
+            and not self.upgrade_packages
+            and self._has_pinned_deps
+        ):
+            with self.timed("satisfy"):
+                satisfied = self.lock_satisfies(deps)
+            if satisfied:
+                logger.info("%s: lock still satisfies deps", self.envname)
+                metrics.inc("envs_skipped", reason="satisfied")
+                self.report["lock"] = "satisfied"
+                return self._pinned_deps
+        with self.timed("install_pip_tools"):
+            self.execute(
+                cmd=["pip", "install", "pip-tools"],
+                run_id="tox-pin-deps",
+            )
+        # an upgrade depends on the index, not only on the inputs
+        lock_cache = self.lock_cache if not self.upgrade_packages else None
+        if lock_cache is not None:
+            with self.timed("cache_restore"):
+                digest = self.input_digest(deps)
+                restored = lock_cache.restore(digest, self.env_requirements)
+            if restored:
+                logger.info("%s: lock restored from cache (%s)", self.envname, digest)
+                metrics.inc("lock_cache_hits")
+                metrics.inc("envs_skipped", reason="cache")
+                self.report["lock"] = "cache"
+                return self._pinned_deps
+            metrics.inc("lock_cache_misses")
+        if self.want_prefetch and self._has_pinned_deps:
+            with self.timed("prefetch"):
+                self.prefetch()
+        expected = self.history.estimates([history.COMPILE]).get(self.envname)
+        if expected is not None:
+            self.report["expected"] = expected
+            logger.info(
+                "%s: compiling, expected to take %s",
+                self.envname,
+                history.format_seconds(expected),
+            )
+        with self.timed("compile"):
+            pinned_deps = (
+                self.pip_compile_superset(deps) if self.want_superset else None
+            )
+            if not pinned_deps:
+                self._run_pip_compile(self.compile_plan(deps))
+        if self.want_slim:
+            with self.timed("slim"):
+                self.slim()
+        metrics.inc("envs_compiled")
+        self.report["lock"] = "compiled"
+        self.record_duration(history.COMPILE, self.report["durations"]["compile"])
+        if lock_cache is not None:
+            with self.timed("cache_store"):
+                lock_cache.store(digest, self.env_requirements)
+        # replace environment deps with the new lock file
+        return self._pinned_deps
+
+    def _run_pip_compile(self, plan: CompilePlan) -> None:
+        """
+        Execute `pip-compile` for `plan`.
+
+        With --pip-compile-hotspots, `pip-compile` runs under the hotspot
+        instrumentation, and the top offenders are reported afterwards.
+
+        With --pip-compile-memory-budget, wait until the env's expected peak
+        RSS fits in the budget, and record the measured peak afterwards.
+        """
+        ledger = self.memory_ledger
+        with tempfile.TemporaryDirectory(prefix=".tox-pin-deps-run.") as td:
+            events_file = Path(td, "events.jsonl")
+            peak_file = Path(td, "peak-rss.json")
+            preambles = []
+            env = {}
+            if self.want_hotspots:
+                preambles.append(hotspots.HOTSPOT_SCRIPT)
+                env[hotspots.ENV_EVENTS] = str(events_file)
+            if ledger is not None:
+                preambles.append(memory.PEAK_RSS_SCRIPT)
+                env[memory.ENV_PEAK_RSS] = str(peak_file)
+            pip_compile = ["pip-compile"]
+            if preambles:
+                script = "".join([*preambles, PIP_COMPILE_SCRIPT])
+                pip_compile = [str(self.env_python), "-c", script]
+            reservation = None
+            if ledger is not None:
+                with self.timed("memory_wait"):
+                    reservation = ledger.reserve(
+                        plan.envname, ledger.estimate(plan.envname)
+                    )
+            try:
+                self._execute_pip_compile(pip_compile=pip_compile, plan=plan, env=env)
+            finally:
+                if ledger is not None and reservation is not None:
+                    ledger.release(reservation)
+                if self.want_hotspots:
+                    self.report_hotspots(
+                        plan.envname,
+                        hotspots.analyze(hotspots.read_events(events_file)),
+                    )
+                peak = memory.read_peak(peak_file)
+                if ledger is not None and peak:
+                    ledger.record_peak(plan.envname, peak)
+                    self.report["peak_rss"] = peak
+
+    def report_hotspots(
+        self,
+        envname: str,
+        found: t.Sequence[hotspots.Hotspot],
+    ) -> None:
+        """Log the top hotspots of a compile and save them all as JSON."""
+        if not found:
+            return
+        path = hotspots.report_path(self.work_dir, envname)
+        hotspots.save_report(path, envname, found)
+        logger.warning(
+            "%s: pip-compile hotspots (full report: %s)\n%s",
+            envname,
+            path,
+            hotspots.format_report(found),
         )
-        cmd = ["pip-compile"]
-        if self.env_pip_pre:
-            cmd.append("--pre")
-        opts = [str(s) for s in self.other_sources] + [
-            "--output-file",
-            str(self.env_requirements),
-            *self.pip_compile_opts,
-        ]
-        self.env_requirements.parent.mkdir(parents=True, exist_ok=True)
+
+    def _execute_pip_compile(
+        self,
+        pip_compile: t.Sequence[str],
+        plan: CompilePlan,
+        env: t.Optional[t.Dict[str, str]] = None,
+    ) -> None:
+        Path(plan.output_file).parent.mkdir(parents=True, exist_ok=True)
         with tempfile.NamedTemporaryFile(
-            prefix=f".tox-pin-deps-{self.envname}-requirements.",
+            prefix=f".tox-pin-deps-{plan.envname}-requirements.",
             suffix=".in",
-            dir=self.toxinidir,
+            dir=plan.toxinidir,
         ) as tf:
-            if deps:
-                tf.write("\n".join(deps).encode())
+            if plan.deps:
+                tf.write("\n".join(plan.deps).encode())
                 tf.flush()
-                cmd.append(tf.name)
+            start = time.monotonic()
             self.execute(
-                cmd=cmd + opts,
+                cmd=[*pip_compile, *plan.args(tf.name if plan.deps else None)],
                 run_id="tox-pin-deps",
                 env={
-                    "CUSTOM_COMPILE_COMMAND": custom_command(
-                        envname=self.envname,
-                        pip_compile_opts=self.options.pip_compile_opts,
-                    )
+                    **(env or {}),
+                    "CUSTOM_COMPILE_COMMAND": plan.custom_compile_command,
                 },
             )
-            # replace environment deps with the new lock file
-            return self._pinned_deps
+            metrics.observe("compile_seconds", time.monotonic() - start)
+
+    def pip_compile_superset(self, deps: t.Sequence[str]) -> t.Optional[str]:
+        """
+        Lock this env together with every env sharing its interpreter and options.
+
+        The union of all members' deps is resolved once, starting from the pins
+        of the members' current locks, and each member's lock is projected from
+        the result. If the union cannot be resolved (or this env cannot be
+        projected), return None for per-env resolution.
+
+        :return: replacement item for the `deps` list
+        """
+        members = dict(self.superset_members())
+        members[self.envname] = deps
+        current = self.compile_shard
+        if current is not None:
+            # envs of other shards are locked by other nodes
+            assignment = self.shard_assignment
+            members = {
+                name: d
+                for name, d in members.items()
+                if assignment.get(name) == current.number
+            }
+        roots = {name: superset.root_names(d) for name, d in members.items()}
+        if roots[self.envname] is None:
+            return None
+        members = {name: d for name, d in members.items() if roots[name] is not None}
+        if len(members) < 2:
+            return None
+        key = superset.group_key(str(self.toxinidir), *sorted(members))
+        with superset.group_lock(key):
+            if superset.is_projected(self.env_requirements):
+                return self._pinned_deps
+            if superset.is_failed(key):
+                return None
+            group_name = ",".join(sorted(members))
+            with tempfile.TemporaryDirectory(prefix=".tox-pin-deps-superset.") as td:
+                output_file = Path(td, "superset.txt")
+                # start from the members' pins, as pip-compile does from its output
+                seed = superset.merge_locks(
+                    read_lock(requirements_file(toxinidir=self.toxinidir, envname=name))
+                    for name in sorted(members)
+                )
+                if seed:
+                    output_file.write_text(render_lock(seed))
+                try:
+                    self._run_pip_compile(
+                        self.compile_plan(
+                            superset.union_requirements(members.values())
+                        )._replace(
+                            envname=group_name,
+                            output_file=str(output_file),
+                            custom_compile_command=custom_command(
+                                envname=group_name,
+                                pip_compile_opts=self.options.pip_compile_opts,
+                            ),
+                        )
+                    )
+                except Exception:
+                    superset.mark_failed(key)
+                    conflicts = superset.conflicting_envs(members)
+                    logger.warning(
+                        "superset resolution of %s failed, resolving per-env. "
+                        "Conflicting envs: %s",
+                        group_name,
+                        "; ".join(
+                            f"{name}: {', '.join(envs)}"
+                            for name, envs in conflicts.items()
+                        )
+                        or "unknown",
+                    )
+                    return None
+                text = output_file.read_text()
+            entries = parse_lock(text)
+            header = lock_header(text)
+            options = lock_options(text)
+            # members' own deps have no editables (see `superset.root_names`), so
+            # any in the union come with the dist, which every member installs
+            editables = lock_editables(text)
+            group_cmd = custom_command(
+                envname=group_name,
+                pip_compile_opts=self.options.pip_compile_opts,
+            )
+            for name in members:
+                member_cmd = custom_command(
+                    envname=name,
+                    pip_compile_opts=self.options.pip_compile_opts,
+                )
+                member_requirements = requirements_file(
+                    toxinidir=self.toxinidir,
+                    envname=name,
+                )
+                member_requirements.parent.mkdir(parents=True, exist_ok=True)
+                member_requirements.write_text(
+                    render_lock(
+                        superset.project(
+                            entries,
+                            roots=roots[name] or (),
+                            include_dist=bool(self.other_sources),
+                        ),
+                        header=[line.replace(group_cmd, member_cmd) for line in header],
+                        options=options,
+                        editables=editables,
+                    )
+                )
+                superset.mark_projected(member_requirements)
+        return self._pinned_deps
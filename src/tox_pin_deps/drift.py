@@ -0,0 +1,76 @@
+"""
+Compare the distributions installed in an env with its lock file.
+
+Installed distributions are read from the names of the `.dist-info` and
+`.egg-info` directories in site-packages, which record the project name and
+version, so checking an env costs a directory listing rather than a
+`pip freeze` subprocess.
+"""
+from pathlib import Path
+import typing as t
+
+from .lockfile import LockEntry, canonical_name
+
+METADATA_SUFFIXES = (".dist-info", ".egg-info")
+
+
+class Drift(t.NamedTuple):
+    """A locked package that is missing or installed at another version."""
+
+    entry: LockEntry
+    # None if the package is not installed
+    installed: t.Optional[str]
+
+
+def installed_distributions(
+    site_packages: t.Iterable[t.Union[str, Path]],
+) -> t.Dict[str, str]:
+    """Map the canonical name of each distribution in `site_packages` to its version."""
+    installed = {}
+    for directory in site_packages:
+        try:
+            names = [path.name for path in Path(directory).iterdir()]
+        except OSError:
+            continue
+        for name in names:
+            for suffix in METADATA_SUFFIXES:
+                if name.endswith(suffix):
+                    # {name}-{version}[-pyX.Y].{suffix}, name escaped with "_"
+                    parts = name[: -len(suffix)].split("-")
+                    if len(parts) >= 2:
+                        installed[canonical_name(parts[0])] = parts[1]
+    return installed
+
+
+def _same_version(locked: str, installed: str) -> bool:
+    if locked == installed:
+        return True
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return Version(locked) == Version(installed)
+    except InvalidVersion:
+        return False
+
+
+def find_drift(
+    entries: t.Iterable[LockEntry],
+    installed: t.Mapping[str, str],
+) -> t.List[Drift]:
+    """
+    The pinned `entries` that `installed` does not match.
+
+    Entries with markers are only checked when installed, since they may not
+    apply to the env; unpinned entries (`name @ url`) are not checked.
+    """
+    drift = []
+    for entry in entries:
+        if entry.version is None:
+            continue
+        version = installed.get(entry.name)
+        if version is None:
+            if not entry.markers:
+                drift.append(Drift(entry, None))
+        elif not _same_version(entry.version, version):
+            drift.append(Drift(entry, version))
+    return drift
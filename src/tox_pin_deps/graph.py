@@ -0,0 +1,145 @@
+"""An on-disk index of the dependency graph recorded in all lock files."""
+from collections import defaultdict
+import json
+from pathlib import Path
+import typing as t
+
+from .lockfile import canonical_name, read_lock
+
+INDEX_FORMAT_VERSION = 1
+INDEX_PATH = Path("tox-pin-deps", "graph-index.json")
+
+
+class Pin(t.NamedTuple):
+    """A package pinned in one env's lock file."""
+
+    envname: str
+    name: str
+    version: t.Optional[str]
+    via: t.Tuple[str, ...]
+
+
+class GraphIndex:
+    """
+    Pins and `# via` edges of every lock file in a requirements directory.
+
+    Lock files are only re-parsed when their mtime or size changed since the
+    index was last saved.
+    """
+
+    def __init__(self, locks: t.Optional[t.Dict[str, t.Dict[str, t.Any]]] = None):
+        self._locks: t.Dict[str, t.Dict[str, t.Any]] = locks or {}
+        self._by_name: t.Optional[t.Dict[str, t.List[Pin]]] = None
+
+    @classmethod
+    def load(cls, path: t.Union[str, Path]) -> "GraphIndex":
+        """Load a saved index, returning an empty index if missing or outdated."""
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return cls()
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return cls()
+        return cls(locks=data["locks"])
+
+    def save(self, path: t.Union[str, Path]) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {"version": INDEX_FORMAT_VERSION, "locks": self._locks},
+                separators=(",", ":"),
+            )
+        )
+
+    def update(self, requirements_directory: t.Union[str, Path]) -> bool:
+        """
+        Bring the index up to date with the lock files on disk.
+
+        :return: True if any lock file was added, changed, or removed
+        """
+        seen = set()
+        changed = False
+        for lock in sorted(Path(requirements_directory).glob("*.txt")):
+            envname = lock.stem
+            seen.add(envname)
+            st = lock.stat()
+            stamp = [st.st_mtime_ns, st.st_size]
+            cached = self._locks.get(envname)
+            if cached is not None and cached["stamp"] == stamp:
+                continue
+            self._locks[envname] = {
+                "stamp": stamp,
+                "pins": [
+                    [entry.name, entry.version, list(entry.via)]
+                    for entry in read_lock(lock)
+                ],
+            }
+            changed = True
+        for envname in set(self._locks) - seen:
+            del self._locks[envname]
+            changed = True
+        if changed:
+            self._by_name = None
+        return changed
+
+    @property
+    def envnames(self) -> t.List[str]:
+        return sorted(self._locks)
+
+    def env_pins(self, envname: str) -> t.List[Pin]:
+        """Every package pinned in `envname`'s lock file."""
+        lock = self._locks.get(envname, {"pins": []})
+        return [
+            Pin(envname, name, version, tuple(via))
+            for name, version, via in lock["pins"]
+        ]
+
+    @property
+    def by_name(self) -> t.Dict[str, t.List[Pin]]:
+        """Pins across all envs, keyed by canonical package name."""
+        if self._by_name is None:
+            by_name: t.Dict[str, t.List[Pin]] = defaultdict(list)
+            for envname in self.envnames:
+                for pin in self.env_pins(envname):
+                    by_name[pin.name].append(pin)
+            self._by_name = dict(by_name)
+        return self._by_name
+
+    def pins(self, name: str) -> t.List[Pin]:
+        """The pins of package `name` in every env that contains it."""
+        return self.by_name.get(canonical_name(name), [])
+
+    def envs_containing(self, name: str) -> t.List[str]:
+        """Names of the envs whose lock file contains package `name`."""
+        return [pin.envname for pin in self.pins(name)]
+
+    def versions(self, name: str) -> t.Dict[t.Optional[str], t.List[str]]:
+        """Map each pinned version of package `name` to the envs using it."""
+        versions: t.Dict[t.Optional[str], t.List[str]] = defaultdict(list)
+        for pin in self.pins(name):
+            versions[pin.version].append(pin.envname)
+        return dict(versions)
+
+    def reverse_dependencies(self, name: str) -> t.Dict[str, t.Tuple[str, ...]]:
+        """Map each env containing package `name` to the reasons it is required."""
+        return {pin.envname: pin.via for pin in self.pins(name)}
+
+    def spread(self) -> t.Dict[str, t.Dict[t.Optional[str], t.List[str]]]:
+        """The packages pinned at more than one version across envs."""
+        return {
+            name: self.versions(name)
+            for name in sorted(self.by_name)
+            if len({pin.version for pin in self.by_name[name]}) > 1
+        }
+
+
+def load_index(
+    requirements_directory: t.Union[str, Path],
+    index_path: t.Union[str, Path],
+) -> GraphIndex:
+    """Load the index at `index_path`, refreshing and saving it if locks changed."""
+    index = GraphIndex.load(index_path)
+    if index.update(requirements_directory):
+        index.save(index_path)
+    return index
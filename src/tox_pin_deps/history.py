@@ -0,0 +1,187 @@
+"""
+Remember how long each env takes to compile and install.
+
+Durations are kept in a small sqlite database under the tox work dir, shared by
+every tox process of the project. Parallel runs start the envs expected to
+take longest first, so a slow env does not stretch the run by starting last,
+and a compile much slower than the env's recent runs is flagged.
+"""
+from argparse import Namespace
+import contextlib
+import logging
+from pathlib import Path
+import sqlite3
+import statistics
+import time
+import typing as t
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = Path("tox-pin-deps", "history.sqlite")
+COMPILE = "compile"
+INSTALL = "install"
+# recent runs of an env that estimates are based on
+WINDOW = 5
+# a compile regressed if it took this many times its median, and at least
+# REGRESSION_MIN_SECONDS longer
+REGRESSION_FACTOR = 2.0
+REGRESSION_MIN_SECONDS = 10.0
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+    env TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_phase ON durations (phase, env, recorded);
+"""
+
+
+class History:
+    """The recorded durations of the project with tox work dir `work_dir`."""
+
+    def __init__(self, work_dir: t.Union[str, Path]):
+        self.path = Path(work_dir, HISTORY_FILE)
+
+    @contextlib.contextmanager
+    def _connect(self) -> t.Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # a connection per call: tox4 runs envs in threads, tox3 in processes
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, envname: str, phase: str, seconds: float) -> None:
+        """Add a run of `phase` to the history, keeping the WINDOW most recent."""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO durations VALUES (?, ?, ?, ?)",
+                    (envname, phase, seconds, time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM durations WHERE env = ? AND phase = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM durations WHERE env = ? AND phase = ? "
+                    "ORDER BY recorded DESC LIMIT ?)",
+                    (envname, phase, envname, phase, WINDOW),
+                )
+        except sqlite3.Error as exc:
+            logger.warning(
+                "could not record %s duration of %s: %s", phase, envname, exc
+            )
+
+    def recent(self, phase: str) -> t.Dict[str, t.List[float]]:
+        """The recorded seconds of `phase` for each env, most recent first."""
+        if not self.path.exists():
+            return {}
+        durations: t.Dict[str, t.List[float]] = {}
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT env, seconds FROM durations WHERE phase = ? "
+                    "ORDER BY recorded DESC",
+                    (phase,),
+                ).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning("could not read %s: %s", self.path, exc)
+            return {}
+        for envname, seconds in rows:
+            durations.setdefault(envname, []).append(seconds)
+        return durations
+
+    def estimates(self, phases: t.Iterable[str]) -> t.Dict[str, float]:
+        """Expected seconds of each env with a history, over `phases`."""
+        estimates: t.Dict[str, float] = {}
+        for phase in phases:
+            for envname, durations in self.recent(phase).items():
+                estimates[envname] = estimates.get(envname, 0.0) + statistics.median(
+                    durations
+                )
+        return estimates
+
+
+def session_phases(options: Namespace) -> t.List[str]:
+    """The phases an env of this session is expected to spend time in."""
+    if options.pip_compile:
+        return [COMPILE, INSTALL]
+    return [INSTALL]
+
+
+def regression(previous: t.Sequence[float], seconds: float) -> t.Optional[float]:
+    """The median of `previous` if `seconds` regressed sharply from it, else None."""
+    if not previous:
+        return None
+    median = statistics.median(previous)
+    if (
+        seconds >= median * REGRESSION_FACTOR
+        and seconds - median >= REGRESSION_MIN_SECONDS
+    ):
+        return median
+    return None
+
+
+def longest_first(
+    envnames: t.Sequence[str],
+    estimates: t.Mapping[str, float],
+) -> t.List[str]:
+    """
+    `envnames` ordered by their estimate, longest first.
+
+    Envs without an estimate are assumed to take the mean of the others, and
+    envs with equal estimates keep their order.
+    """
+    known = [estimates[e] for e in envnames if e in estimates]
+    if not known:
+        return list(envnames)
+    default = sum(known) / len(known)
+    return sorted(envnames, key=lambda e: -estimates.get(e, default))
+
+
+def makespan(durations: t.Iterable[float], workers: int) -> float:
+    """Seconds to run `durations` in order on `workers`, each taking the next free."""
+    loads = [0.0] * max(1, workers)
+    for seconds in durations:
+        loads[loads.index(min(loads))] += seconds
+    return max(loads)
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def schedule(
+    work_dir: t.Union[str, Path],
+    envnames: t.Sequence[str],
+    phases: t.Sequence[str],
+    workers: t.Optional[int],
+) -> t.List[str]:
+    """
+    Order `envnames` for a parallel run by their history, and log an ETA.
+
+    :param workers: the parallel limit, None for no limit
+    """
+    history = History(work_dir)
+    if not history.path.exists():
+        return list(envnames)
+    estimates = history.estimates(phases)
+    ordered = longest_first(envnames, estimates)
+    known = [e for e in ordered if e in estimates]
+    if known:
+        default = sum(estimates[e] for e in known) / len(known)
+        eta = makespan(
+            [estimates.get(e, default) for e in ordered],
+            workers or len(ordered),
+        )
+        logger.warning(
+            "tox-pin-deps: starting %d envs longest first, expected to take %s "
+            "(%d with history)",
+            len(ordered),
+            format_seconds(eta),
+            len(known),
+        )
+    return ordered
@@ -0,0 +1,153 @@
+"""
+Attribute `pip-compile` time to the packages being resolved.
+
+With --pip-compile-hotspots, HOTSPOT_SCRIPT runs before `pip-compile` in the
+testenv's interpreter. The script hooks pip's resolver reporter and logging to
+record a timestamped event in the file named by ENV_EVENTS whenever a package
+is collected, pinned, or a candidate is rejected (a backtrack).
+"""
+from collections import defaultdict
+import json
+from pathlib import Path
+import typing as t
+
+from .lockfile import canonical_name
+
+REPORT_DIR = Path("tox-pin-deps", "hotspots")
+DEFAULT_TOP = 10
+ENV_EVENTS = "TOX_PIN_DEPS_HOTSPOT_EVENTS"
+HOTSPOT_SCRIPT = """
+import atexit, json, logging, os, re, time
+events = open(os.environ["%s"], "w", buffering=1)
+def record(kind, name, version=None):
+    events.write(json.dumps(
+        {"t": time.monotonic(), "kind": kind, "name": name, "version": version}
+    ) + "\\n")
+def hook(cls, method, kind):
+    orig = getattr(cls, method, None)
+    def wrapper(self, *args, **kwargs):
+        candidate = args[-1] if args else kwargs.get("candidate")
+        version = getattr(candidate, "version", None)
+        record(kind, str(getattr(candidate, "name", candidate)),
+               None if version is None else str(version))
+        if orig is not None:
+            return orig(self, *args, **kwargs)
+    setattr(cls, method, wrapper)
+try:
+    from pip._internal.resolution.resolvelib.reporter import PipReporter
+except ImportError:
+    pass
+else:
+    hook(PipReporter, "pinning", "pin")
+    hook(PipReporter, "rejecting_candidate", "reject")
+    hook(PipReporter, "backtracking", "reject")
+class Collecting(logging.Handler):
+    def emit(self, record_):
+        match = re.match(r"Collecting ([A-Za-z0-9._-]+)", record_.getMessage())
+        if match:
+            record("collect", match.group(1))
+pip_logger = logging.getLogger("pip._internal.operations.prepare")
+pip_logger.addHandler(Collecting(logging.INFO))
+if pip_logger.getEffectiveLevel() > logging.INFO:
+    pip_logger.setLevel(logging.INFO)
+atexit.register(record, "end", None)
+""" % (
+    ENV_EVENTS,
+)
+
+
+class Hotspot(t.NamedTuple):
+    """Resolver time and effort spent on one package."""
+
+    name: str
+    seconds: float
+    versions: t.Tuple[str, ...]
+    backtracks: int
+
+
+def read_events(path: t.Union[str, Path]) -> t.List[t.Dict[str, t.Any]]:
+    """Events recorded by HOTSPOT_SCRIPT, skipping any partially written line."""
+    events = []
+    try:
+        lines = Path(path).read_text().splitlines()
+    except OSError:
+        return []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events
+
+
+def analyze(events: t.Iterable[t.Mapping[str, t.Any]]) -> t.List[Hotspot]:
+    """
+    Per package hotspots, most time consuming first.
+
+    The time between two events is attributed to the package of the first: it
+    is the time spent fetching, building or evaluating that package before the
+    resolver moved on.
+    """
+    ordered = sorted(events, key=lambda e: float(e["t"]))
+    seconds: t.Dict[str, float] = defaultdict(float)
+    versions: t.Dict[str, t.Dict[str, None]] = defaultdict(dict)
+    backtracks: t.Dict[str, int] = defaultdict(int)
+    for ix, event in enumerate(ordered):
+        if event["name"] is None:
+            continue
+        name = canonical_name(event["name"])
+        end = ordered[ix + 1]["t"] if ix + 1 < len(ordered) else event["t"]
+        seconds[name] += end - event["t"]
+        if event.get("version"):
+            versions[name][event["version"]] = None
+        if event["kind"] == "reject":
+            backtracks[name] += 1
+    return sorted(
+        (
+            Hotspot(
+                name=name,
+                seconds=seconds[name],
+                versions=tuple(versions[name]),
+                backtracks=backtracks[name],
+            )
+            for name in seconds
+        ),
+        key=lambda h: (-h.seconds, -h.backtracks, h.name),
+    )
+
+
+def format_report(hotspots: t.Sequence[Hotspot], top: int = DEFAULT_TOP) -> str:
+    """A table of the `top` hotspots."""
+    lines = [f"{'package':<30} {'seconds':>9} {'versions':>8} {'backtracks':>10}"]
+    for hotspot in hotspots[:top]:
+        lines.append(
+            f"{hotspot.name:<30} {hotspot.seconds:>9.2f} "
+            f"{len(hotspot.versions):>8} {hotspot.backtracks:>10}"
+        )
+    return "\n".join(lines)
+
+
+def save_report(
+    path: t.Union[str, Path],
+    envname: str,
+    hotspots: t.Sequence[Hotspot],
+) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {
+                "env": envname,
+                "seconds": sum(h.seconds for h in hotspots),
+                "backtracks": sum(h.backtracks for h in hotspots),
+                "packages": [h._asdict() for h in hotspots],
+            },
+            indent=2,
+        )
+    )
+
+
+def report_path(work_dir: t.Union[str, Path], envname: str) -> Path:
+    """Where the JSON report for `envname` is saved in the tox work dir."""
+    safe_name = "".join(c if c.isalnum() or c in "-_.," else "_" for c in envname)
+    return Path(work_dir, REPORT_DIR, f"{safe_name}.json")
@@ -0,0 +1,125 @@
+"""Identify and digest the inputs that determine a testenv's lock file."""
+import hashlib
+import json
+from pathlib import Path
+import shlex
+import subprocess
+import typing as t
+
+REQUIREMENT_FILE_OPTS = ("-r", "--requirement", "-c", "--constraint")
+INTERPRETER_INFO_SCRIPT = """
+import json, platform, sys
+try:
+    from importlib.metadata import version
+except ImportError:
+    from pkg_resources import get_distribution
+    def version(name):
+        return get_distribution(name).version
+info = {
+    "implementation": sys.implementation.name,
+    "python": platform.python_version(),
+    "platform": sys.platform,
+    "machine": platform.machine(),
+}
+for dist in ("pip", "pip-tools"):
+    try:
+        info[dist] = version(dist)
+    except Exception:
+        info[dist] = None
+print(json.dumps(info))
+"""
+
+
+def file_digest(path: t.Union[str, Path]) -> t.Optional[str]:
+    """sha256 of the file at `path`, or None if it does not exist."""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _requirement_file_refs(line: str) -> t.List[str]:
+    try:
+        parts = shlex.split(line, comments=True)
+    except ValueError:
+        return []
+    refs = []
+    for ix, part in enumerate(parts):
+        for opt in REQUIREMENT_FILE_OPTS:
+            if part == opt:
+                if ix + 1 < len(parts):
+                    refs.append(parts[ix + 1])
+            elif part.startswith(f"{opt}="):
+                refs.append(part.partition("=")[2])
+            elif len(opt) == 2 and part.startswith(opt):
+                refs.append(part[2:])
+    return refs
+
+
+def referenced_files(
+    deps: t.Iterable[str],
+    root: t.Union[str, Path],
+) -> t.List[Path]:
+    """
+    Requirement and constraint files included by `deps`, recursively.
+
+    Relative paths in `deps` are relative to `root`; relative paths inside an
+    included file are relative to that file, as pip treats them.
+    """
+    found: t.Dict[Path, None] = {}
+    pending = [(line, Path(root)) for line in deps]
+    while pending:
+        line, base = pending.pop(0)
+        for ref in _requirement_file_refs(line):
+            path = Path(base, ref)
+            if path in found:
+                continue
+            found[path] = None
+            try:
+                lines = path.read_text().splitlines()
+            except OSError:
+                continue
+            pending.extend((included, path.parent) for included in lines)
+    return list(found)
+
+
+def inputs_digest(
+    deps: t.Iterable[str],
+    sources: t.Iterable[t.Union[str, Path]] = (),
+    options: t.Iterable[str] = (),
+    source_digests: t.Iterable[t.Optional[str]] = (),
+) -> str:
+    """
+    A digest over everything that determines a lock file's content.
+
+    :param deps: the env's deps lines
+    :param sources: files whose content is an input (dist sources, included
+        requirement files)
+    :param options: anything else that changes the result: compile options,
+        interpreter and resolver versions, etc
+    :param source_digests: `file_digest` of sources already read, digested
+        after `sources`
+    """
+    h = hashlib.sha256()
+    for dep in deps:
+        h.update(b"dep\0" + dep.strip().encode() + b"\0")
+    for digest in [*(file_digest(source) for source in sources), *source_digests]:
+        h.update(b"src\0" + str(digest).encode() + b"\0")
+    for option in options:
+        h.update(b"opt\0" + str(option).encode() + b"\0")
+    return h.hexdigest()
+
+
+def interpreter_info(
+    python: t.Union[str, Path],
+    env: t.Optional[t.Mapping[str, str]] = None,
+) -> t.Dict[str, t.Optional[str]]:
+    """Version and platform of `python`, and its installed pip and pip-tools."""
+    result = subprocess.run(
+        [str(python), "-c", INTERPRETER_INFO_SCRIPT],
+        env=dict(env) if env is not None else None,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    return t.cast(t.Dict[str, t.Optional[str]], json.loads(result.stdout))
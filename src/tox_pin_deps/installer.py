@@ -0,0 +1,128 @@
+"""Tox 3 implementation of PipCompile, loaded when a testenv uses pins."""
+from argparse import Namespace
+import os
+from pathlib import Path
+import typing as t
+
+from tox.action import Action  # type: ignore
+from tox.venv import VirtualEnv  # type: ignore
+
+from .common import ENV_SESSION_ENVS
+from .compile import PipCompile
+
+
+class ShimBase:
+    def __init__(self, *args: t.Any, **kwargs: t.Any):
+        """allow the constructor to ignore arbitrary args"""
+
+
+class PipCompileTox3(PipCompile, ShimBase):
+    """Tox 3-specific implementation of PipCompile."""
+
+    def __init__(self, venv: VirtualEnv, action: Action):
+        self.action = action
+        super().__init__(venv)
+
+    @property
+    def toxinidir(self) -> Path:
+        return Path(self.venv.envconfig.config.toxinidir)
+
+    @property
+    def work_dir(self) -> Path:
+        return Path(self.venv.envconfig.config.toxworkdir)
+
+    @property
+    def skipsdist(self) -> bool:
+        return bool(self.venv.envconfig.skip_install) or bool(
+            self.venv.envconfig.config.skipsdist
+        )
+
+    @property
+    def envname(self) -> str:
+        return str(self.venv.envconfig.envname)
+
+    @property
+    def options(self) -> Namespace:
+        return t.cast(Namespace, self.venv.envconfig.config.option)
+
+    @property
+    def env_pip_compile_opts_env(self) -> t.Optional[str]:
+        if self.venv.envconfig.pip_compile_opts:
+            return str(self.venv.envconfig.pip_compile_opts)
+        return None
+
+    @property
+    def env_pip_pre(self) -> bool:
+        """[testenv] pip_pre value."""
+        return bool(self.venv.envconfig.pip_pre)
+
+    @property
+    def env_extras(self) -> t.Sequence[str]:  # pragma: no cover
+        """[testenv] extras value."""
+        return [str(extra) for extra in (self.venv.envconfig.extras or [])]
+
+    @property
+    def env_python(self) -> Path:
+        return Path(self.venv.envconfig.envpython)
+
+    @property
+    def env_environment(self) -> t.Dict[str, str]:
+        return t.cast(t.Dict[str, str], self.venv._get_os_environ())
+
+    @property
+    def want_superset(self) -> bool:
+        """
+        True when session used --pip-compile-superset, outside of `tox -p`.
+
+        Parallel envs run in tox processes of their own, which cannot share a
+        resolution, so each env is resolved on its own.
+        """
+        return super().want_superset and not os.environ.get("TOX_PARALLEL_ENV")
+
+    def selected_envs(self) -> t.Sequence[str]:
+        config = self.venv.envconfig.config
+        envlist = config.envlist
+        if os.environ.get("TOX_PARALLEL_ENV"):
+            # `tox -p` selects only this env in its tox process, the parent's
+            # selection is passed down
+            session_envs = os.environ.get(ENV_SESSION_ENVS)
+            envlist = session_envs.split(",") if session_envs else envlist
+        return [str(envname) for envname in envlist if not envname.startswith(".")]
+
+    def superset_members(self) -> t.Mapping[str, t.Sequence[str]]:
+        config = self.venv.envconfig.config
+        key = _superset_key(self.venv.envconfig)
+        return {
+            str(envconfig.envname): [str(dep.name) for dep in envconfig.deps or []]
+            for envconfig in (
+                config.envconfigs[envname]
+                for envname in config.envlist
+                if not envname.startswith(".")
+            )
+            if _superset_key(envconfig) == key
+        }
+
+    def execute(
+        self,
+        cmd: t.Sequence[str],
+        run_id: str,
+        env: t.Optional[t.Dict[str, str]] = None,
+    ) -> None:
+        self.action.setactivity(run_id, str(cmd))
+        self.venv._pcall(
+            cmd,
+            cwd=self.venv.path,
+            action=self.action,
+            env=env,
+        )
+
+
+def _superset_key(envconfig: t.Any) -> t.Tuple[t.Any, ...]:
+    """Testenv settings which must match to share a superset resolution."""
+    return (
+        str(envconfig.basepython),
+        str(envconfig.pip_compile_opts or ""),
+        bool(envconfig.pip_pre),
+        tuple(str(extra) for extra in envconfig.extras or []),
+        bool(envconfig.skip_install) or bool(envconfig.config.skipsdist),
+    )
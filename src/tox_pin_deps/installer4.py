@@ -0,0 +1,190 @@
+"""Tox 4 installer, loaded when a testenv uses or compiles a lock file."""
+from argparse import Namespace
+from pathlib import Path
+import time
+import typing as t
+
+from tox.config.cli.parser import DEFAULT_VERBOSITY
+from tox.config.sets import ConfigSet
+from tox.execute.request import StdinSource
+from tox.tox_env.errors import Fail
+from tox.tox_env.python.api import Python
+from tox.tox_env.python.pip.pip_install import Pip
+from tox.tox_env.python.pip.req_file import PythonDeps
+
+from . import bundle, history, metrics, preflight
+from .compile import PipCompile
+from .plugin4 import session_env_confs
+from .profiling import profiled
+
+
+def _superset_key(conf: ConfigSet, core: ConfigSet) -> t.Tuple[t.Any, ...]:
+    """Testenv settings which must match to share a superset resolution."""
+    return (
+        tuple(str(base_python) for base_python in conf["base_python"]),
+        str(conf["pip_compile_opts"] or ""),
+        bool(conf["pip_pre"]),
+        tuple(str(extra) for extra in conf["extras"]),
+        bool(core["skipsdist"] or conf["skip_install"]),
+    )
+
+
+class PipCompileInstaller(PipCompile, Pip):
+    """tox4 Installer that uses `pip-compile` or env-specific lock files."""
+
+    def __init__(self, tox_env: Python, with_list_deps: bool = True):
+        self._installed_from_lock_file = False
+        # set when tox runs the installer, rather than reusing the env as is
+        self._installer_ran = False
+        super().__init__(tox_env, with_list_deps)
+
+    @property
+    def toxinidir(self) -> Path:
+        return Path(self.venv.core["toxinidir"])
+
+    @property
+    def work_dir(self) -> Path:
+        return Path(self.venv.core["work_dir"])
+
+    @property
+    def skipsdist(self) -> bool:
+        return bool(
+            self.venv.pkg_type == "skip"
+            or self.venv.core["skipsdist"]
+            or self.venv.conf["skip_install"]
+        )
+
+    @property
+    def envname(self) -> str:
+        return str(self.venv.name)
+
+    @property
+    def options(self) -> Namespace:
+        return t.cast(Namespace, self.venv.options)
+
+    @property
+    def env_pip_compile_opts_env(self) -> t.Optional[str]:
+        pip_compile_opts = self.venv.conf["pip_compile_opts"]
+        if pip_compile_opts:
+            return str(pip_compile_opts)
+        return None
+
+    @property
+    def env_pip_pre(self) -> bool:
+        """[testenv] pip_pre value."""
+        return bool(self.venv.conf["pip_pre"])
+
+    @property
+    def env_extras(self) -> t.Sequence[str]:  # pragma: no cover
+        """[testenv] extras value."""
+        extras = self.venv.conf["extras"] if not self.skipsdist else []
+        return [str(extra) for extra in extras]
+
+    @property
+    def env_python(self) -> Path:
+        return Path(self.venv.env_python())
+
+    @property
+    def env_environment(self) -> t.Dict[str, str]:
+        return dict(self.venv.environment_variables)
+
+    def selected_envs(self) -> t.Sequence[str]:
+        return sorted(session_env_confs())
+
+    def superset_members(self) -> t.Mapping[str, t.Sequence[str]]:
+        key = _superset_key(self.venv.conf, self.venv.core)
+        return {
+            name: self._deps(conf["deps"])
+            for name, conf in session_env_confs().items()
+            if _superset_key(conf, self.venv.core) == key
+        }
+
+    @staticmethod
+    def _deps(pydeps: PythonDeps) -> t.Sequence[str]:
+        return pydeps.lines()
+
+    def execute(
+        self,
+        cmd: t.Sequence[str],
+        run_id: str,
+        env: t.Optional[t.Dict[str, str]] = None,
+    ) -> None:
+        orig_env = self.venv.environment_variables.copy()
+        if env:
+            self.venv.environment_variables.update(env)
+        result = self.venv.execute(
+            cmd=cmd,
+            stdin=StdinSource.user_only(),
+            run_id=run_id,
+            show=self.venv.options.verbosity > DEFAULT_VERBOSITY,
+        )
+        if orig_env and env:
+            for key in env:
+                self.venv.environment_variables.pop(key, None)
+            self.venv.environment_variables.update(orig_env)
+        result.assert_success()
+
+    @property
+    def site_packages(self) -> t.List[Path]:
+        """The env's purelib and platlib, which differ where platlib is lib64."""
+        paths = [Path(self.venv.env_site_package_dir())]
+        # virtualenv's creator; envs of other tox plugins may not have one
+        platlib = getattr(getattr(self.venv, "creator", None), "platlib", None)
+        if platlib is not None and Path(platlib) not in paths:
+            paths.append(Path(platlib))
+        return paths
+
+    def _execute_installer(self, deps: t.Sequence[t.Any], of_type: str) -> None:
+        self._installer_ran = True
+        super()._execute_installer(deps, of_type)
+
+    def install(self, arguments: t.Any, section: str, of_type: str) -> None:
+        with profiled(self.envname, f"install-{of_type}"):
+            self._install(arguments, section, of_type)
+
+    def _install(self, arguments: t.Any, section: str, of_type: str) -> None:
+        compile_deps = None
+        if isinstance(arguments, PythonDeps):
+            compile_deps = self._deps(arguments)
+        elif arguments is None:
+            compile_deps = []
+
+        pinned_deps = None
+        if compile_deps is not None:
+            try:
+                pinned_deps_spec = self.pip_compile(deps=compile_deps)
+            except (preflight.ConflictError, bundle.BundleError) as error:
+                # fails this env only, with the problem as the reason
+                raise Fail(str(error)) from error
+            if pinned_deps_spec:
+                pinned_deps = PythonDeps(
+                    raw=pinned_deps_spec,
+                    root=self.env_requirements.parent,
+                )
+                self._installed_from_lock_file = True
+        if self._installed_from_lock_file and of_type == "package":
+            # do not override pinned deps with package requirements
+            try:
+                for item in arguments:
+                    item.deps[:] = []
+            except TypeError:
+                pass  # maybe given something other than a list of packages?
+        self._installer_ran = False
+        start = time.monotonic()
+        with self.timed(f"install-{of_type}"):
+            super().install(
+                arguments=pinned_deps or arguments,
+                section=section,
+                of_type=of_type,
+            )
+        if pinned_deps and self._installer_ran:
+            seconds = time.monotonic() - start
+            metrics.observe("install_from_lock_seconds", seconds)
+            self.record_duration(history.INSTALL, seconds)
+        elif pinned_deps:
+            # tox reused the env without installing its unchanged deps, so
+            # packages changed in it since are not put back to the lock
+            with self.timed("drift"):
+                self.repair_drift(self.site_packages)
+        if self.venv.journal:
+            self.venv.journal["tox_pin_deps"] = self.report
@@ -12,11 +12,14 @@ except ImportError:
         from .plugin import (  # noqa: F401
             tox_addoption,
             tox_configure,
+            tox_runtest_pre,
             tox_testenv_install_deps,
         )
 else:
     TOX = 4
     from .plugin4 import (  # noqa: F401
+        tox_add_core_config,
+        tox_add_env_config,
         tox_add_option,
         tox_register_tox_env,
     )
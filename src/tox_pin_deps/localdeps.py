@@ -0,0 +1,189 @@
+"""
+Digest the local projects that an env's deps install from a path.
+
+In a monorepo, `deps` may name sibling projects by path, such as
+`-e ../libs/foo` or `../libs/bar[extra]`. What those lock to depends on the
+projects' source trees, which the `deps` lines don't show, so each tree is
+digested and the digest is part of the env's lock inputs. Only the envs
+depending on an edited project then miss the lock cache.
+
+A tree's digest covers the path and content of each file, except VCS, build
+and cache directories. The size, mtime and digest of each file are kept in a
+state file, so unchanged files are only stat'ed on later scans. Each tree is
+scanned at most once per session, however many envs depend on it.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import threading
+import time
+import typing as t
+from urllib.parse import unquote, urlparse
+
+from .inputs import file_digest
+from .satisfy import requirement_lines
+
+EDITABLE_OPTS = ("-e", "--editable")
+# directories that don't hold a project's sources
+SKIP_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        ".tox",
+        ".nox",
+        ".venv",
+        "venv",
+        "__pycache__",
+        ".mypy_cache",
+        ".pytest_cache",
+        "build",
+        "dist",
+        "node_modules",
+    }
+)
+SKIP_SUFFIXES = (".egg-info", ".pyc")
+# files modified this recently may change again within the same mtime, so
+# their digest is not remembered
+RACY_SECONDS = 2.0
+EXTRAS = re.compile(r"\[[^\]]*\]$")
+
+
+class LocalDep(t.NamedTuple):
+    """A deps line installing a project (or an archive) from a local path."""
+
+    line: str
+    path: Path
+    editable: bool
+
+
+def _local_path(spec: str, root: Path) -> t.Optional[Path]:
+    """The existing path that the requirement `spec` installs from, if any."""
+    spec = spec.strip()
+    if " @ " in spec:
+        spec = spec.partition(" @ ")[2].strip()
+    spec = spec.partition(" ;")[0].partition("#")[0].strip()
+    if spec.startswith("file:"):
+        location = unquote(urlparse(spec).path)
+    elif "://" in spec or (not spec.startswith((".", "/", "~")) and "/" not in spec):
+        return None
+    else:
+        location = spec
+    path = Path(root, Path(EXTRAS.sub("", location)).expanduser())
+    return path.resolve() if path.exists() else None
+
+
+def local_deps(deps: t.Iterable[str], root: t.Union[str, Path]) -> t.List[LocalDep]:
+    """
+    The lines of `deps`, and of the files it includes, that install from a path.
+
+    Paths are relative to `root`, the directory pip runs in.
+    """
+    found: t.Dict[Path, LocalDep] = {}
+    for line, _, _ in requirement_lines(deps, root) or []:
+        editable = False
+        spec = line
+        for opt in EDITABLE_OPTS:
+            if line == opt or line.startswith((f"{opt} ", f"{opt}=")):
+                editable, spec = True, line.replace(opt, "", 1).lstrip(" =")
+        if not editable and spec.startswith("-"):
+            continue
+        path = _local_path(spec, Path(root))
+        if path is not None and path not in found:
+            found[path] = LocalDep(line, path, editable)
+    return list(found.values())
+
+
+def tree_files(root: t.Union[str, Path]) -> t.List[Path]:
+    """The source files of the project in `root`, sorted."""
+    files: t.List[Path] = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in SKIP_DIRS and not d.endswith(SKIP_SUFFIXES)
+        )
+        files.extend(
+            Path(directory, name)
+            for name in sorted(filenames)
+            if not name.endswith(SKIP_SUFFIXES)
+        )
+    return files
+
+
+def _read_state(state_file: t.Optional[Path]) -> t.Dict[str, t.List[t.Any]]:
+    if state_file is None:
+        return {}
+    try:
+        state = json.loads(state_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def _write_state(state_file: Path, state: t.Mapping[str, t.List[t.Any]]) -> None:
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=state_file.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, state_file)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def tree_digest(
+    path: t.Union[str, Path],
+    state_file: t.Optional[Path] = None,
+) -> t.Optional[str]:
+    """
+    Digest of the project in `path`, or of the file (archive) at `path`.
+
+    :param state_file: where to remember each file's digest by size and mtime
+    :return: None if `path` does not exist
+    """
+    root = Path(path)
+    if not root.is_dir():
+        return file_digest(root)
+    known = _read_state(state_file)
+    state = {}
+    racy = time.time() - RACY_SECONDS
+    h = hashlib.sha256()
+    for file in tree_files(root):
+        name = file.relative_to(root).as_posix()
+        try:
+            st = file.stat()
+        except OSError:
+            continue
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = known.get(name)
+        digest = entry[2] if entry and entry[:2] == stamp else file_digest(file)
+        if digest is None:
+            continue
+        if st.st_mtime < racy:
+            state[name] = [*stamp, digest]
+        h.update(name.encode() + b"\0" + digest.encode() + b"\0")
+    if state_file is not None and state != known:
+        try:
+            _write_state(state_file, state)
+        except OSError:
+            pass
+    return h.hexdigest()
+
+
+_digests: t.Dict[Path, t.Optional[str]] = {}
+_tree_locks: t.Dict[Path, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def session_tree_digest(path: Path, state_dir: t.Union[str, Path]) -> t.Optional[str]:
+    """`tree_digest` of `path`, scanned once per session and shared by all envs."""
+    with _lock:
+        tree_lock = _tree_locks.setdefault(path, threading.Lock())
+    with tree_lock:
+        if path not in _digests:
+            key = hashlib.sha256(str(path).encode()).hexdigest()[:16]
+            _digests[path] = tree_digest(path, Path(state_dir, f"{key}.json"))
+        return _digests[path]
@@ -0,0 +1,314 @@
+"""
+Read `pip-compile` generated lock files.
+
+When the plugin writes a lock, it also writes a sidecar next to it: the
+parsed entries as JSON, with the sha256 of the lock they were parsed from.
+`read_lock` loads the sidecar instead of parsing the lock while the checksum
+matches, and parses the lock otherwise.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import typing as t
+
+REQUIREMENT_PIN = re.compile(
+    r"^(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)(?P<extras>\[[^]]*\])?"
+    r"\s*==\s*(?P<version>[^\s;\\#]+)"
+    r"\s*(?:;\s*(?P<markers>[^\\#]+?))?\s*$"
+)
+VIA_PREFIX = "# via"
+EDITABLE_OPTS = ("-e ", "--editable ", "--editable=")
+SIDECAR_FORMAT_VERSION = 1
+
+
+def canonical_name(name: str) -> str:
+    """Normalize a project name per PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class LockEntry(t.NamedTuple):
+    """A single requirement line (and its continuations) from a lock file."""
+
+    name: str
+    version: t.Optional[str]
+    requirement: str
+    markers: t.Optional[str] = None
+    hashes: t.Tuple[str, ...] = ()
+    via: t.Tuple[str, ...] = ()
+
+    @property
+    def pin(self) -> str:
+        """`name==version` for this entry, or the raw requirement if not pinned."""
+        if self.version is None:
+            return self.requirement
+        return f"{self.name}=={self.version}"
+
+
+def _logical_lines(text: str) -> t.Iterator[t.Tuple[str, t.List[str]]]:
+    """
+    Join backslash continuations and yield (line, comments) pairs.
+
+    `comments` holds the comment lines that directly follow the logical line,
+    which is where `pip-compile` writes the `# via` annotations.
+    """
+    current: t.List[str] = []
+    comments: t.List[str] = []
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if current and current[-1].endswith("\\"):
+            current[-1] = current[-1][:-1].strip()
+            current.append(line)
+            continue
+        if line.startswith("#"):
+            if current:
+                comments.append(line)
+            continue
+        if current:
+            yield " ".join(p for p in current if p), comments
+        current, comments = ([line] if line else []), []
+    if current:
+        yield " ".join(p for p in current if p), comments
+
+
+def _parse_via(comments: t.Sequence[str], inline: str) -> t.Tuple[str, ...]:
+    """Collect the `# via` annotation from the comments following a requirement."""
+    via: t.List[str] = []
+    in_via = False
+    for comment in [inline, *comments] if inline else comments:
+        if comment.startswith(VIA_PREFIX):
+            in_via = True
+            comment = comment.partition(VIA_PREFIX)[2]
+        elif not in_via:
+            continue
+        via.extend(v.strip() for v in comment.lstrip("#").split(","))
+    return tuple(v for v in via if v)
+
+
+def parse_lock(text: str) -> t.List[LockEntry]:
+    """
+    Parse the requirement entries from the text of a `pip-compile` lock file.
+
+    Option lines (`--index-url`, `-e ...`) and comments are skipped; unpinned
+    requirements (`name @ url`) are included with a `version` of None.
+    """
+    entries = []
+    for line, comments in _logical_lines(text):
+        if line.startswith("-"):
+            continue
+        requirement, sep, inline = line.partition(" #")
+        inline = f"#{inline}".strip() if sep else ""
+        parts = requirement.split()
+        hashes = tuple(p.partition("=")[2] for p in parts if p.startswith("--hash="))
+        requirement = " ".join(p for p in parts if not p.startswith("--hash="))
+        if not requirement:
+            continue
+        via = _parse_via(comments, inline)
+        match = REQUIREMENT_PIN.match(requirement)
+        if match:
+            entries.append(
+                LockEntry(
+                    name=canonical_name(match.group("name")),
+                    version=match.group("version"),
+                    requirement=requirement,
+                    markers=match.group("markers"),
+                    hashes=hashes,
+                    via=via,
+                )
+            )
+            continue
+        name = re.split(r"[\s\[;@<>=!~]", requirement, maxsplit=1)[0]
+        entries.append(
+            LockEntry(
+                name=canonical_name(name),
+                version=None,
+                requirement=requirement,
+                hashes=hashes,
+                via=via,
+            )
+        )
+    return entries
+
+
+def sidecar_path(path: t.Union[str, Path]) -> Path:
+    """The sidecar of the lock file at `path`."""
+    path = Path(path)
+    return path.with_name(f".{path.name}.json")
+
+
+def write_sidecar(
+    path: t.Union[str, Path],
+    input_digest: t.Optional[str] = None,
+    options_digest: t.Optional[str] = None,
+) -> t.List[LockEntry]:
+    """
+    Parse the lock file at `path` and save the entries in its sidecar.
+
+    :param input_digest: digest of the inputs the lock was compiled from
+    :param options_digest: digest of the compile options alone
+    :return: the entries
+    """
+    data = Path(path).read_bytes()
+    entries = parse_lock(data.decode())
+    sidecar = sidecar_path(path)
+    fd, tmp = tempfile.mkstemp(dir=sidecar.parent, prefix=f"{sidecar.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "version": SIDECAR_FORMAT_VERSION,
+                    "checksum": hashlib.sha256(data).hexdigest(),
+                    "input_digest": input_digest,
+                    "options_digest": options_digest,
+                    "entries": [list(entry) for entry in entries],
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, sidecar)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return entries
+
+
+def read_sidecar(
+    path: t.Union[str, Path],
+    checksum: t.Optional[str] = None,
+) -> t.Optional[t.Dict[str, t.Any]]:
+    """
+    The sidecar of the lock file at `path`, if it matches the lock.
+
+    :param checksum: sha256 of the lock, if already read
+    :return: None if the sidecar is missing, unreadable, or stale
+    """
+    if checksum is None:
+        try:
+            checksum = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+        except OSError:
+            return None
+    try:
+        sidecar = json.loads(sidecar_path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(sidecar, dict)
+        or sidecar.get("version") != SIDECAR_FORMAT_VERSION
+        or sidecar.get("checksum") != checksum
+    ):
+        return None
+    return sidecar
+
+
+def _sidecar_entries(sidecar: t.Mapping[str, t.Any]) -> t.Optional[t.List[LockEntry]]:
+    try:
+        return [
+            LockEntry(
+                name=name,
+                version=version,
+                requirement=requirement,
+                markers=markers,
+                hashes=tuple(hashes),
+                via=tuple(via),
+            )
+            for name, version, requirement, markers, hashes, via in sidecar["entries"]
+        ]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def read_lock(path: t.Union[str, Path]) -> t.List[LockEntry]:
+    """
+    The entries of the lock file at `path`, or an empty list if it is missing.
+
+    Entries come from the lock's sidecar when it matches the lock's content.
+    """
+    try:
+        data = Path(path).read_bytes()
+    except FileNotFoundError:
+        return []
+    sidecar = read_sidecar(path, checksum=hashlib.sha256(data).hexdigest())
+    if sidecar is not None:
+        entries = _sidecar_entries(sidecar)
+        if entries is not None:
+            return entries
+    return parse_lock(data.decode())
+
+
+def lock_header(text: str) -> t.List[str]:
+    """The leading comment block of a lock file."""
+    header = []
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            break
+        header.append(line)
+    return header
+
+
+def lock_options(text: str) -> t.List[str]:
+    """The index and link option lines of a lock file (`--index-url`, etc)."""
+    return [
+        line.strip()
+        for line in text.splitlines()
+        if line.startswith("--") and not line.startswith(("--hash", *EDITABLE_OPTS))
+    ]
+
+
+def lock_editables(text: str) -> t.List[str]:
+    """
+    The editable requirements of a lock file, verbatim.
+
+    Each is an `-e` line with its continuations and the comments that follow
+    it, which `parse_lock` skips.
+    """
+    editables = []
+    current: t.List[str] = []
+    for line in text.splitlines():
+        if current and (
+            current[-1].endswith("\\")
+            or (line[:1].isspace() and line.strip().startswith("#"))
+        ):
+            current.append(line)
+            continue
+        if current:
+            editables.append("\n".join(current))
+        current = [line] if line.startswith(EDITABLE_OPTS) else []
+    if current:
+        editables.append("\n".join(current))
+    return editables
+
+
+def render_lock(
+    entries: t.Iterable[LockEntry],
+    header: t.Iterable[str] = (),
+    options: t.Iterable[str] = (),
+    editables: t.Iterable[str] = (),
+) -> str:
+    """
+    Format `entries` in the same layout `pip-compile` uses.
+
+    :param editables: verbatim editable requirements, see `lock_editables`,
+        which come first like in `pip-compile` output
+    """
+    lines = list(header)
+    options = list(options)
+    if options:
+        lines.extend(options)
+        lines.append("")
+    lines.extend(editables)
+    for entry in entries:
+        if entry.hashes:
+            lines.append(f"{entry.requirement} \\")
+            hash_lines = [f"    --hash={h}" for h in entry.hashes]
+            lines.extend(f"{hl} \\" for hl in hash_lines[:-1])
+            lines.append(hash_lines[-1])
+        else:
+            lines.append(entry.requirement)
+        if len(entry.via) == 1:
+            lines.append(f"    # via {entry.via[0]}")
+        elif entry.via:
+            lines.append("    # via")
+            lines.extend(f"    #   {via}" for via in entry.via)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,187 @@
+"""
+Admit concurrent `pip-compile` runs against a memory budget.
+
+The peak RSS of each compile is measured by PEAK_RSS_SCRIPT in the testenv's
+interpreter and remembered per env. Before compiling, an env reserves its last
+peak in a ledger shared by every tox process of the project (`tox -p` runs envs
+in threads on tox4 and in processes on tox3), and waits while the reservations
+of running compiles would exceed the budget.
+"""
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+import typing as t
+
+logger = logging.getLogger(__name__)
+
+ENV_MEMORY_BUDGET = "TOX_PIN_DEPS_MEMORY_BUDGET"
+ENV_PEAK_RSS = "TOX_PIN_DEPS_PEAK_RSS"
+LEDGER_DIR = Path("tox-pin-deps", "memory")
+# assumed peak of envs that were never measured, when no env was
+DEFAULT_ESTIMATE = 512 * 1024**2
+DEFAULT_POLL_INTERVAL = 0.5
+PEAKS_FILE = "peaks.json"
+PEAK_RSS_SCRIPT = """
+import atexit, json, os, sys
+def _record_peak_rss(path=os.environ["%s"]):
+    try:
+        import resource
+    except ImportError:
+        return
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    with open(path, "w") as f:
+        json.dump({"peak_rss": peak * (1 if sys.platform == "darwin" else 1024)}, f)
+atexit.register(_record_peak_rss)
+""" % (
+    ENV_PEAK_RSS,
+)
+
+
+def read_peak(path: t.Union[str, Path]) -> t.Optional[int]:
+    """The peak RSS written by PEAK_RSS_SCRIPT, if any."""
+    try:
+        return int(json.loads(Path(path).read_text())["peak_rss"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == "win32":  # pragma: no cover
+        # os.kill would terminate the process; assume alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        return True
+    return True
+
+
+class MemoryLedger:
+    """Reservations of running compiles and measured peaks, in `directory`."""
+
+    def __init__(
+        self,
+        directory: t.Union[str, Path],
+        budget: int,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.directory = Path(directory)
+        self.budget = budget
+        self.poll_interval = poll_interval
+
+    @contextlib.contextmanager
+    def _locked(self) -> t.Iterator[None]:
+        from filelock import FileLock  # installed with tox
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with FileLock(str(self.directory / ".lock")):
+            yield
+
+    def peaks(self) -> t.Dict[str, int]:
+        """The last measured peak RSS of each env."""
+        try:
+            return t.cast(
+                t.Dict[str, int],
+                json.loads((self.directory / PEAKS_FILE).read_text()),
+            )
+        except (OSError, ValueError):
+            return {}
+
+    def estimate(self, envname: str) -> int:
+        """Expected peak RSS of compiling `envname`."""
+        peaks = self.peaks()
+        if envname in peaks:
+            return peaks[envname]
+        if peaks:
+            return max(peaks.values())
+        return DEFAULT_ESTIMATE
+
+    def record_peak(self, envname: str, peak: int) -> None:
+        with self._locked():
+            peaks = self.peaks()
+            peaks[envname] = peak
+            (self.directory / PEAKS_FILE).write_text(json.dumps(peaks, indent=2))
+
+    def reservations(self) -> t.Dict[Path, int]:
+        """Bytes reserved by running compiles, dropping those of dead processes."""
+        reserved = {}
+        for path in self.directory.glob("*.reservation"):
+            try:
+                entry = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if not _pid_alive(entry["pid"]):
+                path.unlink()
+                continue
+            reserved[path] = int(entry["bytes"])
+        return reserved
+
+    def _try_reserve(self, envname: str, need: int) -> t.Optional[Path]:
+        with self._locked():
+            reserved = self.reservations()
+            if reserved and sum(reserved.values()) + need > self.budget:
+                return None
+            safe_name = "".join(
+                c if c.isalnum() or c in "-_." else "_" for c in envname
+            )
+            path = self.directory / (
+                f"{os.getpid()}.{threading.get_ident()}.{safe_name}.reservation"
+            )
+            path.write_text(json.dumps({"pid": os.getpid(), "bytes": need}))
+            return path
+
+    def reserve(self, envname: str, need: int) -> Path:
+        """
+        Wait until `need` bytes fit in the budget, and reserve them.
+
+        A compile is always admitted when nothing else is running, even if it
+        needs more than the whole budget.
+
+        :return: the reservation, to pass to `release`
+        """
+        path = self._try_reserve(envname, need)
+        if path is None:
+            logger.warning(
+                "%s: waiting for %d MiB of the %d MiB memory budget",
+                envname,
+                need // 1024**2,
+                self.budget // 1024**2,
+            )
+        while path is None:
+            time.sleep(self.poll_interval)
+            path = self._try_reserve(envname, need)
+        return path
+
+    def release(self, reservation: Path) -> None:
+        reservation.unlink()
+
+    @contextlib.contextmanager
+    def admit(self, envname: str, need: int) -> t.Iterator[None]:
+        """Hold a reservation of `need` bytes for the enclosed block."""
+        reservation = self.reserve(envname, need)
+        try:
+            yield
+        finally:
+            self.release(reservation)
+
+
+_ledgers: t.Dict[t.Tuple[Path, int], MemoryLedger] = {}
+
+
+def open_ledger(work_dir: t.Union[str, Path], budget: int) -> MemoryLedger:
+    """The session's MemoryLedger in the tox work dir `work_dir`."""
+    key = (Path(work_dir, LEDGER_DIR), budget)
+    if key not in _ledgers:
+        _ledgers[key] = MemoryLedger(*key)
+    return _ledgers[key]
@@ -0,0 +1,225 @@
+"""
+Session statistics exported in the Prometheus text format (version 0.0.4).
+
+When enabled, metrics accumulated during the session are written atomically
+to a `.prom` file at exit, suitable for node-exporter's textfile collector.
+
+tox3 runs each env of `tox -p` in a tox process of its own. Each process
+keeps its samples next to the `.prom` file, and adds those of the other
+processes of the same session before writing, under a file lock.
+"""
+import atexit
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import typing as t
+
+from .common import session_id
+
+ENV_METRICS = "TOX_PIN_DEPS_METRICS"
+PREFIX = "tox_pin_deps_"
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+COUNTERS = {
+    "envs_compiled": "Envs locked by running pip-compile.",
+    "envs_skipped": "Envs which did not need pip-compile, by reason.",
+    "lock_cache_hits": "Lock cache lookups that found a lock.",
+    "lock_cache_misses": "Lock cache lookups that found no lock.",
+    "compile_regressions": "Compiles much slower than the env's recent runs.",
+    "preflight_conflicts": "Envs whose direct requirements contradict each other.",
+}
+GAUGES = {
+    "lock_packages": "Number of packages pinned in the env's lock file.",
+}
+HISTOGRAMS = {
+    "compile_seconds": "Time spent running pip-compile for an env.",
+    "install_from_lock_seconds": "Time spent installing an env from its lock file.",
+}
+
+Labels = t.Tuple[t.Tuple[str, str], ...]
+Samples = t.Dict[t.Tuple[str, Labels], float]
+Histograms = t.Dict[str, t.List[float]]
+
+_lock = threading.Lock()
+_counters: Samples = {}
+_gauges: Samples = {}
+_histograms: Histograms = {}
+_output: t.Optional[Path] = None
+
+
+def _labels(labels: t.Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    """Increment counter `name`."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def observe(name: str, value: float) -> None:
+    """Record `value` in histogram `name`."""
+    with _lock:
+        _histograms.setdefault(name, []).append(value)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _snapshot() -> t.Tuple[Samples, Samples, Histograms]:
+    with _lock:
+        return (
+            dict(_counters),
+            dict(_gauges),
+            {name: list(values) for name, values in _histograms.items()},
+        )
+
+
+def render(snapshot: t.Optional[t.Tuple[Samples, Samples, Histograms]] = None) -> str:
+    """The session's metrics (or those of `snapshot`) in text exposition format."""
+    lines = []
+    counters, gauges, histograms = snapshot or _snapshot()
+    for name, doc in COUNTERS.items():
+        metric = f"{PREFIX}{name}_total"
+        lines.append(f"# HELP {metric} {doc}")
+        lines.append(f"# TYPE {metric} counter")
+        samples = {labels: v for (n, labels), v in counters.items() if n == name}
+        for labels, value in sorted(samples.items()) or [((), 0)]:
+            lines.append(f"{metric}{_format_labels(labels)} {_number(value)}")
+    for name, doc in GAUGES.items():
+        metric = f"{PREFIX}{name}"
+        lines.append(f"# HELP {metric} {doc}")
+        lines.append(f"# TYPE {metric} gauge")
+        for (n, labels), value in sorted(gauges.items()):
+            if n == name:
+                lines.append(f"{metric}{_format_labels(labels)} {_number(value)}")
+    for name, doc in HISTOGRAMS.items():
+        metric = f"{PREFIX}{name}"
+        values = histograms.get(name, [])
+        lines.append(f"# HELP {metric} {doc}")
+        lines.append(f"# TYPE {metric} histogram")
+        for bucket in DURATION_BUCKETS:
+            count = sum(1 for v in values if v <= bucket)
+            lines.append(f'{metric}_bucket{{le="{bucket}"}} {count}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {len(values)}')
+        lines.append(f"{metric}_sum {_number(float(sum(values)))}")
+        lines.append(f"{metric}_count {len(values)}")
+    return "\n".join(lines) + "\n"
+
+
+def _state_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.json")
+
+
+def _dump(snapshot: t.Tuple[Samples, Samples, Histograms], session: str) -> str:
+    counters, gauges, histograms = snapshot
+    return json.dumps(
+        {
+            "session": session,
+            "counters": [[n, labels, v] for (n, labels), v in counters.items()],
+            "gauges": [[n, labels, v] for (n, labels), v in gauges.items()],
+            "histograms": histograms,
+        }
+    )
+
+
+def _merge(
+    snapshot: t.Tuple[Samples, Samples, Histograms],
+    state: t.Mapping[str, t.Any],
+) -> t.Tuple[Samples, Samples, Histograms]:
+    """Add the samples of `state`, as saved by `_dump`, to `snapshot`."""
+    counters, gauges, histograms = snapshot
+    for name, labels, value in state.get("counters", []):
+        key = (name, tuple((k, v) for k, v in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, value in state.get("gauges", []):
+        gauges.setdefault((name, tuple((k, v) for k, v in labels)), value)
+    for name, values in state.get("histograms", {}).items():
+        histograms[name] = [*values, *histograms.get(name, [])]
+    return counters, gauges, histograms
+
+
+def _replace(path: Path, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write(path: t.Union[str, Path], session: t.Optional[str] = None) -> None:
+    """
+    Atomically replace `path` with the current metrics.
+
+    :param session: id of the tox session, to add the metrics written to
+        `path` by its other tox processes
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if session is None:
+        _replace(path, render())
+        return
+    from filelock import FileLock  # installed with tox
+
+    with FileLock(str(path.with_name(f".{path.name}.lock"))):
+        snapshot = _snapshot()
+        try:
+            state = json.loads(_state_path(path).read_text())
+        except (OSError, ValueError):
+            state = None
+        if isinstance(state, dict) and state.get("session") == session:
+            try:
+                snapshot = _merge(snapshot, state)
+            except (TypeError, ValueError):
+                snapshot = _snapshot()
+        _replace(_state_path(path), _dump(snapshot, session))
+        _replace(path, render(snapshot))
+
+
+def _write_output() -> None:
+    if _output is not None:
+        write(_output, session=session_id())
+
+
+def enabled() -> bool:
+    """True if metrics will be written at the end of the session."""
+    return _output is not None
+
+
+def enable(path: t.Union[str, Path, None]) -> None:
+    """Write metrics to `path` when the session ends."""
+    global _output
+    if not path:
+        return
+    with _lock:
+        if _output is None:
+            atexit.register(_write_output)
+        _output = Path(path)
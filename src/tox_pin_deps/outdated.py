@@ -0,0 +1,390 @@
+"""
+Find pins with newer releases on the package index, without re-locking.
+
+Every lock file is parsed once and pinned names are deduplicated across envs,
+so each project page is fetched from the index a single time. Pages are
+fetched concurrently, each worker thread reusing its keep-alive connection to
+the index host.
+"""
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+import http.client
+import os
+from pathlib import Path
+import threading
+import typing as t
+import urllib.parse
+import urllib.request
+
+from .inputs import referenced_files
+from .lockfile import LockEntry, canonical_name, read_lock
+
+DEFAULT_INDEX_URL = "https://pypi.org/simple"
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = 30.0
+SDIST_EXTENSIONS = (".tar.gz", ".tar.bz2", ".tgz", ".zip", ".tar")
+USER_AGENT = "tox-pin-deps"
+
+
+class Outdated(t.NamedTuple):
+    """A pin with a newer release on the index."""
+
+    envname: str
+    name: str
+    current: str
+    # newest release allowed by the env's deps, None if all are excluded
+    allowed: t.Optional[str]
+    latest: str
+
+
+class ScanResult(t.NamedTuple):
+    outdated: t.List[Outdated]
+    # package name -> error, for pages that could not be fetched
+    errors: t.Dict[str, str]
+
+
+class Link(t.NamedTuple):
+    """A file listed on a project page."""
+
+    filename: str
+    # "algorithm:hexdigest" from the URL fragment, if given
+    hash: t.Optional[str]
+    yanked: bool
+
+
+class _LinkParser(HTMLParser):
+    """Collect the files of a PEP 503 project page."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.links: t.List[Link] = []
+        self._yanked: t.Optional[bool] = None
+        self._href = ""
+
+    def handle_starttag(
+        self, tag: str, attrs: t.List[t.Tuple[str, t.Optional[str]]]
+    ) -> None:
+        if tag == "a":
+            attributes = dict(attrs)
+            self._href = attributes.get("href") or ""
+            self._yanked = "data-yanked" in attributes
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "a" and self._yanked is not None:
+            parts = urllib.parse.urlsplit(self._href)
+            algorithm, sep, digest = parts.fragment.partition("=")
+            self.links.append(
+                Link(
+                    filename=urllib.parse.unquote(parts.path.rpartition("/")[2]),
+                    hash=f"{algorithm}:{digest}" if sep else None,
+                    yanked=self._yanked,
+                )
+            )
+            self._yanked = None
+
+
+def parse_links(html: str) -> t.List[Link]:
+    parser = _LinkParser()
+    parser.feed(html)
+    return parser.links
+
+
+def file_version(filename: str) -> t.Optional[str]:
+    """The version in a wheel or sdist file name."""
+    if filename.endswith(".whl"):
+        parts = filename.split("-")
+        return parts[1] if len(parts) >= 5 else None
+    for ext in SDIST_EXTENSIONS:
+        if filename.endswith(ext):
+            stem = filename[: -len(ext)]
+            return stem.rpartition("-")[2] if "-" in stem else None
+    return None
+
+
+def release_versions(links: t.Iterable[Link]) -> t.Dict[str, bool]:
+    """Map each version of `links` to whether all of its files are yanked."""
+    versions: t.Dict[str, bool] = {}
+    for link in links:
+        version = file_version(link.filename)
+        if version:
+            versions[version] = versions.get(version, True) and link.yanked
+    return versions
+
+
+def parse_project_page(html: str) -> t.Dict[str, bool]:
+    """Map each version on a project page to whether all of its files are yanked."""
+    return release_versions(parse_links(html))
+
+
+class IndexClient:
+    """Fetch project pages from simple (PEP 503) indexes over pooled connections."""
+
+    def __init__(
+        self,
+        index_urls: t.Sequence[str] = (DEFAULT_INDEX_URL,),
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.index_urls = [url.rstrip("/") for url in index_urls]
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: t.List[http.client.HTTPConnection] = []
+
+    def _connection(self, scheme: str, host: str) -> http.client.HTTPConnection:
+        """This thread's connection to `host`, opened on first use."""
+        pool: t.Dict[
+            t.Tuple[str, str], http.client.HTTPConnection
+        ] = self._local.__dict__.setdefault("pool", {})
+        if (scheme, host) not in pool:
+            cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            pool[(scheme, host)] = cls(host, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(pool[(scheme, host)])
+        return pool[(scheme, host)]
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def get(self, url: str, redirects: int = 3) -> t.Optional[str]:
+        """The text at `url`, or None if it does not exist."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme == "file":
+            path = Path(urllib.request.url2pathname(parts.path))
+            for candidate in (path, path / "index.html"):
+                if candidate.is_file():
+                    return candidate.read_text(encoding="utf-8")
+            return None
+        host = parts.hostname or ""
+        if parts.port:
+            host = f"{host}:{parts.port}"
+        headers = {"Accept": "text/html", "User-Agent": USER_AGENT}
+        if parts.username:
+            credentials = f"{parts.username}:{parts.password or ''}"
+            headers["Authorization"] = (
+                "Basic "
+                + base64.b64encode(urllib.parse.unquote(credentials).encode()).decode()
+            )
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+        connection = self._connection(parts.scheme, host)
+        for attempt in range(2):
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError) as exc:
+                # the server may have closed an idle pooled connection
+                connection.close()
+                if not attempt:
+                    continue
+                if isinstance(exc, http.client.HTTPException):
+                    # callers handle an unreachable index as an OSError
+                    raise OSError(f"GET {url}: {exc!r}") from exc
+                raise
+        if response.status in (301, 302, 303, 307, 308) and redirects:
+            location = urllib.parse.urljoin(url, response.getheader("Location") or "")
+            return self.get(location, redirects - 1)
+        if response.status == 404:
+            return None
+        if response.status != 200:
+            raise OSError(f"GET {url}: HTTP {response.status} {response.reason}")
+        charset = response.headers.get_content_charset() or "utf-8"
+        return body.decode(charset, errors="replace")
+
+    def links(self, name: str) -> t.List[Link]:
+        """The files of project `name` on all indexes."""
+        links = []
+        for index_url in self.index_urls:
+            page = self.get(f"{index_url}/{canonical_name(name)}/")
+            if page is not None:
+                links.extend(parse_links(page))
+        return links
+
+    def versions(self, name: str) -> t.Dict[str, bool]:
+        """Versions of project `name` on all indexes, and whether they are yanked."""
+        return release_versions(self.links(name))
+
+
+def index_urls(
+    pip_opts: t.Iterable[str] = (),
+    environ: t.Optional[t.Mapping[str, str]] = None,
+) -> t.List[str]:
+    """
+    The indexes pip would use with `pip_opts` (--index-url, --extra-index-url).
+
+    Without --index-url, PIP_INDEX_URL from `environ` or PyPI is used;
+    PIP_EXTRA_INDEX_URL is used without any --extra-index-url.
+    """
+    environ = os.environ if environ is None else environ
+    urls: t.Dict[str, t.List[str]] = {"--index-url": [], "--extra-index-url": []}
+    opts = list(pip_opts)
+    for ix, opt in enumerate(opts):
+        name, sep, value = opt.partition("=")
+        if name == "-i":
+            name = "--index-url"
+        if name in urls:
+            if not sep:
+                value = opts[ix + 1] if ix + 1 < len(opts) else ""
+            urls[name].append(value)
+    index = (
+        urls["--index-url"][-1:]
+        or environ.get("PIP_INDEX_URL", DEFAULT_INDEX_URL).split()
+    )
+    extra = urls["--extra-index-url"] or environ.get("PIP_EXTRA_INDEX_URL", "").split()
+    return [*index, *extra]
+
+
+def deps_specifiers(
+    deps: t.Iterable[str],
+    root: t.Union[str, Path] = ".",
+) -> t.Dict[str, t.Any]:
+    """
+    The version specifiers of each package named in `deps`.
+
+    Requirement lines of files included with `-r` / `-c` are taken into
+    account too. The values are `packaging.specifiers.SpecifierSet`.
+    """
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.specifiers import SpecifierSet
+
+    deps = list(deps)
+    lines = list(deps)
+    for path in referenced_files(deps, root):
+        try:
+            lines.extend(path.read_text().splitlines())
+        except OSError:
+            continue
+    specifiers: t.Dict[str, t.Any] = {}
+    for line in lines:
+        line = line.partition(" #")[0].strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            continue
+        name = canonical_name(requirement.name)
+        specifiers[name] = specifiers.get(name, SpecifierSet()) & requirement.specifier
+    return specifiers
+
+
+def read_locks(
+    requirements_directory: t.Union[str, Path],
+    envs: t.Sequence[str] = (),
+) -> t.Dict[str, t.List[LockEntry]]:
+    """The entries of each env's lock file (only `envs`, if given)."""
+    return {
+        lock.stem: read_lock(lock)
+        for lock in sorted(Path(requirements_directory).glob("*.txt"))
+        if not envs or lock.stem in envs
+    }
+
+
+def scan(
+    locks: t.Mapping[str, t.Sequence[LockEntry]],
+    client: IndexClient,
+    constraints: t.Optional[t.Mapping[str, t.Mapping[str, t.Any]]] = None,
+    pre: bool = False,
+    max_workers: int = DEFAULT_WORKERS,
+) -> ScanResult:
+    """
+    Compare every pin in `locks` to the releases on the index.
+
+    :param constraints: for each env, the `SpecifierSet` of each package in
+        its deps (see `deps_specifiers`); packages without an entry are only
+        compared to the latest release
+    :param pre: consider pre-releases even when the pinned version is final
+    """
+    from packaging.version import InvalidVersion, Version
+
+    constraints = constraints or {}
+    names = sorted(
+        {entry.name for entries in locks.values() for entry in entries if entry.version}
+    )
+    errors: t.Dict[str, str] = {}
+
+    def _fetch(name: str) -> t.List[Version]:
+        try:
+            released = client.versions(name)
+        except OSError as exc:
+            errors[name] = str(exc)
+            return []
+        versions = []
+        for version, yanked in released.items():
+            if yanked:
+                continue
+            try:
+                versions.append(Version(version))
+            except InvalidVersion:
+                continue
+        return sorted(versions)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        releases = dict(zip(names, executor.map(_fetch, names)))
+
+    outdated = []
+    for envname, entries in sorted(locks.items()):
+        env_constraints = constraints.get(envname, {})
+        for entry in entries:
+            if entry.version is None:
+                continue
+            try:
+                current = Version(entry.version)
+            except InvalidVersion:
+                continue
+            candidates = [
+                v
+                for v in releases.get(entry.name, [])
+                if v > current and (pre or current.is_prerelease or not v.is_prerelease)
+            ]
+            if not candidates:
+                continue
+            specifier = env_constraints.get(entry.name)
+            allowed = [
+                v
+                for v in candidates
+                if specifier is None or specifier.contains(v, prereleases=True)
+            ]
+            outdated.append(
+                Outdated(
+                    envname=envname,
+                    name=entry.name,
+                    current=entry.version,
+                    allowed=str(allowed[-1]) if allowed else None,
+                    latest=str(candidates[-1]),
+                )
+            )
+    return ScanResult(outdated=outdated, errors=errors)
+
+
+def format_report(outdated: t.Iterable[Outdated]) -> str:
+    """Group the outdated pins by env."""
+    lines = []
+    envname = None
+    for item in outdated:
+        if item.envname != envname:
+            envname = item.envname
+            lines.append(envname)
+        if item.allowed is None:
+            lines.append(
+                f"    {item.name} {item.current}: held back by deps "
+                f"(latest {item.latest})"
+            )
+        elif item.allowed != item.latest:
+            lines.append(
+                f"    {item.name} {item.current} -> {item.allowed} "
+                f"(latest {item.latest})"
+            )
+        else:
+            lines.append(f"    {item.name} {item.current} -> {item.allowed}")
+    return "\n".join(lines)
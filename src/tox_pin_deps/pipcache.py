@@ -0,0 +1,324 @@
+"""
+Prune the pip caches down to the artifacts the project's lock files reference.
+
+pip never evicts from its cache, so on CI runners that re-lock often it grows
+with every release ever resolved, and restoring it dominates job startup. The
+entries holding a version pinned by a lock file (or an artifact whose hash a
+lock lists) are kept; every other entry is evicted least recently used first
+until the cache fits the budget.
+
+`pip-compile` runs pip with the pip-tools cache as its cache dir, so both pip's
+and pip-tools' caches are pruned, each to the budget. An entry is a built
+wheel in `wheels/`, a cached HTTP response in `http-v2/` (header and body) or
+`http/`, or an artifact pip-tools downloaded into `pkgs/`. Downloaded wheels
+are recognized by their filename or the `.dist-info` directory in their body,
+sdists by their filename, other artifacts only by hash. pip-tools' dependency
+cache is a small JSON file and is kept. Recency is the later of a file's
+access and modification times, so it is only as fine as the filesystem's atime
+updates (a day, with `relatime`).
+"""
+import atexit
+import contextlib
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import typing as t
+import zipfile
+
+from .common import DEFAULT_REQUIREMENTS_DIRECTORY
+from .lockfile import canonical_name, read_lock
+
+logger = logging.getLogger(__name__)
+
+HTTP_DIRS = ("http-v2", "http")
+WHEELS_DIR = "wheels"
+# artifacts pip-tools downloads while resolving
+DOWNLOADS_DIR = "pkgs"
+BODY_SUFFIX = ".body"
+# locks the plugin writes under the tox work dir, such as staged bundle locks
+WORK_DIR_LOCKS = "tox-pin-deps"
+CHUNK_SIZE = 1024**2
+DIST_INFO = re.compile(r"^([^/]+)-([^/-]+)\.dist-info/")
+SDIST = re.compile(r"^(.+)-([^-]+)\.(?:tar\.gz|zip)$")
+
+
+class Entry(t.NamedTuple):
+    """Files that pip caches together, evicted together."""
+
+    paths: t.Tuple[Path, ...]
+    size: int
+    last_used: float
+
+
+class Referenced(t.NamedTuple):
+    """What the lock files still need from the cache."""
+
+    # (canonical name, version key)
+    pins: t.Set[t.Tuple[str, t.Hashable]]
+    # sha256 hex digests
+    hashes: t.Set[str]
+
+
+class PruneResult(t.NamedTuple):
+    entries: int
+    evicted: int
+    # bytes in the cache before pruning, freed, and kept as referenced by the
+    # locks while pruning
+    size: int
+    freed: int
+    referenced: int
+
+
+def _user_cache_dir(name: str, environ: t.Mapping[str, str]) -> Path:
+    if sys.platform == "win32":  # pragma: no cover
+        return Path(environ.get("LOCALAPPDATA", "~/AppData/Local"), name, "Cache")
+    if sys.platform == "darwin":  # pragma: no cover
+        return Path("~/Library/Caches", name).expanduser()
+    return Path(environ.get("XDG_CACHE_HOME") or "~/.cache", name).expanduser()
+
+
+def pip_cache_dir(environ: t.Optional[t.Mapping[str, str]] = None) -> Path:
+    """The cache directory pip uses by default, or $PIP_CACHE_DIR."""
+    environ = os.environ if environ is None else environ
+    if environ.get("PIP_CACHE_DIR"):
+        return Path(environ["PIP_CACHE_DIR"]).expanduser()
+    return _user_cache_dir("pip", environ)
+
+
+def piptools_cache_dir(environ: t.Optional[t.Mapping[str, str]] = None) -> Path:
+    """The cache directory `pip-compile` uses by default, or $PIP_TOOLS_CACHE_DIR."""
+    environ = os.environ if environ is None else environ
+    if environ.get("PIP_TOOLS_CACHE_DIR"):
+        return Path(environ["PIP_TOOLS_CACHE_DIR"]).expanduser()
+    return _user_cache_dir("pip-tools", environ)
+
+
+def cache_dirs(environ: t.Optional[t.Mapping[str, str]] = None) -> t.List[Path]:
+    """pip's and pip-tools' cache directories."""
+    return [pip_cache_dir(environ), piptools_cache_dir(environ)]
+
+
+def lock_files(
+    requirements_directory: t.Union[str, Path],
+    work_dir: t.Optional[t.Union[str, Path]] = None,
+) -> t.List[Path]:
+    """The lock files in `requirements_directory` and those the plugin keeps in `work_dir`."""
+    locks = sorted(Path(requirements_directory).glob("*.txt"))
+    if work_dir is not None:
+        locks.extend(sorted(Path(work_dir, WORK_DIR_LOCKS).glob("**/*.txt")))
+    return locks
+
+
+def _version_key(version: str) -> t.Hashable:
+    """`version` as a key equal for equal versions, like 1.0 and 1.0.0."""
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return Version(version)
+    except InvalidVersion:
+        return version
+
+
+def referenced(locks: t.Iterable[t.Union[str, Path]]) -> Referenced:
+    """The pins and hashes of `locks`."""
+    found = Referenced(set(), set())
+    for lock in locks:
+        try:
+            entries = read_lock(lock)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.version is not None:
+                found.pins.add((entry.name, _version_key(entry.version)))
+            found.hashes.update(
+                digest.partition(":")[2]
+                for digest in entry.hashes
+                if digest.startswith("sha256:")
+            )
+    return found
+
+
+def _stat_entry(paths: t.Sequence[Path]) -> t.Optional[Entry]:
+    size, last_used = 0, 0.0
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        size += st.st_size
+        last_used = max(last_used, st.st_atime, st.st_mtime)
+    return Entry(tuple(paths), size, last_used)
+
+
+def cache_entries(cache_dir: t.Union[str, Path]) -> t.List[Entry]:
+    """The entries of the pip (or pip-tools) cache in `cache_dir`, LRU first."""
+    groups: t.Dict[Path, t.List[Path]] = {}
+    for http_dir in HTTP_DIRS:
+        for path in Path(cache_dir, http_dir).glob("**/*"):
+            if path.is_file():
+                # http-v2 keeps the headers and the body of a response side by side
+                key = path.with_suffix("") if path.suffix == BODY_SUFFIX else path
+                groups.setdefault(key, []).append(path)
+    for wheel in Path(cache_dir, WHEELS_DIR).glob("**/*.whl"):
+        # each built wheel has a directory of its own, with an origin.json
+        groups[wheel.parent] = [p for p in wheel.parent.iterdir() if p.is_file()]
+    for path in Path(cache_dir, DOWNLOADS_DIR).glob("**/*"):
+        if path.is_file():
+            groups[path] = [path]
+    entries = (_stat_entry(sorted(paths)) for paths in groups.values())
+    return sorted(
+        (entry for entry in entries if entry is not None),
+        key=lambda entry: (entry.last_used, entry.paths),
+    )
+
+
+@contextlib.contextmanager
+def _keep_atime(path: Path) -> t.Iterator[None]:
+    """Restore the access time of `path` after reading it, to keep LRU order."""
+    try:
+        st = path.stat()
+    except OSError:
+        yield
+        return
+    try:
+        yield
+    finally:
+        try:
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except OSError:
+            pass
+
+
+def _wheel_project(path: Path) -> t.Optional[t.Tuple[str, t.Hashable]]:
+    """
+    (name, version) of the wheel `path`, by its filename or its `.dist-info`.
+
+    A downloaded sdist is recognized by its filename.
+    """
+    if path.suffix == ".whl":
+        parts = path.name.split("-")
+        if len(parts) >= 5:
+            return canonical_name(parts[0]), _version_key(parts[1])
+    sdist = SDIST.match(path.name)
+    if sdist:
+        return canonical_name(sdist.group(1)), _version_key(sdist.group(2))
+    try:
+        with _keep_atime(path), zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return None
+    for name in names:
+        match = DIST_INFO.match(name)
+        if match:
+            return canonical_name(match.group(1)), _version_key(match.group(2))
+    return None
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with _keep_atime(path), path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_referenced(entry: Entry, needed: Referenced) -> bool:
+    """True if `entry` holds a pinned version, or an artifact with a locked hash."""
+    if any(_wheel_project(path) in needed.pins for path in entry.paths):
+        return True
+    if not needed.hashes:
+        return False
+    for path in entry.paths:
+        if path.suffix not in (".whl", BODY_SUFFIX):
+            continue
+        try:
+            if _sha256(path) in needed.hashes:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+def prune(
+    cache_dir: t.Union[str, Path],
+    locks: t.Iterable[t.Union[str, Path]],
+    max_size: int,
+    dry_run: bool = False,
+) -> PruneResult:
+    """
+    Evict the entries of `cache_dir` that `locks` do not reference, LRU first,
+    until it takes at most `max_size` bytes.
+
+    Referenced entries are kept even if they alone exceed `max_size`.
+    """
+    entries = cache_entries(cache_dir)
+    size = sum(entry.size for entry in entries)
+    total, freed, evicted, kept = size, 0, 0, 0
+    # entries are only read to match them against the locks while over budget
+    needed = referenced(locks) if size > max_size else None
+    for entry in entries:
+        if needed is None or total <= max_size:
+            break
+        if is_referenced(entry, needed):
+            kept += entry.size
+            continue
+        if not dry_run:
+            try:
+                for path in entry.paths:
+                    path.unlink()
+            except OSError:
+                continue
+        total -= entry.size
+        freed += entry.size
+        evicted += 1
+    if total > max_size:
+        logger.warning(
+            "tox-pin-deps: the %.1f MiB of %s referenced by lock files "
+            "exceed the budget of %.1f MiB",
+            total / 1024**2,
+            cache_dir,
+            max_size / 1024**2,
+        )
+    return PruneResult(len(entries), evicted, size, freed, kept)
+
+
+def format_result(result: PruneResult, cache_dir: t.Union[str, Path]) -> str:
+    return (
+        f"{cache_dir}: evicted {result.evicted} of {result.entries} entries, "
+        f"freed {result.freed / 1024**2:.1f} of {result.size / 1024**2:.1f} MiB "
+        f"(kept {result.referenced / 1024**2:.1f} MiB referenced by lock files)"
+    )
+
+
+_prune_lock = threading.Lock()
+_prune_args: t.Optional[t.Tuple[Path, Path, int]] = None
+
+
+def _prune_at_exit() -> None:
+    if _prune_args is None:
+        return
+    toxinidir, work_dir, max_size = _prune_args
+    locks = lock_files(Path(toxinidir, DEFAULT_REQUIREMENTS_DIRECTORY), work_dir)
+    for cache_dir in cache_dirs():
+        if cache_dir.is_dir():
+            result = prune(cache_dir, locks, max_size=max_size)
+            logger.warning("tox-pin-deps: %s", format_result(result, cache_dir))
+
+
+def prune_at_exit(
+    max_size: t.Optional[int],
+    toxinidir: t.Union[str, Path],
+    work_dir: t.Union[str, Path],
+) -> None:
+    """Prune the pip and pip-tools caches to `max_size` bytes when the session ends."""
+    global _prune_args
+    if max_size is None:
+        return
+    with _prune_lock:
+        if _prune_args is None:
+            atexit.register(_prune_at_exit)
+        _prune_args = (Path(toxinidir), Path(work_dir), max_size)
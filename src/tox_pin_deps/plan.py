@@ -0,0 +1,99 @@
+"""
+Everything needed to lock one env, captured once.
+
+A `CompilePlan` holds an env's deps, the content digests of its sources and
+local projects, compile options, and output path, as plain immutable values. It compares
+and hashes by value, so it is its own cache key.
+"""
+from pathlib import Path
+import typing as t
+
+from .inputs import file_digest, inputs_digest
+
+# runs `pip-compile` in-process, after any instrumentation preambles
+PIP_COMPILE_SCRIPT = """
+import sys
+from piptools.scripts.compile import cli
+sys.argv = ["pip-compile"] + sys.argv[1:]
+cli()
+"""
+
+Digests = t.Tuple[t.Tuple[str, t.Optional[str]], ...]
+
+
+def digests(paths: t.Iterable[t.Union[str, Path]]) -> Digests:
+    """Each path with the sha256 of its content (None if it does not exist)."""
+    return tuple((str(path), file_digest(path)) for path in paths)
+
+
+def extra_opts(extras: t.Iterable[str]) -> t.List[str]:
+    """`pip-compile` options locking the local package's `extras`."""
+    return [opt for extra in extras for opt in ("--extra", extra)]
+
+
+class CompilePlan(t.NamedTuple):
+    """The inputs of one `pip-compile` run."""
+
+    envname: str
+    deps: t.Tuple[str, ...]
+    # dist sources (setup.py, pyproject.toml...) passed to pip-compile
+    sources: Digests
+    # requirement and constraint files included by deps
+    included: Digests
+    opts: t.Tuple[str, ...]
+    extras: t.Tuple[str, ...]
+    pre: bool
+    output_file: str
+    toxinidir: str
+    custom_compile_command: str
+    slim: bool = False
+    # wheel platforms kept by slimming, besides the interpreter's own
+    slim_platforms: t.Tuple[str, ...] = ()
+    slim_drop_excluded: bool = False
+    # sorted interpreter_info() items, only needed for `digest`
+    interpreter: t.Tuple[t.Tuple[str, t.Optional[str]], ...] = ()
+    # local projects installed by deps, with the digest of their source tree
+    local: Digests = ()
+
+    @property
+    def compile_opts(self) -> t.List[str]:
+        """`opts` followed by an `--extra` option for each of `extras`."""
+        return [*self.opts, *extra_opts(self.extras)]
+
+    @property
+    def digest(self) -> str:
+        """Digest of everything that determines the lock file."""
+        return inputs_digest(
+            deps=self.deps,
+            source_digests=[
+                digest for _, digest in self.sources + self.included + self.local
+            ],
+            options=[
+                f"env={self.envname}",
+                f"custom_compile_command={self.custom_compile_command}",
+                f"pre={self.pre}",
+                *self.compile_opts,
+                *(["slim"] if self.slim else []),
+                *(f"slim_platform={platform}" for platform in self.slim_platforms),
+                *(["slim_drop_excluded"] if self.slim_drop_excluded else []),
+                *(f"{key}={value}" for key, value in self.interpreter),
+            ],
+        )
+
+    @property
+    def options_digest(self) -> str:
+        """Digest of the compile options alone, without deps and sources."""
+        return self._replace(deps=(), sources=(), included=(), local=()).digest
+
+    def args(self, requirements_in: t.Optional[str] = None) -> t.List[str]:
+        """`pip-compile` arguments, reading the deps from `requirements_in`."""
+        args = ["--pre"] if self.pre else []
+        if requirements_in:
+            args.append(requirements_in)
+        return [
+            *args,
+            *(path for path, _ in self.sources),
+            "--output-file",
+            self.output_file,
+            *self.compile_opts,
+        ]
@@ -1,76 +1,70 @@
 """Tox 3 implementation."""
-from argparse import Namespace
-from pathlib import Path
+import logging
+import os
+import time
 import typing as t
 
 from tox import hookimpl  # type: ignore
 from tox.action import Action  # type: ignore
 from tox.config import Config, DepConfig, Parser  # type: ignore
+from tox.exception import InvocationError  # type: ignore
 from tox.venv import VirtualEnv  # type: ignore
 
-from .common import requirements_file, tox_add_argument
-from .compile import PipCompile
+from .common import (
+    ENV_SESSION_ENVS,
+    bundle_path,
+    pins_upgrade,
+    prune_pip_cache_size,
+    requirements_file,
+    session_id,
+    tox_add_argument,
+)
+from .profiling import profiled
 
+logger = logging.getLogger(__name__)
 
-class ShimBase:
-    def __init__(self, *args: t.Any, **kwargs: t.Any):
-        """allow the constructor to ignore arbitrary args"""
+# start time of installing each env from its lock file
+_install_started: t.Dict[str, float] = {}
 
 
-class PipCompileTox3(PipCompile, ShimBase):
-    """Tox 3-specific implementation of PipCompile."""
+def __getattr__(name: str) -> t.Any:
+    # PipCompileTox3 used to be defined here
+    if name == "PipCompileTox3":
+        from . import installer
 
-    def __init__(self, venv: VirtualEnv, action: Action):
-        self.action = action
-        super().__init__(venv)
+        return installer.PipCompileTox3
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    @property
-    def toxinidir(self) -> Path:
-        return Path(self.venv.envconfig.config.toxinidir)
 
-    @property
-    def skipsdist(self) -> bool:
-        return bool(self.venv.envconfig.skip_install) or bool(
-            self.venv.envconfig.config.skipsdist
-        )
+def _compiles(config: Config, envname: str) -> bool:
+    """
+    True if the env is compiled this session.
 
-    @property
-    def envname(self) -> str:
-        return str(self.venv.envconfig.envname)
-
-    @property
-    def options(self) -> Namespace:
-        return t.cast(Namespace, self.venv.envconfig.config.option)
-
-    @property
-    def env_pip_compile_opts_env(self) -> t.Optional[str]:
-        if self.venv.envconfig.pip_compile_opts:
-            return str(self.venv.envconfig.pip_compile_opts)
-        return None
-
-    @property
-    def env_pip_pre(self) -> bool:
-        """[testenv] pip_pre value."""
-        return bool(self.venv.envconfig.pip_pre)
-
-    @property
-    def env_extras(self) -> t.Sequence[str]:  # pragma: no cover
-        """[testenv] extras value."""
-        return [str(extra) for extra in (self.venv.envconfig.extras or [])]
-
-    def execute(
-        self,
-        cmd: t.Sequence[str],
-        run_id: str,
-        env: t.Optional[t.Dict[str, str]] = None,
-    ) -> None:
-        self.action.setactivity(run_id, str(cmd))
-        self.venv._pcall(
-            cmd,
-            cwd=self.venv.path,
-            action=self.action,
-            env=env,
+    That is with --pip-compile, or with --pip-compile-upgrade-package for an
+    env whose lock pins one of the packages.
+    """
+    return bool(config.option.pip_compile) or bool(
+        pins_upgrade(
+            config.option,
+            requirements_file(toxinidir=config.toxinidir, envname=envname),
         )
+    )
+
+
+def _uses_pins(venv: VirtualEnv) -> bool:
+    """True if `venv` compiles or installs from a lock file."""
+    config = venv.envconfig.config
+    envname = str(venv.envconfig.envname)
+    if config.option.ignore_pins or envname.startswith("."):
+        return False
+    return (
+        _compiles(config, envname)
+        or bool(bundle_path(config.option))
+        or requirements_file(
+            toxinidir=config.toxinidir,
+            envname=envname,
+        ).exists()
+    )
 
 
 def _deps(venv: VirtualEnv) -> t.Sequence[DepConfig]:
@@ -97,21 +91,65 @@ def tox_configure(config: Config) -> None:
     """
     Update envconfigs early if env-specific requirements exist.
 
-    Force `--recreate` when `--pip-compile` is specified.
+    Force `--recreate` when `--pip-compile` is specified, or for the envs whose
+    lock pins a package given by `--pip-compile-upgrade-package`.
+
+    Parallel runs start the envs with the longest recorded durations first.
+
+    With --pip-compile-prune-pip-cache, the pip cache is pruned when tox exits.
 
     Note: this is tox3-only functionality!
         In tox4, the virtualenv re-usability check is more robust,
         allowing for just-in-time replacement of deps without
         triggering environment recreation (as long as the deps match).
     """
+    with profiled("tox", "tox_configure"):
+        _configure(config)
+
+
+def _configure(config: Config) -> None:
+    budget = prune_pip_cache_size(config.option)
+    # parallel envs run in tox processes of their own, which must not prune
+    if budget and not os.environ.get("TOX_PARALLEL_ENV"):
+        from . import cache, pipcache
+
+        pipcache.prune_at_exit(
+            cache.parse_size(budget), config.toxinidir, config.toxworkdir
+        )
     if config.option.ignore_pins:
         return
+    if config.option.parallel != 0:
+        # 0 runs sequentially, None without a limit
+        from . import history, metrics
+
+        if config.option.pip_compile_superset and not os.environ.get(
+            "TOX_PARALLEL_ENV"
+        ):
+            logger.warning(
+                "tox-pin-deps: --pip-compile-superset is not supported with tox3 "
+                "-p, resolving each env on its own"
+            )
+
+        config.envlist = history.schedule(
+            config.toxworkdir,
+            config.envlist,
+            phases=history.session_phases(config.option),
+            workers=config.option.parallel,
+        )
+        if not os.environ.get("TOX_PARALLEL_ENV"):
+            # each env's tox process only selects its own env
+            os.environ[ENV_SESSION_ENVS] = ",".join(config.envlist)
+            session_id()
+            # rewrites the metrics of the envs' processes once all have exited
+            metrics.enable(
+                config.option.pip_compile_metrics or os.environ.get(metrics.ENV_METRICS)
+            )
     for envconfig in (
         config.envconfigs[envname]
         for envname in config.envlist
         if not envname.startswith(".")  # avoid "internal" environments
     ):
-        if config.option.pip_compile:
+        if _compiles(config, str(envconfig.envname)):
             # compile mode: --recreate to ensure install_deps will run
             envconfig.recreate = True
         else:
@@ -132,10 +170,43 @@ def tox_testenv_install_deps(venv: VirtualEnv, action: Action) -> None:
     Always returns `None`, so that the default pip install_deps logic will
     run using the new `deps` updated by this plugin.
     """
-    pct3 = PipCompileTox3(venv, action)
-    if pct3.ignore_pins:
-        return
-    pinned_deps_spec = pct3.pip_compile(deps=[str(d) for d in _deps(venv) or []])
-    if pinned_deps_spec:
-        venv.envconfig.deps = [DepConfig(pinned_deps_spec)]
-    return None  # let the next plugin run
+    with profiled(str(venv.envconfig.envname), "tox_testenv_install_deps"):
+        if not _uses_pins(venv):
+            return
+        from .bundle import BundleError
+        from .installer import PipCompileTox3
+        from .preflight import ConflictError
+
+        pct3 = PipCompileTox3(venv, action)
+        try:
+            pinned_deps_spec = pct3.pip_compile(
+                deps=[str(d) for d in _deps(venv) or []]
+            )
+        except (ConflictError, BundleError) as error:
+            # like a failed install: tox reports it and goes on with other envs
+            logger.error("tox-pin-deps: %s", error)
+            raise InvocationError(str(error)) from error
+        if pinned_deps_spec:
+            venv.envconfig.deps = [DepConfig(pinned_deps_spec)]
+            _install_started[pct3.envname] = time.monotonic()
+        return None  # let the next plugin run
+
+
+@hookimpl  # type: ignore
+def tox_runtest_pre(venv: VirtualEnv) -> None:
+    """
+    tox3 entry point: the env is installed.
+
+    tox3 installs the locked deps after `tox_testenv_install_deps` returns, so
+    the install from the lock file is timed up to here.
+    """
+    envname = str(venv.envconfig.envname)
+    started = _install_started.pop(envname, None)
+    if started is not None:
+        from . import history, metrics
+
+        seconds = time.monotonic() - started
+        metrics.observe("install_from_lock_seconds", seconds)
+        history.History(venv.envconfig.config.toxworkdir).record(
+            envname, history.INSTALL, seconds
+        )
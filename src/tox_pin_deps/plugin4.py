@@ -1,127 +1,46 @@
 """Tox 4 implementation."""
-from argparse import Namespace
-from pathlib import Path
 import typing as t
 
-from tox.config.cli.parser import DEFAULT_VERBOSITY, ToxParser
-from tox.execute.request import StdinSource
+from tox.config.cli.parser import ToxParser
+from tox.config.sets import ConfigSet, EnvConfigSet
 from tox.plugin import impl
 from tox.tox_env.api import ToxEnvCreateArgs
-from tox.tox_env.python.api import Python
 from tox.tox_env.python.pip.pip_install import Pip
-from tox.tox_env.python.pip.req_file import PythonDeps
 from tox.tox_env.python.virtual_env.runner import VirtualEnvRunner
 from tox.tox_env.register import ToxEnvRegister
+from tox.session.env_select import CliEnv
+from tox.session.state import State
 
-from .common import tox_add_argument
-from .compile import PipCompile
+from .common import (
+    bundle_path,
+    prune_pip_cache_size,
+    requirements_file,
+    tox_add_argument,
+)
 
+if t.TYPE_CHECKING:  # pragma: no cover
+    from .installer4 import PipCompileInstaller
 
-class PipCompileInstaller(PipCompile, Pip):
-    """tox4 Installer that uses `pip-compile` or env-specific lock files."""
+# testenv configs seen this session, for resolving several envs together
+_env_confs: t.Dict[str, EnvConfigSet] = {}
+# the session state, which knows the envs it runs
+_state: t.Optional[State] = None
 
-    def __init__(self, tox_env: Python, with_list_deps: bool = True):
-        self._installed_from_lock_file = False
-        super().__init__(tox_env, with_list_deps)
 
-    @property
-    def toxinidir(self) -> Path:
-        return Path(self.venv.core["toxinidir"])
-
-    @property
-    def skipsdist(self) -> bool:
-        return bool(
-            self.venv.pkg_type == "skip"
-            or self.venv.core["skipsdist"]
-            or self.venv.conf["skip_install"]
-        )
-
-    @property
-    def envname(self) -> str:
-        return str(self.venv.name)
-
-    @property
-    def options(self) -> Namespace:
-        return t.cast(Namespace, self.venv.options)
-
-    @property
-    def env_pip_compile_opts_env(self) -> t.Optional[str]:
-        pip_compile_opts = self.venv.conf["pip_compile_opts"]
-        if pip_compile_opts:
-            return str(pip_compile_opts)
-        return None
-
-    @property
-    def env_pip_pre(self) -> bool:
-        """[testenv] pip_pre value."""
-        return bool(self.venv.conf["pip_pre"])
-
-    @property
-    def env_extras(self) -> t.Sequence[str]:  # pragma: no cover
-        """[testenv] extras value."""
-        extras = self.venv.conf["extras"] if not self.skipsdist else []
-        return [str(extra) for extra in extras]
+def __getattr__(name: str) -> t.Any:
+    # PipCompileInstaller used to be defined here
+    if name == "PipCompileInstaller":
+        from . import installer4
 
-    @staticmethod
-    def _deps(pydeps: PythonDeps) -> t.Sequence[str]:
-        return pydeps.lines()
-
-    def execute(
-        self,
-        cmd: t.Sequence[str],
-        run_id: str,
-        env: t.Optional[t.Dict[str, str]] = None,
-    ) -> None:
-        orig_env = self.venv.environment_variables.copy()
-        if env:
-            self.venv.environment_variables.update(env)
-        result = self.venv.execute(
-            cmd=cmd,
-            stdin=StdinSource.user_only(),
-            run_id=run_id,
-            show=self.venv.options.verbosity > DEFAULT_VERBOSITY,
-        )
-        if orig_env and env:
-            for key in env:
-                self.venv.environment_variables.pop(key, None)
-            self.venv.environment_variables.update(orig_env)
-        result.assert_success()
-
-    def install(self, arguments: t.Any, section: str, of_type: str) -> None:
-        compile_deps = None
-        if isinstance(arguments, PythonDeps):
-            compile_deps = self._deps(arguments)
-        elif arguments is None:
-            compile_deps = []
-
-        pinned_deps = None
-        if compile_deps is not None:
-            pinned_deps_spec = self.pip_compile(deps=compile_deps)
-            if pinned_deps_spec:
-                pinned_deps = PythonDeps(
-                    raw=pinned_deps_spec,
-                    root=self.env_requirements.parent,
-                )
-                self._installed_from_lock_file = True
-        if self._installed_from_lock_file and of_type == "package":
-            # do not override pinned deps with package requirements
-            try:
-                for item in arguments:
-                    item.deps[:] = []
-            except TypeError:
-                pass  # maybe given something other than a list of packages?
-        super().install(
-            arguments=pinned_deps or arguments,
-            section=section,
-            of_type=of_type,
-        )
+        return installer4.PipCompileInstaller
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class PinDepsVirtualEnvRunner(VirtualEnvRunner):
     """EnvRunner that uses PipCompileInstaller."""
 
     def __init__(self, create_args: ToxEnvCreateArgs):
-        self._installer: t.Optional[PipCompileInstaller] = None
+        self._installer: t.Optional["PipCompileInstaller"] = None
         super().__init__(create_args=create_args)
 
     @staticmethod
@@ -137,9 +56,32 @@ class PinDepsVirtualEnvRunner(VirtualEnvRunner):
             desc="Custom options passed to `pip-compile` when --pip-compile is used",
         )
 
+    @property
+    def uses_pins(self) -> bool:
+        """
+        True if this env compiles or installs from a lock file.
+
+        Other envs use tox's own installer, so the compile machinery is never
+        imported for them.
+        """
+        if self.options.ignore_pins or self.name.startswith("."):
+            return False
+        return (
+            bool(self.options.pip_compile)
+            or bool(bundle_path(self.options))
+            or requirements_file(
+                toxinidir=self.core["toxinidir"],
+                envname=self.name,
+            ).exists()
+        )
+
     @property
     def installer(self) -> Pip:
+        if not self.uses_pins:
+            return super().installer
         if self._installer is None:
+            from .installer4 import PipCompileInstaller
+
             self._installer = PipCompileInstaller(self)
         return self._installer
 
@@ -149,6 +91,72 @@ def tox_add_option(parser: ToxParser) -> None:
     tox_add_argument(parser)
 
 
+@impl
+def tox_add_core_config(core_conf: ConfigSet, state: State) -> None:
+    """
+    tox4 entry point: start parallel envs with the longest recorded durations first.
+
+    With --pip-compile-prune-pip-cache, the pip cache is pruned when tox exits.
+    """
+    options = state.conf.options
+    if getattr(options, "parallel", 0) != 0:
+        from . import profiling
+
+        profiling.disable("as tox -p runs envs in threads")
+    budget = prune_pip_cache_size(options)
+    if budget:
+        from . import cache, pipcache
+
+        pipcache.prune_at_exit(
+            cache.parse_size(budget), core_conf["tox_root"], core_conf["work_dir"]
+        )
+    envs = getattr(options, "env", None)
+    if (
+        options.ignore_pins
+        # 0 runs sequentially, None without a limit
+        or getattr(options, "parallel", 0) == 0
+        or envs is None
+        or envs.is_all
+        or getattr(options, "labels", None)
+        or getattr(options, "factors", None)
+    ):
+        return
+    from . import history
+
+    envnames = list(envs) if envs else [str(name) for name in core_conf["env_list"]]
+    ordered = history.schedule(
+        core_conf["work_dir"],
+        envnames,
+        phases=history.session_phases(options),
+        workers=options.parallel,
+    )
+    if ordered != envnames:
+        options.env = CliEnv(ordered)
+
+
+def session_env_confs() -> t.Dict[str, EnvConfigSet]:
+    """
+    Configs of the testenvs that this session runs, except "." envs.
+
+    tox configures every env it defines, not only the selected ones.
+    """
+    if _state is None:
+        return dict(_env_confs)
+    active = set(_state.envs.iter(only_active=True))
+    return {name: conf for name, conf in _env_confs.items() if name in active}
+
+
+@impl
+def tox_add_env_config(env_conf: EnvConfigSet, state: State) -> None:
+    """tox4 entry point: remember testenv configs for --pip-compile-superset."""
+    global _state
+    if "pip_compile_opts" in env_conf:
+        name = str(env_conf["env_name"])
+        if not name.startswith("."):
+            _env_confs[name] = env_conf
+            _state = state
+
+
 @impl
 def tox_register_tox_env(register: ToxEnvRegister) -> None:
     """tox4 entry point: set PinDepsVirtualEnvRunner as default_env_runner."""
@@ -0,0 +1,100 @@
+"""Warm pip's cache with the packages pinned in an existing lock file."""
+import os
+from pathlib import Path
+import subprocess
+import tempfile
+import typing as t
+
+from .lockfile import LockEntry
+
+# options forwarded from pip-compile to `pip download` so the same index is used
+INDEX_OPTS_WITH_VALUE = {
+    "-i",
+    "--index-url",
+    "--extra-index-url",
+    "-f",
+    "--find-links",
+    "--trusted-host",
+    "--cert",
+    "--client-cert",
+}
+INDEX_OPTS_FLAGS = {"--pre", "--no-index"}
+
+
+def index_opts(pip_compile_opts: t.Iterable[str]) -> t.List[str]:
+    """Extract the options from `pip_compile_opts` that select the package index."""
+    opts: t.List[str] = []
+    take_next = False
+    for opt in pip_compile_opts:
+        if take_next:
+            opts.append(opt)
+            take_next = False
+        elif opt in INDEX_OPTS_WITH_VALUE:
+            opts.append(opt)
+            take_next = True
+        elif opt.partition("=")[0] in INDEX_OPTS_WITH_VALUE or opt in INDEX_OPTS_FLAGS:
+            opts.append(opt)
+    return opts
+
+
+def prefetch_requirements(entries: t.Iterable[LockEntry]) -> t.List[str]:
+    """
+    The pinned `name==version` requirements that can be fetched from an index.
+
+    Markers are kept, so pins for other platforms are skipped rather than
+    failing the download.
+    """
+    return [
+        f"{entry.pin} ; {entry.markers}" if entry.markers else entry.pin
+        for entry in entries
+        if entry.version is not None
+    ]
+
+
+def prefetch(
+    python: t.Union[str, Path],
+    requirements: t.Sequence[str],
+    dest: t.Union[str, Path],
+    pip_opts: t.Sequence[str] = (),
+    env: t.Optional[t.Mapping[str, str]] = None,
+) -> bool:
+    """
+    `pip download` all `requirements` in one run, without dependencies.
+
+    pip fetches the index pages of all requirements before downloading any,
+    and stores them and the artifacts in its HTTP cache. The resolver run by
+    `pip-compile` shares that cache, so a subsequent resolution finds most of
+    its network requests already answered.
+
+    Prefetching is best-effort: failures are not raised.
+
+    :return: False if pip failed, e.g. on a pin the index no longer has
+    """
+    if not requirements:
+        return True
+    with tempfile.NamedTemporaryFile(
+        "w", prefix=".prefetch.", suffix=".txt", dir=dest, delete=False
+    ) as f:
+        f.write("\n".join(requirements) + "\n")
+    try:
+        result = subprocess.run(
+            [
+                str(python),
+                "-m",
+                "pip",
+                "download",
+                "--no-deps",
+                "--quiet",
+                "--dest",
+                str(dest),
+                *pip_opts,
+                "-r",
+                f.name,
+            ],
+            env=dict(env) if env is not None else None,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    finally:
+        os.unlink(f.name)
+    return result.returncode == 0
@@ -0,0 +1,187 @@
+"""
+Find contradictory direct requirements before running the resolver.
+
+pip-compile only fails on requirements that cannot both hold, such as
+`attrs<22` in `deps` and `attrs>=22` in the package's dependencies, after
+fetching metadata and backtracking. The specifiers that `deps`, the files it
+includes and the static dist requirements place on each project are
+intersected here as version ranges, which takes no index access at all.
+
+The check only reports what no release can satisfy: requirements with markers
+or `===` are not checked, and a `!=` only conflicts with a single pinned version.
+"""
+from pathlib import Path
+import typing as t
+
+from .lockfile import canonical_name
+from .satisfy import DIST_SOURCE, RequirementLine, requirement_lines
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from packaging.version import Version
+
+
+class Bound(t.NamedTuple):
+    """One end of the versions allowed by a requirement."""
+
+    version: "Version"
+    inclusive: bool
+    # the requirement line, and where it comes from
+    requirement: str
+    source: str
+
+
+class Conflict(t.NamedTuple):
+    """Two requirements on a project that no version satisfies together."""
+
+    name: str
+    first: t.Tuple[str, str]
+    second: t.Tuple[str, str]
+
+    def __str__(self) -> str:
+        (first, first_source), (second, second_source) = self.first, self.second
+        if self.first == self.second:
+            return f"{first} ({first_source}) cannot be satisfied"
+        return f"{first} ({first_source}) conflicts with {second} ({second_source})"
+
+
+class ConflictError(Exception):
+    """The direct requirements of an env contradict each other."""
+
+    def __init__(self, envname: str, conflicts: t.Sequence[Conflict]):
+        self.conflicts = list(conflicts)
+        super().__init__(
+            f"{envname}: conflicting requirements: "
+            + "; ".join(str(conflict) for conflict in self.conflicts)
+        )
+
+
+def _next_release(release: t.Sequence[int]) -> "Version":
+    """The lowest version above every version with the `release` prefix."""
+    from packaging.version import Version
+
+    bumped = [*release[:-1], release[-1] + 1]
+    return Version(".".join(str(part) for part in bumped) + ".dev0")
+
+
+def _bounds(
+    operator: str,
+    version: str,
+) -> t.Tuple[t.Optional["Version"], bool, t.Optional["Version"], bool]:
+    """The lower and upper bounds, with inclusiveness, of one specifier clause."""
+    from packaging.version import Version
+
+    if operator == "==" and version.endswith(".*"):
+        prefix = Version(version[:-2])
+        return Version(f"{prefix}.dev0"), True, _next_release(prefix.release), False
+    parsed = Version(version)
+    if operator == "==":
+        return parsed, True, parsed, True
+    if operator == ">=":
+        return parsed, True, None, False
+    if operator == ">":
+        return parsed, False, None, False
+    if operator == "<=":
+        return None, False, parsed, True
+    if operator == "<":
+        return None, False, parsed, False
+    if operator == "~=":
+        return parsed, True, _next_release(parsed.release[:-1]), False
+    return None, False, None, False
+
+
+def _lower_key(bound: Bound) -> t.Tuple["Version", bool]:
+    # of two equal lower bounds the exclusive one is tighter
+    return bound.version, not bound.inclusive
+
+
+def _upper_key(bound: Bound) -> t.Tuple["Version", bool]:
+    return bound.version, bound.inclusive
+
+
+def find_conflicts(lines: t.Iterable[RequirementLine]) -> t.List[Conflict]:
+    """
+    The projects whose requirements in `lines` no version satisfies.
+
+    Constraint lines only count for projects that a requirement line names.
+    """
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.version import InvalidVersion, Version
+
+    lowers: t.Dict[str, Bound] = {}
+    uppers: t.Dict[str, Bound] = {}
+    excluded: t.Dict[str, t.List[Bound]] = {}
+    required: t.Set[str] = set()
+    unchecked: t.Set[str] = set()
+    for line, source, constraint in lines:
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            continue
+        name = canonical_name(requirement.name)
+        if not constraint:
+            required.add(name)
+        if requirement.marker is not None or requirement.url:
+            continue
+        for spec in requirement.specifier:
+            try:
+                low, low_inclusive, high, high_inclusive = _bounds(
+                    spec.operator, spec.version
+                )
+            except InvalidVersion:
+                unchecked.add(name)
+                continue
+            if spec.operator == "===":
+                unchecked.add(name)
+            elif spec.operator == "!=" and not spec.version.endswith(".*"):
+                excluded.setdefault(name, []).append(
+                    Bound(Version(spec.version), True, line, source)
+                )
+            if low is not None:
+                bound = Bound(low, low_inclusive, line, source)
+                if name not in lowers or _lower_key(bound) > _lower_key(lowers[name]):
+                    lowers[name] = bound
+            if high is not None:
+                bound = Bound(high, high_inclusive, line, source)
+                if name not in uppers or _upper_key(bound) < _upper_key(uppers[name]):
+                    uppers[name] = bound
+    conflicts = []
+    for name in sorted(required - unchecked):
+        low_bound, high_bound = lowers.get(name), uppers.get(name)
+        if low_bound is None or high_bound is None:
+            continue
+        pair = (
+            (low_bound.requirement, low_bound.source),
+            (high_bound.requirement, high_bound.source),
+        )
+        if low_bound.version > high_bound.version or (
+            low_bound.version == high_bound.version
+            and not (low_bound.inclusive and high_bound.inclusive)
+        ):
+            conflicts.append(Conflict(name, *pair))
+        elif low_bound.version == high_bound.version:
+            for exclusion in excluded.get(name, ()):
+                if exclusion.version == low_bound.version:
+                    conflicts.append(
+                        Conflict(
+                            name,
+                            pair[0],
+                            (exclusion.requirement, exclusion.source),
+                        )
+                    )
+                    break
+    return conflicts
+
+
+def preflight(
+    deps: t.Iterable[str],
+    root: t.Union[str, Path],
+    dist: t.Optional[t.Iterable[str]] = None,
+) -> t.List[Conflict]:
+    """
+    The conflicts between `deps`, the files it includes, and `dist`.
+
+    :param dist: the static requirements of the local package, if known
+    """
+    lines = requirement_lines(deps, root) or []
+    lines.extend(RequirementLine(line, DIST_SOURCE, False) for line in dist or ())
+    return find_conflicts(lines)
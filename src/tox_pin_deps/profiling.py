@@ -0,0 +1,147 @@
+"""
+Optional cProfile instrumentation of the plugin's hooks and compile phases.
+
+Set TOX_PIN_DEPS_PROFILE to a directory to write a `.pstats` file per env and
+phase, and a `summary.txt` of the top functions across all phases when the
+session ends.
+
+cProfile can only profile one thread at a time, and on Python 3.12+ it sees
+every thread. When tox4 runs envs in threads (`tox -p`), profiling is turned
+off; otherwise only the first thread to start a phase is profiled until its
+phases end.
+"""
+import atexit
+import contextlib
+import io
+import logging
+import os
+from pathlib import Path
+import threading
+import typing as t
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import cProfile
+
+ENV_PROFILE = "TOX_PIN_DEPS_PROFILE"
+ENV_PROFILE_TOP = "TOX_PIN_DEPS_PROFILE_TOP"
+DEFAULT_PROFILE_TOP = 30
+SUMMARY_FILE = "summary.txt"
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+_written: t.List[Path] = []
+# the thread being profiled
+_owner: t.Optional[int] = None
+_disabled = False
+
+
+def profile_dir() -> t.Optional[Path]:
+    """Directory for profiles, when profiling is enabled."""
+    directory = os.environ.get(ENV_PROFILE)
+    return Path(directory) if directory and not _disabled else None
+
+
+def disable(reason: str) -> None:
+    """Turn profiling off for the rest of the session."""
+    global _disabled
+    if profile_dir() is not None:
+        logger.warning("tox-pin-deps: %s is ignored, %s", ENV_PROFILE, reason)
+    _disabled = True
+
+
+def _acquire() -> bool:
+    """True if the current thread may profile."""
+    global _owner
+    with _lock:
+        if _owner is None:
+            _owner = threading.get_ident()
+        return _owner == threading.get_ident()
+
+
+def _release() -> None:
+    global _owner
+    with _lock:
+        _owner = None
+
+
+def _stack() -> t.List["cProfile.Profile"]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return t.cast(t.List["cProfile.Profile"], _local.stack)
+
+
+def _output_path(directory: Path, envname: str, phase: str) -> Path:
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in envname)
+    with _lock:
+        path = directory / f"{safe_name}.{phase}.pstats"
+        n = 1
+        while path in _written or path.exists():
+            n += 1
+            path = directory / f"{safe_name}.{phase}.{n}.pstats"
+        if not _written:
+            atexit.register(write_summary)
+        _written.append(path)
+    return path
+
+
+@contextlib.contextmanager
+def profiled(envname: str, phase: str) -> t.Iterator[None]:
+    """
+    Profile the enclosed block as `phase` of `envname`, if profiling is enabled.
+
+    Phases may nest: the outer profile is paused while an inner phase runs, so
+    each `.pstats` file only holds the time spent directly in its own phase.
+    """
+    directory = profile_dir()
+    if directory is None or not _acquire():
+        yield
+        return
+    import cProfile  # only loaded when profiling
+
+    stack = _stack()
+    if stack:
+        stack[-1].disable()
+    profiler = cProfile.Profile()
+    stack.append(profiler)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        stack.pop()
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(_output_path(directory, envname, phase)))
+        if stack:
+            stack[-1].enable()
+        else:
+            _release()
+
+
+def summary(paths: t.Sequence[Path], top: int = DEFAULT_PROFILE_TOP) -> str:
+    """Total time per profile, and the top functions across all profiles."""
+    import pstats
+
+    out = io.StringIO()
+    out.write("Time per env and phase:\n")
+    for path in paths:
+        stats = pstats.Stats(str(path))
+        out.write(f"  {stats.total_tt:10.3f}s  {path.name}\n")  # type: ignore
+    out.write(f"\nTop {top} functions by cumulative time:\n")
+    stats = pstats.Stats(*(str(p) for p in paths), stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return out.getvalue()
+
+
+def write_summary() -> t.Optional[Path]:
+    """Write `summary.txt` for the profiles written during this session."""
+    directory = profile_dir()
+    with _lock:
+        paths = [p for p in _written if p.exists()]
+    if directory is None or not paths:
+        return None
+    top = int(os.environ.get(ENV_PROFILE_TOP) or DEFAULT_PROFILE_TOP)
+    summary_path = directory / SUMMARY_FILE
+    summary_path.write_text(summary(paths, top=top))
+    return summary_path
@@ -0,0 +1,214 @@
+"""
+Check whether an existing lock still satisfies an env's requirements.
+
+Many edits to `deps` loosen a requirement, or add a bound the pinned version
+already meets. When every requirement that applies to the env is met by a
+pin, and the lock's `# via` annotations show that every pin is still reached
+from a requirement, the lock can be kept without running the resolver.
+"""
+from pathlib import Path
+import sys
+import typing as t
+
+from .inputs import _requirement_file_refs
+from .lockfile import LockEntry, canonical_name
+from .superset import project
+
+CONSTRAINT_OPTS = ("-c", "--constraint")
+DIST_SOURCE = "pyproject.toml"
+
+
+class Requirements(t.NamedTuple):
+    """Requirement lines, and constraint lines that only restrict pins."""
+
+    requirements: t.List[str]
+    constraints: t.List[str]
+
+
+def _strip_comment(line: str) -> str:
+    return line.partition(" #")[0].strip()
+
+
+class RequirementLine(t.NamedTuple):
+    """A line of `deps`, or of a file included by it."""
+
+    line: str
+    # "deps", or the path of the included file
+    source: str
+    # True if included with `-c`
+    constraint: bool
+
+
+def requirement_lines(
+    deps: t.Iterable[str],
+    root: t.Union[str, Path],
+) -> t.Optional[t.List[RequirementLine]]:
+    """
+    The lines of `deps` and of the files it includes with `-r` / `-c`.
+
+    Comments, blank lines, and the `-r` / `-c` lines themselves are left out.
+
+    :return: None if an included file cannot be read
+    """
+    found = []
+    seen: t.Set[Path] = set()
+    pending = [(line, Path(root), "deps", False) for line in deps]
+    while pending:
+        raw_line, base, source, constraint = pending.pop(0)
+        line = _strip_comment(raw_line)
+        if not line or line.startswith("#"):
+            continue
+        refs = _requirement_file_refs(line) if line.startswith("-") else []
+        if not refs:
+            found.append(RequirementLine(line, source, constraint))
+            continue
+        for ref in refs:
+            path = Path(base, ref)
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                lines = path.read_text().splitlines()
+            except OSError:
+                return None
+            is_constraint = constraint or line.startswith(CONSTRAINT_OPTS)
+            pending.extend(
+                (included, path.parent, str(path), is_constraint) for included in lines
+            )
+    return found
+
+
+def deps_requirements(
+    deps: t.Iterable[str],
+    root: t.Union[str, Path],
+) -> t.Optional[Requirements]:
+    """
+    The requirement and constraint lines of `deps`, following `-r` / `-c`.
+
+    :return: None if `deps` has a line that cannot be checked against pins,
+        such as an option, an editable install, a URL, or a missing file
+    """
+    from packaging.requirements import InvalidRequirement, Requirement
+
+    lines = requirement_lines(deps, root)
+    if lines is None:
+        return None
+    found = Requirements([], [])
+    for line, _, constraint in lines:
+        if line.startswith("-"):
+            return None
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            return None
+        if requirement.url:
+            return None
+        (found.constraints if constraint else found.requirements).append(line)
+    return found
+
+
+def _load_toml(text: str) -> t.Dict[str, t.Any]:
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:  # pragma: no cover
+        import tomli as tomllib
+    return tomllib.loads(text)
+
+
+def dist_requirements(
+    sources: t.Iterable[t.Union[str, Path]],
+    extras: t.Iterable[str] = (),
+) -> t.Optional[t.List[str]]:
+    """
+    The requirements of the local package with `extras`.
+
+    Only static `[project]` metadata in pyproject.toml can be read.
+
+    :return: None if a source declares its requirements some other way
+    """
+    requirements: t.List[str] = []
+    for source in sources:
+        if Path(source).name != DIST_SOURCE:
+            return None
+        try:
+            metadata = _load_toml(Path(source).read_text()).get("project")
+        except (ImportError, OSError, ValueError):
+            return None
+        if not isinstance(metadata, dict):
+            return None
+        dynamic = metadata.get("dynamic", ())
+        extras = list(extras)
+        if "dependencies" in dynamic or (extras and "optional-dependencies" in dynamic):
+            return None
+        requirements.extend(metadata.get("dependencies", ()))
+        optional = metadata.get("optional-dependencies", {})
+        for extra in extras:
+            requirements.extend(optional.get(extra, ()))
+    return requirements
+
+
+def _applies(marker: t.Any, environment: t.Mapping[str, str]) -> bool:
+    from packaging.markers import UndefinedEnvironmentName
+
+    if marker is None:
+        return True
+    try:
+        return bool(marker.evaluate({**environment, "extra": ""}))
+    except UndefinedEnvironmentName:
+        return True
+
+
+def unsatisfied(
+    requirements: Requirements,
+    entries: t.Sequence[LockEntry],
+    environment: t.Mapping[str, str],
+) -> t.List[str]:
+    """
+    Why the pins of `entries` no longer satisfy `requirements`.
+
+    Requirements whose markers exclude `environment` are skipped. Besides
+    unmet requirements, pins that no requirement reaches through the `# via`
+    annotations are reported, since a resolution would drop them.
+
+    :return: an empty list if the lock satisfies every requirement
+    """
+    from packaging.markers import Marker
+    from packaging.requirements import Requirement
+
+    pins = {entry.name: entry for entry in entries}
+    problems = []
+    roots = set()
+    for line in requirements.requirements:
+        requirement = Requirement(line)
+        if not _applies(requirement.marker, environment):
+            continue
+        name = canonical_name(requirement.name)
+        roots.add(name)
+        entry = pins.get(name)
+        if entry is None or entry.version is None:
+            problems.append(f"{line}: not pinned")
+        elif not requirement.specifier.contains(entry.version, prereleases=True):
+            problems.append(f"{line}: pinned {entry.version}")
+        elif not requirement.extras <= Requirement(entry.requirement).extras:
+            problems.append(f"{line}: pinned without extras")
+        elif entry.markers and not _applies(Marker(entry.markers), environment):
+            problems.append(f"{line}: pinned only for {entry.markers}")
+    for line in requirements.constraints:
+        requirement = Requirement(line)
+        entry = pins.get(canonical_name(requirement.name))
+        if (
+            entry is not None
+            and entry.version is not None
+            and _applies(requirement.marker, environment)
+            and not requirement.specifier.contains(entry.version, prereleases=True)
+        ):
+            problems.append(f"{line}: pinned {entry.version}")
+    if any(not entry.via for entry in entries):
+        return [*problems, "lock has no `# via` annotations"]
+    reached = {entry.name for entry in project(entries, roots)}
+    problems.extend(
+        f"{entry.name}: no longer required"
+        for entry in entries
+        if entry.name not in reached
+    )
+    return problems
@@ -0,0 +1,214 @@
+"""
+Split `--pip-compile` across CI nodes, and merge the results.
+
+Envs are assigned to shards longest first, each to the shard with the least
+expected compile time so far, so every node finishes at about the same time.
+The assignment only depends on the selected env names and the compile times
+in the history store (see `history`), so nodes sharing a history, or having
+none, compute the same one.
+
+Each node records its shard and the envs it compiled in a manifest next to the
+lock files; `merge` checks the manifests of all shards before copying their
+locks into place. A manifest is started over by each tox session, and updated
+under a file lock, as tox3 runs each env of `tox -p` in a process of its own.
+"""
+import contextlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import typing as t
+
+from .common import session_id
+from .lockfile import sidecar_path
+
+MANIFEST_FILE = ".shard.json"
+LOCK_FILE = "shard.lock"
+# assumed compile time of envs without a recorded duration
+DEFAULT_DURATION = 60.0
+
+_lock = threading.Lock()
+
+
+class Shard(t.NamedTuple):
+    """Shard `number` (1-based) of `total`."""
+
+    number: int
+    total: int
+
+    def __str__(self) -> str:
+        return f"{self.number}/{self.total}"
+
+
+def parse_shard(spec: t.Optional[str]) -> t.Optional[Shard]:
+    """Parse `K/N`, or return None when no shard was given."""
+    if not spec:
+        return None
+    index, sep, count = spec.partition("/")
+    try:
+        shard = Shard(int(index), int(count))
+    except ValueError:
+        shard = None
+    if not sep or shard is None or not 1 <= shard.number <= shard.total:
+        raise ValueError(f"Invalid shard {spec!r}, expected K/N with 1 <= K <= N")
+    return shard
+
+
+def _read_json(path: Path) -> t.Dict[str, t.Any]:
+    try:
+        return t.cast(t.Dict[str, t.Any], json.loads(path.read_text()))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: t.Mapping[str, t.Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def _locked(lock_dir: t.Optional[Path]) -> t.Iterator[None]:
+    """Serialize updates across threads, and tox processes if `lock_dir` is given."""
+    with _lock:
+        if lock_dir is None:
+            yield
+            return
+        from filelock import FileLock  # installed with tox
+
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        with FileLock(str(lock_dir / LOCK_FILE)):
+            yield
+
+
+def assign(
+    envnames: t.Iterable[str],
+    durations: t.Mapping[str, float],
+    count: int,
+) -> t.Dict[str, int]:
+    """Map each env to a shard index (1-based), balancing expected durations."""
+    envnames = sorted(set(envnames))
+    known = [durations[e] for e in envnames if e in durations]
+    default = sum(known) / len(known) if known else DEFAULT_DURATION
+    cost = {e: durations.get(e, default) for e in envnames}
+    loads = [0.0] * count
+    assignment = {}
+    for envname in sorted(envnames, key=lambda e: (-cost[e], e)):
+        index = loads.index(min(loads))
+        loads[index] += cost[envname]
+        assignment[envname] = index + 1
+    return assignment
+
+
+def record_compiled(
+    requirements_directory: t.Union[str, Path],
+    shard: Shard,
+    assignment: t.Mapping[str, int],
+    envname: str,
+    lock_dir: t.Optional[Path] = None,
+) -> None:
+    """
+    Add `envname` to the manifest of the envs compiled by `shard`.
+
+    A manifest of another session, shard or assignment is started over.
+
+    :param lock_dir: where to keep the file lock, when other tox processes of
+        the session may record concurrently
+    """
+    path = Path(requirements_directory, MANIFEST_FILE)
+    with _locked(lock_dir):
+        manifest = _read_json(path)
+        current = {
+            "session": session_id(),
+            "shard": [shard.number, shard.total],
+            "assignment": dict(assignment),
+        }
+        if any(manifest.get(key) != value for key, value in current.items()):
+            manifest = {**current, "compiled": []}
+        if envname not in manifest["compiled"]:
+            manifest["compiled"] = sorted([*manifest["compiled"], envname])
+        _write_json(path, manifest)
+
+
+def merge(
+    shard_directories: t.Sequence[t.Union[str, Path]],
+    requirements_directory: t.Union[str, Path],
+) -> t.List[str]:
+    """
+    Copy the locks compiled by each shard into `requirements_directory`.
+
+    Nothing is copied unless the manifests agree on the shard count and the
+    assignment, every shard is present once, and every assigned env was
+    compiled by its own shard and no other.
+
+    :return: problems found; empty if the merge succeeded
+    """
+    problems = []
+    manifests = {}
+    for directory in shard_directories:
+        manifest = _read_json(Path(directory, MANIFEST_FILE))
+        if not manifest:
+            problems.append(f"{directory}: no {MANIFEST_FILE}")
+            continue
+        shard = Shard(*manifest["shard"])
+        if shard in manifests:
+            problems.append(f"{directory}: shard {shard} given twice")
+            continue
+        manifests[shard] = (Path(directory), manifest)
+    counts = {shard.total for shard in manifests}
+    if len(counts) > 1:
+        problems.append(f"shard counts differ: {sorted(counts)}")
+    assignments = {
+        json.dumps(manifest["assignment"], sort_keys=True)
+        for _, manifest in manifests.values()
+    }
+    if len(assignments) > 1:
+        problems.append("shards computed different assignments")
+    if not manifests and not problems:
+        problems.append("no shards given")
+    if problems:
+        return problems
+    count = counts.pop()
+    for index in range(1, count + 1):
+        if Shard(index, count) not in manifests:
+            problems.append(f"shard {index}/{count} missing")
+    compiled_by: t.Dict[str, t.List[Shard]] = {}
+    for shard, (directory, manifest) in sorted(manifests.items()):
+        for envname in manifest["compiled"]:
+            compiled_by.setdefault(envname, []).append(shard)
+            if not Path(directory, f"{envname}.txt").exists():
+                problems.append(f"{envname}: lock missing from shard {shard}")
+    assignment: t.Dict[str, int] = next(iter(manifests.values()))[1]["assignment"]
+    for envname, index in sorted(assignment.items()):
+        shards = compiled_by.get(envname, [])
+        if len(shards) > 1:
+            problems.append(
+                f"{envname}: compiled by {len(shards)} shards "
+                f"({', '.join(str(s) for s in shards)})"
+            )
+        elif not shards and Shard(index, count) in manifests:
+            problems.append(f"{envname}: not compiled by shard {index}/{count}")
+    for envname in sorted(set(compiled_by) - set(assignment)):
+        problems.append(f"{envname}: compiled but not assigned to any shard")
+    if problems:
+        return problems
+    requirements_directory = Path(requirements_directory)
+    requirements_directory.mkdir(parents=True, exist_ok=True)
+    for _, (directory, manifest) in sorted(manifests.items()):
+        for envname in manifest["compiled"]:
+            lock = Path(directory, f"{envname}.txt")
+            dest = requirements_directory / lock.name
+            if not dest.exists() or not lock.samefile(dest):
+                shutil.copyfile(lock, dest)
+                if sidecar_path(lock).exists():
+                    shutil.copyfile(sidecar_path(lock), sidecar_path(dest))
+    return []
@@ -0,0 +1,196 @@
+"""
+Drop the parts of a lock file that an env can never install.
+
+`pip-compile --generate-hashes` records the hash of every artifact of every
+pin: wheels for all platforms and interpreters, and the sdist. Slimming keeps
+only the hashes of the sdist and of wheels whose tags the target supports: the
+env's interpreter, on its own platform and on any extra target platforms.
+Entries whose markers exclude the env's interpreter are meant for another
+platform, so they are kept as they are unless asked to drop them. pip
+installs the same artifacts from the slim lock, and can still verify them in
+hash-checking mode.
+
+Hashes are matched to artifacts using the project pages of the package index;
+hashes the index does not list are kept.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
+from pathlib import Path
+import subprocess
+import typing as t
+
+from .lockfile import (
+    LockEntry,
+    lock_editables,
+    lock_header,
+    lock_options,
+    parse_lock,
+    render_lock,
+)
+from .outdated import DEFAULT_WORKERS, IndexClient, Link
+
+TARGET_SCRIPT = """
+import json
+try:
+    from pip._vendor.packaging import markers, tags
+except ImportError:
+    from packaging import markers, tags
+print(json.dumps({
+    "tags": [str(tag) for tag in tags.sys_tags()],
+    "markers": markers.default_environment(),
+}))
+"""
+
+
+class Target(t.NamedTuple):
+    """What an env's interpreter can install."""
+
+    tags: t.FrozenSet[str]
+    markers: t.Dict[str, str]
+
+
+class SlimResult(t.NamedTuple):
+    entries: t.List[LockEntry]
+    hashes_removed: int
+    entries_removed: int
+
+
+def interpreter_target(
+    python: t.Union[str, Path],
+    env: t.Optional[t.Mapping[str, str]] = None,
+) -> Target:
+    """The supported wheel tags and marker environment of `python`."""
+    result = subprocess.run(
+        [str(python), "-c", TARGET_SCRIPT],
+        env=dict(env) if env is not None else None,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    data = json.loads(result.stdout)
+    return Target(tags=frozenset(data["tags"]), markers=data["markers"])
+
+
+def with_platforms(target: Target, platforms: t.Iterable[str]) -> Target:
+    """`target` also installing the wheels built for each of `platforms`."""
+    interpreters = {tag.rsplit("-", 1)[0] for tag in target.tags}
+    return target._replace(
+        tags=target.tags
+        | {
+            f"{interpreter}-{platform}"
+            for interpreter in interpreters
+            for platform in platforms
+        }
+    )
+
+
+def wheel_tags(filename: str) -> t.Set[str]:
+    """The tags of a wheel file name, expanding compressed tag sets."""
+    parts = filename[: -len(".whl")].split("-")
+    if len(parts) < 5:
+        return set()
+    pythons, abis, platforms = parts[-3:]
+    return {
+        f"{python}-{abi}-{platform}"
+        for python in pythons.split(".")
+        for abi in abis.split(".")
+        for platform in platforms.split(".")
+    }
+
+
+def _installable(link: Link, target: Target) -> bool:
+    if link.filename.endswith(".whl"):
+        return not wheel_tags(link.filename).isdisjoint(target.tags)
+    # an sdist or other source archive can be built anywhere
+    return True
+
+
+def markers_match(markers: t.Optional[str], target: Target) -> bool:
+    """False only if `markers` certainly exclude `target`."""
+    if not markers:
+        return True
+    from packaging.markers import InvalidMarker, Marker, UndefinedEnvironmentName
+
+    try:
+        return bool(Marker(markers).evaluate({**target.markers, "extra": ""}))
+    except (InvalidMarker, UndefinedEnvironmentName):
+        return True
+
+
+def slim_entries(
+    entries: t.Iterable[LockEntry],
+    target: Target,
+    links: t.Mapping[str, t.Sequence[Link]],
+    drop_excluded: bool = False,
+) -> SlimResult:
+    """
+    Prune the hashes of `entries` that `target` cannot install.
+
+    Entries whose markers exclude `target` are kept unchanged, or dropped
+    with `drop_excluded`.
+
+    :param links: the index's files of each package name
+    """
+    slim = []
+    hashes_removed = entries_removed = 0
+    for entry in entries:
+        if not markers_match(entry.markers, target):
+            if drop_excluded:
+                entries_removed += 1
+            else:
+                slim.append(entry)
+            continue
+        if not entry.hashes:
+            slim.append(entry)
+            continue
+        by_hash = {link.hash: link for link in links.get(entry.name, ()) if link.hash}
+        kept = tuple(
+            h
+            for h in entry.hashes
+            if h not in by_hash or _installable(by_hash[h], target)
+        )
+        if not kept:
+            # nothing installable: leave the entry for pip to report
+            kept = entry.hashes
+        hashes_removed += len(entry.hashes) - len(kept)
+        slim.append(entry._replace(hashes=kept))
+    return SlimResult(
+        entries=slim,
+        hashes_removed=hashes_removed,
+        entries_removed=entries_removed,
+    )
+
+
+def _links(client: IndexClient, name: str) -> t.List[Link]:
+    try:
+        return client.links(name)
+    except OSError:
+        # without the index's file list, every hash of `name` is kept
+        return []
+
+
+def slim_lock(
+    path: t.Union[str, Path],
+    target: Target,
+    client: IndexClient,
+    drop_excluded: bool = False,
+) -> SlimResult:
+    """Rewrite the lock file at `path` without what `target` cannot install."""
+    path = Path(path)
+    text = path.read_text()
+    entries = parse_lock(text)
+    names = sorted({entry.name for entry in entries if entry.hashes})
+    with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as executor:
+        links = dict(zip(names, executor.map(functools.partial(_links, client), names)))
+    result = slim_entries(entries, target, links, drop_excluded=drop_excluded)
+    if result.hashes_removed or result.entries_removed:
+        path.write_text(
+            render_lock(
+                result.entries,
+                header=lock_header(text),
+                options=lock_options(text),
+                editables=lock_editables(text),
+            )
+        )
+    return result
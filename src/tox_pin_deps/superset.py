@@ -0,0 +1,200 @@
+"""
+Resolve the union of several testenvs' deps once and project per-env locks.
+
+Testenvs which share an interpreter and compile options can share a single
+`pip-compile` run: the union of their deps is resolved, and each env's lock is
+the subset of the result reachable from that env's own requirements, following
+the `# via` annotations in the superset lock.
+"""
+from collections import defaultdict
+import hashlib
+import itertools
+from pathlib import Path
+import re
+import threading
+import typing as t
+
+from .common import DIST_REQUIREMENTS_SOURCES
+from .lockfile import LockEntry, canonical_name
+
+REQUIREMENT_NAME = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:$|[\[;@<>=!~(\s])")
+
+_group_locks: t.Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_failed_groups: t.Set[str] = set()
+_projected: t.Set[Path] = set()
+
+
+def group_key(*parts: t.Any) -> str:
+    """A stable identifier for testenvs which may share a resolution."""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+
+
+def group_lock(key: str) -> threading.Lock:
+    """Serialize superset resolution of the same group across parallel testenvs."""
+    return _group_locks[key]
+
+
+def mark_failed(key: str) -> None:
+    _failed_groups.add(key)
+
+
+def is_failed(key: str) -> bool:
+    """True if the union for this group was already found to be unsatisfiable."""
+    return key in _failed_groups
+
+
+def mark_projected(path: Path) -> None:
+    _projected.add(Path(path))
+
+
+def is_projected(path: Path) -> bool:
+    """True if the lock at `path` was written by a superset resolution this session."""
+    return Path(path) in _projected
+
+
+def requirement_name(requirement: str) -> t.Optional[str]:
+    """The canonical project name of a deps line, or None if it has no name."""
+    match = REQUIREMENT_NAME.match(requirement.strip())
+    if match:
+        return canonical_name(match.group(1))
+    return None
+
+
+def root_names(deps: t.Iterable[str]) -> t.Optional[t.Set[str]]:
+    """
+    Names directly required by the `deps` lines.
+
+    :return: None if any line cannot be attributed to a project (for example
+        `-r other.txt` or a local path), meaning the env cannot be projected
+    """
+    roots = set()
+    for dep in deps:
+        if not dep.strip() or dep.strip().startswith("#"):
+            continue
+        name = requirement_name(dep)
+        if name is None:
+            return None
+        roots.add(name)
+    return roots
+
+
+def union_requirements(all_deps: t.Iterable[t.Iterable[str]]) -> t.List[str]:
+    """The distinct deps lines of all envs, in first-seen order."""
+    union: t.Dict[str, None] = {}
+    for deps in all_deps:
+        for dep in deps:
+            if dep.strip():
+                union.setdefault(dep.strip(), None)
+    return list(union)
+
+
+def _version(entry: LockEntry) -> t.Any:
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return Version(entry.version or "")
+    except InvalidVersion:
+        return Version("0")
+
+
+def merge_locks(locks: t.Iterable[t.Iterable[LockEntry]]) -> t.List[LockEntry]:
+    """
+    The pinned entries of all `locks`, to seed the superset resolution.
+
+    `pip-compile` keeps the pins it finds in its output file, so the union is
+    only upgraded where the members' locks disagree: the newest pin of each
+    project is kept.
+    """
+    merged: t.Dict[str, LockEntry] = {}
+    for entries in locks:
+        for entry in entries:
+            if entry.version is None:
+                continue
+            seen = merged.get(entry.name)
+            if seen is None or _version(entry) > _version(seen):
+                merged[entry.name] = entry
+    return sorted(merged.values(), key=lambda entry: entry.name)
+
+
+def conflicting_envs(
+    members: t.Mapping[str, t.Iterable[str]]
+) -> t.Dict[str, t.List[str]]:
+    """
+    Find the projects which envs require with incompatible specifiers.
+
+    Each pair of envs is checked with `preflight.find_conflicts`, so `pytest`
+    and `pytest>=7` are compatible, while `attrs<22` and `attrs>=22` are not.
+
+    :return: mapping of project name to the envs that disagree about it
+    """
+    from .preflight import find_conflicts
+    from .satisfy import RequirementLine
+
+    lines = {
+        envname: [
+            RequirementLine(dep.strip(), envname, False)
+            for dep in deps
+            if requirement_name(dep) is not None
+        ]
+        for envname, deps in members.items()
+    }
+    found: t.Dict[str, t.Set[str]] = defaultdict(set)
+    for first, second in itertools.combinations(sorted(lines), 2):
+        for conflict in find_conflicts([*lines[first], *lines[second]]):
+            found[conflict.name].update((conflict.first[1], conflict.second[1]))
+    return {name: sorted(envs) for name, envs in sorted(found.items())}
+
+
+def _via_name(via: str) -> t.Optional[str]:
+    if via.startswith("-"):
+        return None
+    return canonical_name(via.split()[0])
+
+
+def _is_dist_via(via: str) -> bool:
+    return any(via.endswith(f"({source})") for source in DIST_REQUIREMENTS_SOURCES)
+
+
+def project(
+    entries: t.Sequence[LockEntry],
+    roots: t.Iterable[str],
+    include_dist: bool = False,
+) -> t.List[LockEntry]:
+    """
+    Select the entries reachable from `roots` in the superset dependency graph.
+
+    :param entries: the superset lock entries
+    :param roots: canonical names required directly by the env
+    :param include_dist: also treat the dist's own requirements as roots
+    :return: the projected entries, in superset order, with `via` limited to
+        the projected packages and requirement sources
+    """
+    children: t.Dict[str, t.List[str]] = defaultdict(list)
+    pending = list(roots)
+    for entry in entries:
+        for via in entry.via:
+            parent = _via_name(via)
+            if parent is not None:
+                children[parent].append(entry.name)
+            if include_dist and _is_dist_via(via):
+                pending.append(entry.name)
+    selected: t.Set[str] = set()
+    while pending:
+        name = pending.pop()
+        if name in selected:
+            continue
+        selected.add(name)
+        pending.extend(children.get(name, ()))
+    return [
+        entry._replace(
+            via=tuple(
+                via
+                for via in entry.via
+                if via.startswith("-")
+                or _is_dist_via(via)
+                or _via_name(via) in selected
+            )
+        )
+        for entry in entries
+        if entry.name in selected
+    ]
@@ -0,0 +1,247 @@
+"""Re-lock testenvs in the background as their inputs change."""
+import configparser
+import logging
+from pathlib import Path
+import subprocess
+import sys
+import time
+import typing as t
+
+from .common import other_sources
+from .inputs import inputs_digest, referenced_files
+from .localdeps import local_deps, tree_digest, tree_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOX_CMD = (sys.executable, "-m", "tox")
+DEFAULT_DEBOUNCE = 1.0
+DEFAULT_INTERVAL = 0.5
+# tox3 and tox4 spellings of the keys that affect an env's lock file
+INPUT_KEYS = (
+    "deps",
+    "extras",
+    "pip_compile_opts",
+    "pip_pre",
+    "base_python",
+    "basepython",
+    "skip_install",
+    "package",
+)
+CONFIG_FILES = ("tox.ini",)
+
+
+class EnvInputs(t.NamedTuple):
+    """The digest of an env's lock inputs, and the files they were read from."""
+
+    digest: str
+    files: t.Tuple[Path, ...]
+
+
+def deps_lines(value: str) -> t.List[str]:
+    """Split a rendered `deps` value (tox4 multi-line or tox3 list repr)."""
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        return [d.strip() for d in value[1:-1].split(",") if d.strip()]
+    return [d.strip() for d in value.splitlines() if d.strip()]
+
+
+def _is_true(value: t.Optional[str]) -> bool:
+    return str(value).strip().lower() == "true"
+
+
+def parse_tox_config(output: str) -> t.Dict[str, t.Dict[str, str]]:
+    """Parse `tox config` / `tox --showconfig` output into {envname: {key: value}}."""
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str  # type: ignore
+    parser.read_string(output)
+    return {
+        section.partition(":")[2]: dict(parser.items(section))
+        for section in parser.sections()
+        if section.startswith("testenv:")
+    }
+
+
+def read_tox_config(
+    root: t.Union[str, Path],
+    tox_cmd: t.Sequence[str] = DEFAULT_TOX_CMD,
+    envs: t.Sequence[str] = (),
+    keys: t.Sequence[str] = INPUT_KEYS,
+) -> t.Dict[str, t.Dict[str, str]]:
+    """Ask tox for the rendered `keys` of `envs` (default: all envs)."""
+    env_args = ["-e", ",".join(envs)] if envs else []
+    for cmd in (
+        [*tox_cmd, "config", *env_args, "-k", *keys],  # tox4
+        [*tox_cmd, "--showconfig", *env_args],  # tox3
+    ):
+        result = subprocess.run(
+            cmd,
+            cwd=root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        if result.returncode == 0:
+            configs = parse_tox_config(result.stdout)
+            if envs:
+                configs = {e: c for e, c in configs.items() if e in envs}
+            return configs
+    raise RuntimeError("Unable to read the tox configuration")
+
+
+def _project_paths(path: Path) -> t.List[Path]:
+    """The files of a local project, and the directories files may be added to."""
+    if not path.is_dir():
+        return [path]
+    files = tree_files(path)
+    return [*sorted({path, *(file.parent for file in files)}), *files]
+
+
+def env_inputs(
+    root: t.Union[str, Path],
+    configs: t.Mapping[str, t.Mapping[str, str]],
+    skipsdist: bool = False,
+) -> t.Dict[str, EnvInputs]:
+    """
+    Digest the lock inputs of each env in `configs`, skipping "." envs.
+
+    The files of local projects installed by `deps` are watched too.
+    """
+    inputs = {}
+    for envname, config in configs.items():
+        if envname.startswith("."):
+            continue
+        deps = deps_lines(config.get("deps", ""))
+        files = referenced_files(deps, root)
+        if not (
+            skipsdist
+            or _is_true(config.get("skip_install"))
+            or config.get("package") == "skip"
+        ):
+            files.extend(other_sources(root))
+        local = local_deps(deps, root)
+        inputs[envname] = EnvInputs(
+            digest=inputs_digest(
+                deps=deps,
+                sources=files,
+                options=[
+                    *(f"{k}={config.get(k)}" for k in INPUT_KEYS if k != "deps"),
+                    *(f"local={dep.path}={tree_digest(dep.path)}" for dep in local),
+                ],
+            ),
+            files=(*files, *(p for dep in local for p in _project_paths(dep.path))),
+        )
+    return inputs
+
+
+def changed_envs(
+    old: t.Mapping[str, EnvInputs],
+    new: t.Mapping[str, EnvInputs],
+) -> t.List[str]:
+    """Envs which are new, or whose input digest differs."""
+    return [
+        envname
+        for envname, env in new.items()
+        if envname not in old or old[envname].digest != env.digest
+    ]
+
+
+class Watcher:
+    """
+    Poll the files that feed each env's lock, and recompile affected envs.
+
+    Changes are debounced: compilation starts once the watched files have been
+    stable for `debounce` seconds. Compilation runs in a `tox` subprocess so
+    polling continues meanwhile; envs changed during a compile are queued and
+    compiled when it finishes.
+    """
+
+    def __init__(
+        self,
+        root: t.Union[str, Path],
+        envs: t.Sequence[str] = (),
+        tox_cmd: t.Sequence[str] = DEFAULT_TOX_CMD,
+        tox_args: t.Sequence[str] = (),
+        debounce: float = DEFAULT_DEBOUNCE,
+        interval: float = DEFAULT_INTERVAL,
+    ):
+        self.root = Path(root)
+        self.envs = list(envs)
+        self.tox_cmd = list(tox_cmd)
+        self.tox_args = list(tox_args)
+        self.debounce = debounce
+        self.interval = interval
+        self.inputs: t.Dict[str, EnvInputs] = {}
+        self.pending: t.List[str] = []
+        self.compiling: t.Optional[subprocess.Popen] = None  # type: ignore
+        self._mtimes: t.Dict[Path, t.Optional[int]] = {}
+        self._changed_at: t.Optional[float] = None
+
+    def tox_config(self) -> t.Dict[str, t.Dict[str, str]]:
+        """Ask tox for the rendered config of the watched envs."""
+        return read_tox_config(self.root, self.tox_cmd, self.envs, INPUT_KEYS)
+
+    def read_inputs(self) -> t.Dict[str, EnvInputs]:
+        return env_inputs(self.root, self.tox_config())
+
+    @property
+    def watched_files(self) -> t.Set[Path]:
+        files = {self.root / name for name in CONFIG_FILES}
+        files.update(other_sources(self.root))
+        for env in self.inputs.values():
+            files.update(env.files)
+        return files
+
+    def _snapshot(self) -> t.Dict[Path, t.Optional[int]]:
+        mtimes: t.Dict[Path, t.Optional[int]] = {}
+        for path in self.watched_files:
+            try:
+                mtimes[path] = path.stat().st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def start(self) -> None:
+        self.inputs = self.read_inputs()
+        self._mtimes = self._snapshot()
+
+    def compile(self, envs: t.Sequence[str]) -> None:
+        """Start a background `tox --pip-compile` for `envs`."""
+        logger.info("re-locking %s", ", ".join(envs))
+        self.compiling = subprocess.Popen(
+            [*self.tox_cmd, "-e", ",".join(envs), "--pip-compile", *self.tox_args],
+            cwd=self.root,
+        )
+
+    def step(self, now: t.Optional[float] = None) -> None:
+        """Check for changed files and advance any pending compile."""
+        now = time.monotonic() if now is None else now
+        mtimes = self._snapshot()
+        if mtimes != self._mtimes:
+            self._mtimes = mtimes
+            self._changed_at = now
+        if self._changed_at is not None and now - self._changed_at >= self.debounce:
+            self._changed_at = None
+            new_inputs = self.read_inputs()
+            for envname in changed_envs(self.inputs, new_inputs):
+                if envname not in self.pending:
+                    self.pending.append(envname)
+            self.inputs = new_inputs
+            # included files may have been added or removed
+            self._mtimes = self._snapshot()
+        if self.compiling is not None and self.compiling.poll() is None:
+            return
+        self.compiling = None
+        if self.pending:
+            envs, self.pending = self.pending, []
+            self.compile(envs)
+
+    def run(self) -> None:  # pragma: no cover
+        self.start()
+        logger.info("watching %d envs for changes", len(self.inputs))
+        try:
+            while True:
+                self.step()
+                time.sleep(self.interval)
+        finally:
+            if self.compiling is not None:
+                self.compiling.wait()
@@ -0,0 +1,129 @@
+"""
+Measure what tox-pin-deps adds to every tox invocation.
+
+* import time of `tox_pin_deps.loader` (the `tox` entry point), taken from
+  `python -X importtime` and counting only the plugin's own modules
+* per-env hook overhead for 1, 100 and 1,000 envs that do not use pins
+
+Requires the tox version under test to be installed. With --check, exit
+non-zero if the entry point loads the compile machinery.
+"""
+import argparse
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+import typing as t
+
+ENV_COUNTS = (1, 100, 1000)
+# modules that must only load when a testenv compiles or uses a lock file
+LAZY_MODULES = ("tox_pin_deps.compile", "tox_pin_deps.installer")
+
+
+def import_times(repeat: int) -> t.Tuple[float, t.Set[str]]:
+    """Median import time of the plugin's own modules, and the modules loaded."""
+    totals = []
+    modules: t.Set[str] = set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                "import tox.plugin.manager; import tox_pin_deps.loader",
+            ],
+            stderr=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        )
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            self_us, _, name = (
+                part.strip() for part in line.partition(":")[2].split("|")
+            )
+            if self_us.isdigit() and name.startswith("tox_pin_deps"):
+                total += int(self_us)
+                modules.add(name)
+        totals.append(total / 1e6)
+    return statistics.median(totals), modules
+
+
+def tox4_hooks(root: Path, n_envs: int) -> float:
+    """Seconds spent in the tox4 hooks for `n_envs` envs without pins."""
+    from tox_pin_deps import plugin4
+
+    options = SimpleNamespace(
+        ignore_pins=False, pip_compile=False, pip_compile_bundle=""
+    )
+    core = {"toxinidir": root}
+    start = time.perf_counter()
+    for ix in range(n_envs):
+        name = f"env{ix}"
+        plugin4.tox_add_env_config({"pip_compile_opts": "", "env_name": name}, None)
+        runner = SimpleNamespace(options=options, name=name, core=core)
+        assert not plugin4.PinDepsVirtualEnvRunner.uses_pins.fget(runner)
+    elapsed = time.perf_counter() - start
+    plugin4._env_confs.clear()
+    return elapsed
+
+
+def tox3_hooks(root: Path, n_envs: int) -> float:
+    """Seconds spent in the tox3 hooks for `n_envs` envs without pins."""
+    from tox_pin_deps import plugin
+
+    option = SimpleNamespace(
+        ignore_pins=False, pip_compile=False, pip_compile_bundle=""
+    )
+    envconfigs = {
+        f"env{ix}": SimpleNamespace(envname=f"env{ix}", deps=[]) for ix in range(n_envs)
+    }
+    config = SimpleNamespace(
+        option=option,
+        toxinidir=root,
+        envlist=list(envconfigs),
+        envconfigs=envconfigs,
+    )
+    start = time.perf_counter()
+    plugin.tox_configure(config)
+    for envconfig in envconfigs.values():
+        envconfig.config = config
+        assert not plugin._uses_pins(SimpleNamespace(envconfig=envconfig))
+    return time.perf_counter() - start
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args(argv)
+
+    seconds, modules = import_times(args.repeat)
+    print(f"import tox_pin_deps.loader: {seconds * 1000:.2f} ms")
+    print(f"  modules: {', '.join(sorted(modules))}")
+
+    from tox_pin_deps import loader
+
+    hooks = tox4_hooks if loader.TOX == 4 else tox3_hooks
+    with tempfile.TemporaryDirectory() as td:
+        for n_envs in ENV_COUNTS:
+            elapsed = min(hooks(Path(td), n_envs) for _ in range(args.repeat))
+            print(
+                f"tox{loader.TOX} hooks, {n_envs:>5} envs: {elapsed * 1000:8.2f} ms "
+                f"({elapsed / n_envs * 1e6:.1f} us/env)"
+            )
+
+    eager = sorted(set(LAZY_MODULES) & modules)
+    if args.check and eager:
+        print(f"FAIL: loaded at startup: {', '.join(eager)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
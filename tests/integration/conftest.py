@@ -1,4 +1,16 @@
-"""Module-scope fixtures for testing real tox"""
+"""Module-scope fixtures for testing real tox
+
+The mock package index and the tox venvs are built once and cached by content
+hash in `TOX_PIN_DEPS_TEST_CACHE` (default `~/.cache/tox-pin-deps-tests`), so
+later sessions and concurrent xdist workers reuse them. Each build happens in
+a staging directory that is renamed into place, so a worker never sees a
+partial build and the first worker to finish wins.
+
+Tox runs with an explicit environment instead of a mutated `os.environ`, and
+every worker gets its own work dirs, `TOX_WORK_DIR` and pip cache.
+"""
+from hashlib import sha256
+import inspect
 import logging
 import os
 from pathlib import Path
@@ -6,6 +18,7 @@ import re
 import shutil
 import subprocess
 import sys
+import tempfile
 import uuid
 import warnings
 
@@ -15,95 +28,97 @@ from . import mock_packages
 
 logger = logging.getLogger(__name__)
 
-
-@pytest.fixture(scope="session")
-def pkg_path(tmp_path_factory):
-    return tmp_path_factory.mktemp("packages")
-
-
-def mock_package_maker(
-    pkg_name,
-    versions,
-    tmp_path_factory,
-    pkg_path,
-    install_requires=None,
-    mock_package_func=mock_packages.mock_setup_py_package,
-    isolation=False,
-):
-    project_path = tmp_path_factory.mktemp(pkg_name)
-    for version in versions:
-        mock_package_func(pkg_name, version, install_requires or [], project_path)
-        mock_packages.wheel(project_path, pkg_path, isolation=isolation)
-    return pkg_name, dict(
-        versions=versions,
-        project_path=project_path,
-    )
-
-
-@pytest.fixture(scope="session")
-def mock_pkg_foo(tmp_path_factory, pkg_path):
-    pkg_name = "mock_pkg_foo"
-    versions = ["0.0.1", "0.1.0", "1.0b2"]
-    return mock_package_maker(pkg_name, versions, tmp_path_factory, pkg_path)
-
-
-@pytest.fixture(scope="session")
-def mock_pkg_bar(tmp_path_factory, pkg_path, mock_pkg_foo):
-    pkg_name = "mock_pkg_bar"
-    versions = ["0.1.1", "1.1.0", "1.2", "1.5"]
-    return mock_package_maker(
-        pkg_name,
-        versions,
-        tmp_path_factory,
-        pkg_path,
-        install_requires=[mock_pkg_foo[0]],
+# bump to invalidate every cached build
+CACHE_VERSION = "1"
+MOCK_PACKAGES = [
+    (
+        "mock_pkg_foo",
+        ["0.0.1", "0.1.0", "1.0b2"],
+        [],
+        mock_packages.mock_setup_py_package,
+    ),
+    (
+        "mock_pkg_bar",
+        ["0.1.1", "1.1.0", "1.2", "1.5"],
+        ["mock_pkg_foo"],
+        mock_packages.mock_setup_py_package,
+    ),
+    (
+        "mock_pkg_quuc",
+        ["2.1.1", "2.0", "2.2", "2.1.0"],
+        ["mock_pkg_bar"],
+        mock_packages.mock_pyproject_toml_package,
+    ),
+    ("mock_pkg_foo_ex", ["0.0.1"], [], mock_packages.mock_setup_py_package),
+]
+
+
+def cache_root():
+    root = Path(
+        os.environ.get("TOX_PIN_DEPS_TEST_CACHE")
+        or Path.home() / ".cache" / "tox-pin-deps-tests"
     )
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def content_key(*parts):
+    d = sha256(CACHE_VERSION.encode())
+    for part in parts:
+        d.update(b"\0" + str(part).encode())
+    return d.hexdigest()[:16]
+
+
+def cached_build(name, key, build):
+    """
+    Path of the `name` build for `key`, calling `build(path)` if not cached.
+
+    `build` fills a staging directory that is renamed to the cached path, so
+    anything it writes must not depend on its own location.
+    """
+    path = cache_root() / f"{name}-{key}"
+    if path.exists():
+        logger.info(f"Using cached {name} at {path}")
+        return path
+    staging = Path(tempfile.mkdtemp(prefix=f".{name}-{key}-", dir=cache_root()))
+    try:
+        build(staging)
+        os.rename(staging, path)
+    except OSError:
+        # another worker published the same build first
+        if not path.exists():
+            raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return path
+
+
+def build_mock_packages(pkg_path):
+    with tempfile.TemporaryDirectory() as projects:
+        for pkg_name, versions, install_requires, mock_package_func in MOCK_PACKAGES:
+            project_path = Path(projects, pkg_name)
+            for version in versions:
+                mock_package_func(pkg_name, version, install_requires, project_path)
+                mock_packages.wheel(project_path, pkg_path, isolation=False)
+    mock_packages.dumb_pypi_repo(pkg_path)
 
 
 @pytest.fixture(scope="session")
-def mock_pkg_quuc(tmp_path_factory, pkg_path, mock_pkg_bar):
-    pkg_name = "mock_pkg_quuc"
-    versions = ["2.1.1", "2.0", "2.2", "2.1.0"]
-    return mock_package_maker(
-        pkg_name,
-        versions,
-        tmp_path_factory,
-        pkg_path,
-        install_requires=[mock_pkg_bar[0]],
-        mock_package_func=mock_packages.mock_pyproject_toml_package,
+def pkg_path():
+    key = content_key(
+        inspect.getsource(mock_packages),
+        [
+            (name, versions, install_requires, func.__name__)
+            for name, versions, install_requires, func in MOCK_PACKAGES
+        ],
+        sys.version_info[:2],
     )
+    return cached_build("packages", key, build_mock_packages)
 
 
 @pytest.fixture(scope="session")
-def mock_pkg_foo_ex(tmp_path_factory, pkg_path):
-    pkg_name = "mock_pkg_foo_ex"
-    versions = ["0.0.1"]
-    return mock_package_maker(pkg_name, versions, tmp_path_factory, pkg_path)
-
-
-@pytest.fixture(scope="session")
-def all_mock_packages(mock_pkg_foo, mock_pkg_bar, mock_pkg_quuc, mock_pkg_foo_ex):
-    return dict([mock_pkg_foo, mock_pkg_bar, mock_pkg_quuc])
-
-
-@pytest.fixture(scope="session")
-def save_pip_vars():
-    save = {
-        v: os.environ.get(v)
-        for v in ["PIP_INDEX_URL", "PIP_EXTRA_INDEX_URL", "PIP_TRUSTED_HOST"]
-    }
-    yield
-    for var, val in save.items():
-        if val is not None:
-            os.environ[var] = val
-
-
-@pytest.fixture(scope="session")
-def package_server(pkg_path, all_mock_packages, save_pip_vars):
-    index = mock_packages.dumb_pypi_repo(pkg_path)
-    os.environ.pop("PIP_INDEX_URL", None)
-    os.environ["PIP_EXTRA_INDEX_URL"] = index
-    yield index
+def package_server(pkg_path):
+    return f"file://{pkg_path}/index/simple"
 
 
 @pytest.fixture(scope="module")
@@ -123,7 +138,7 @@ def example_project_name(request):
 
 
 @pytest.fixture(scope="module")
-def example_environment_root(example_project_name, package_server):
+def example_environment_root(example_project_name):
     p = example_project_name.split("/")
     return Path(Path(__file__).resolve().parent, *p)
 
@@ -143,12 +158,8 @@ def tox_major(tox_version):
 
 @pytest.fixture(scope="module")
 def toxworkdir(tmp_path_factory, tox_version, mod_id):
-    workdir = tmp_path_factory.mktemp(f"workdir_{mod_id}_{tox_version}")
-    old_workdir = os.environ.get("TOX_WORK_DIR", None)
-    os.environ["TOX_WORK_DIR"] = str(workdir)
-    yield workdir
-    if old_workdir is not None:
-        os.environ["TOX_WORK_DIR"] = old_workdir
+    # basetemp is already per worker under xdist
+    return tmp_path_factory.mktemp(f"workdir_{mod_id}_{tox_version}")
 
 
 @pytest.fixture(scope="module")
@@ -164,53 +175,34 @@ def toxinidir(tmp_path_factory, mod_id, tox_version, example_environment_root):
     return toxinidir
 
 
-@pytest.fixture(scope="module")
-def tox_venv(tmp_path_factory, mod_id, tox_version):
-    tox_version_number = tox_version.partition("==")[2]
-    tox_venv_path = tmp_path_factory.mktemp(f"tox_venv_{tox_version_number}_{mod_id}")
-    subprocess.run(
-        [sys.executable, "-m", "venv", tox_venv_path],
-    )
-    import pkg_resources
-
-    pytest_cov_dist = pkg_resources.get_distribution("pytest-cov")
-    if tox_version == "tox-dev":
-        tox_version = "tox>4"
-    subprocess.run(
-        [
-            tox_venv_path / "bin" / "python",
-            "-m",
-            "pip",
-            "install",
-            tox_version,
-            f"pytest-cov=={pytest_cov_dist.parsed_version}",
-        ],
-        cwd=tox_venv_path,
-    )
-    return tox_venv_path
-
-
-@pytest.fixture(scope="module")
-def tox_testenv_passenv_all():
-    orig_tox_testenv_passenv = os.environ.get("TOX_TESTENV_PASSENV")
-    os.environ["TOX_TESTENV_PASSENV"] = "COV* PIP*"  # for coverage.py
-    yield
-    if orig_tox_testenv_passenv is not None:
-        # monkeypatch doesn't work at module scope
-        os.environ["TOX_TESTENV_PASSENV"] = orig_tox_testenv_passenv
+@pytest.fixture(scope="session")
+def pip_cache_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("pip_cache")
 
 
 @pytest.fixture(scope="module")
-def tox_venv_python(tox_venv, tox_testenv_passenv_all):
-    return tox_venv / "bin" / "python"
+def tox_env(toxworkdir, package_server, pip_cache_dir):
+    """Environment for running tox in this worker."""
+    env = {
+        var: val
+        for var, val in os.environ.items()
+        if var not in ("PIP_INDEX_URL", "TOX_WORK_DIR", "TOX_TESTENV_PASSENV")
+    }
+    env.update(
+        TOX_WORK_DIR=str(toxworkdir),
+        TOX_TESTENV_PASSENV="COV* PIP*",  # for coverage.py
+        PIP_EXTRA_INDEX_URL=package_server,
+        PIP_CACHE_DIR=str(pip_cache_dir),
+        PIP_DISABLE_PIP_VERSION_CHECK="1",
+    )
+    return env
 
 
-@pytest.fixture(scope="module")
-def tox_venv_site_packages_dir(tox_venv_python):
+def site_packages_dir(python):
     return Path(
         subprocess.run(
             [
-                tox_venv_python,
+                python,
                 "-c",
                 "from distutils.sysconfig import get_python_lib;"
                 "print(get_python_lib())",
@@ -222,30 +214,72 @@ def tox_venv_site_packages_dir(tox_venv_python):
     )
 
 
-@pytest.fixture(scope="module")
-def link_tox_pin_deps(tox_venv, tox_venv_site_packages_dir):
+def link_tox_pin_deps(site_packages, egg_path):
+    """Make the tox_pin_deps under test importable and discoverable as a plugin."""
     import tox_pin_deps
-    import pkg_resources
 
-    dist = pkg_resources.get_distribution("tox-pin-deps")
-    egg_path = Path(dist.egg_info)
     top_level_pths = set(Path(p).parent for p in tox_pin_deps.__path__)
-    pth_path = tox_venv_site_packages_dir / "tox-pin-deps.pth"
-    pth_path.write_text("\n".join(str(p) for p in top_level_pths))
-    (tox_venv_site_packages_dir / egg_path.name).symlink_to(
-        egg_path, target_is_directory=True
+    (site_packages / "tox-pin-deps.pth").write_text(
+        "\n".join(str(p) for p in top_level_pths)
+    )
+    (site_packages / egg_path.name).symlink_to(egg_path, target_is_directory=True)
+
+
+@pytest.fixture(scope="module")
+def tox_venv(tox_version):
+    import pkg_resources
+    import tox_pin_deps
+
+    pytest_cov_dist = pkg_resources.get_distribution("pytest-cov")
+    egg_path = Path(pkg_resources.get_distribution("tox-pin-deps").egg_info)
+    if tox_version == "tox-dev":
+        tox_version = "tox>4"
+
+    def build(tox_venv_path):
+        subprocess.run(
+            [sys.executable, "-m", "venv", tox_venv_path],
+            check=True,
+        )
+        python = tox_venv_path / "bin" / "python"
+        subprocess.run(
+            [
+                python,
+                "-m",
+                "pip",
+                "install",
+                tox_version,
+                f"pytest-cov=={pytest_cov_dist.parsed_version}",
+            ],
+            cwd=tox_venv_path,
+            check=True,
+        )
+        link_tox_pin_deps(site_packages_dir(python), egg_path)
+
+    key = content_key(
+        tox_version,
+        pytest_cov_dist.version,
+        sys.executable,
+        sys.version,
+        list(tox_pin_deps.__path__),
+        egg_path,
     )
-    yield
-    pth_path.unlink()
-    (tox_venv_site_packages_dir / egg_path.name).unlink()
+    # console scripts keep the staging path in their shebang, tox is always
+    # run with `python -m`
+    return cached_build(f"tox_venv_{tox_version.partition('==')[2]}", key, build)
+
+
+@pytest.fixture(scope="module")
+def tox_venv_python(tox_venv):
+    return tox_venv / "bin" / "python"
 
 
 @pytest.fixture(scope="module")
-def tox_runner(tox_venv_python, link_tox_pin_deps, toxworkdir, toxinidir):
+def tox_runner(tox_venv_python, tox_env, toxinidir):
     def run_tox_cmd(*args):
         return subprocess.run(
             [tox_venv_python, "-m", "tox", *args],
             cwd=toxinidir,
+            env=tox_env,
             capture_output=True,
             encoding="utf-8",
             check=True,
@@ -1,13 +1,29 @@
+import hashlib
 from unittest import mock
+import zipfile
 
 import pytest
 
+from tox_pin_deps import profiling
+from tox_pin_deps.common import ENV_SESSION, ENV_SESSION_ENVS
+
 from . import tox_mocks
 
 # reset ShimBaseMock after every test
 _fx_reset = pytest.fixture(autouse=True)(tox_mocks.ShimBaseMock._fx_reset)
 
 
+@pytest.fixture(autouse=True)
+def _session_env(monkeypatch):
+    """Start each test in a session of its own."""
+    for name in (ENV_SESSION, ENV_SESSION_ENVS):
+        # set first, so that a value set by the test is removed again
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+    # turned off by tox4 -p
+    monkeypatch.setattr(profiling, "_disabled", False)
+
+
 @pytest.fixture
 def venv_name():
     return "mock-venv"
@@ -19,6 +35,22 @@ def options():
     options.pip_compile_opts = None
     options.pip_compile = True
     options.ignore_pins = False
+    options.pip_compile_prefetch = False
+    options.pip_compile_superset = False
+    options.pip_compile_cache = ""
+    options.pip_compile_cache_max_size = ""
+    options.pip_compile_metrics = ""
+    options.pip_compile_hotspots = False
+    options.pip_compile_shard = ""
+    options.pip_compile_memory_budget = ""
+    options.pip_compile_slim = False
+    options.pip_compile_slim_platform = []
+    options.pip_compile_slim_drop_excluded = False
+    options.pip_compile_bundle = ""
+    options.pip_compile_upgrade_package = []
+    options.pip_compile_keep_satisfied = False
+    options.pip_compile_prune_pip_cache = ""
+    options.parallel = 0
     return options
 
 
@@ -148,3 +180,44 @@ def pyproject_toml(request, toxinidir):
         pyproject_toml = toxinidir / "pyproject.toml"
         pyproject_toml.touch()
         return pyproject_toml
+
+
+def make_wheel(directory, name, version, tag):
+    path = directory / f"{name}-{version}-{tag}.whl"
+    dist_info = f"{name}-{version}.dist-info"
+    with zipfile.ZipFile(path, "w") as whl:
+        whl.writestr(
+            f"{dist_info}/METADATA",
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        )
+        whl.writestr(
+            f"{dist_info}/WHEEL",
+            f"Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: {tag}\n",
+        )
+        whl.writestr(f"{dist_info}/RECORD", "")
+    return path
+
+
+def sha256(path):
+    return "sha256:" + hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@pytest.fixture
+def lock_bundle(tmp_path, venv_name):
+    """A bundle with a lock of `venv_name` pinning one wheel."""
+    from tox_pin_deps import bundle
+
+    pool = tmp_path / "pool"
+    pool.mkdir()
+    wheel = make_wheel(pool, "foo", "1.0", "py3-none-any")
+    requirements = tmp_path / "bundle-requirements"
+    requirements.mkdir()
+    (requirements / f"{venv_name}.txt").write_text(
+        f"foo==1.0 \\\n    --hash={sha256(wheel)}\n"
+    )
+    output = tmp_path / "locks.bundle"
+    bundle.build(
+        requirements, output, pip_opts=["--no-index", "--find-links", str(pool)]
+    )
+    yield output
+    bundle._bundles.clear()
@@ -0,0 +1,194 @@
+import json
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from tox_pin_deps import bundle, cli
+
+from .conftest import make_wheel, sha256
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = tmp_path / "pool"
+    pool.mkdir()
+    return {
+        wheel.name: wheel
+        for wheel in [
+            make_wheel(pool, "shared", "1.0", "py3-none-any"),
+            make_wheel(pool, "only_py310", "2.0", "py3-none-any"),
+            make_wheel(pool, "only_lint", "3.0", "py3-none-any"),
+            make_wheel(pool, "unused", "1.0", "py3-none-any"),
+        ]
+    }
+
+
+def lock_text(*wheels):
+    lines = ["#", "# autogenerated", "#", "--index-url https://example.com/simple", ""]
+    for wheel in wheels:
+        name, version = wheel.name.split("-")[:2]
+        lines.append(f"{name}=={version} \\")
+        lines.append(f"    --hash={sha256(wheel)}")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def requirements_directory(toxinidir, pool):
+    directory = toxinidir / "requirements"
+    directory.mkdir()
+    (directory / "py310.txt").write_text(
+        lock_text(
+            pool["shared-1.0-py3-none-any.whl"], pool["only_py310-2.0-py3-none-any.whl"]
+        )
+    )
+    (directory / "lint.txt").write_text(
+        lock_text(
+            pool["shared-1.0-py3-none-any.whl"], pool["only_lint-3.0-py3-none-any.whl"]
+        )
+    )
+    return directory
+
+
+@pytest.fixture
+def pip_opts(pool):
+    directory = next(iter(pool.values())).parent
+    return ["--no-index", "--find-links", str(directory)]
+
+
+@pytest.fixture
+def built_bundle(tmp_path, requirements_directory, pip_opts):
+    output = tmp_path / "out" / "locks.bundle"
+    manifest = bundle.build(requirements_directory, output, pip_opts=pip_opts)
+    return output, manifest
+
+
+def test_build(built_bundle, pool):
+    output, manifest = built_bundle
+    assert manifest["version"] == bundle.FORMAT_VERSION
+    assert manifest["envs"]["lint"]["artifacts"] == [
+        "only_lint-3.0-py3-none-any.whl",
+        "shared-1.0-py3-none-any.whl",
+    ]
+    assert manifest["envs"]["py310"]["artifacts"] == [
+        "only_py310-2.0-py3-none-any.whl",
+        "shared-1.0-py3-none-any.whl",
+    ]
+    # artifacts shared by envs are stored once
+    assert sorted(manifest["artifacts"]) == [
+        "only_lint-3.0-py3-none-any.whl",
+        "only_py310-2.0-py3-none-any.whl",
+        "shared-1.0-py3-none-any.whl",
+    ]
+    shared = manifest["artifacts"]["shared-1.0-py3-none-any.whl"]
+    assert "sha256:" + shared["sha256"] == sha256(pool["shared-1.0-py3-none-any.whl"])
+    with zipfile.ZipFile(output) as zf:
+        infos = zf.infolist()
+    assert infos[0].filename == bundle.MANIFEST
+    assert {info.compress_type for info in infos} == {zipfile.ZIP_STORED}
+    assert sorted(info.filename for info in infos) == [
+        "artifacts/only_lint-3.0-py3-none-any.whl",
+        "artifacts/only_py310-2.0-py3-none-any.whl",
+        "artifacts/shared-1.0-py3-none-any.whl",
+        "locks/lint.txt",
+        "locks/py310.txt",
+        bundle.MANIFEST,
+    ]
+
+
+def test_build_errors(tmp_path, requirements_directory, pip_opts):
+    output = tmp_path / "locks.bundle"
+    with pytest.raises(bundle.BundleError, match="no lock file for py27"):
+        bundle.build(requirements_directory, output, envs=["py27"], pip_opts=pip_opts)
+    (requirements_directory / "py311.txt").write_text("missing==1.0\n")
+    with pytest.raises(bundle.BundleError, match="pip download failed"):
+        bundle.build(requirements_directory, output, envs=["py311"], pip_opts=pip_opts)
+    assert not output.exists()
+
+
+def test_stage(built_bundle, requirements_directory, tmp_path):
+    output, _ = built_bundle
+    lock_bundle = bundle.Bundle(output)
+    assert lock_bundle.envs == ["lint", "py310"]
+    stage_dir = tmp_path / "stage"
+    staged = lock_bundle.stage("py310", stage_dir)
+    wheelhouse = stage_dir / "wheelhouse"
+    # only the env's own artifacts are extracted
+    assert sorted(p.name for p in wheelhouse.iterdir()) == [
+        "only_py310-2.0-py3-none-any.whl",
+        "shared-1.0-py3-none-any.whl",
+    ]
+    lock = (requirements_directory / "py310.txt").read_text()
+    assert staged.read_text() == (
+        f"--no-index\n--find-links {wheelhouse}\n"
+        + lock.replace("--index-url https://example.com/simple\n", "")
+    )
+    # pip installs from the staged lock without an index, checking hashes
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "download",
+            "--quiet",
+            "--no-deps",
+            "--dest",
+            str(tmp_path / "downloaded"),
+            "-r",
+            str(staged),
+        ],
+        check=True,
+    )
+    assert len(list((tmp_path / "downloaded").iterdir())) == 2
+    lock_bundle.stage("lint", stage_dir)
+    assert len(list(wheelhouse.iterdir())) == 3
+
+
+def test_extract_corrupt(built_bundle, tmp_path):
+    output, _ = built_bundle
+    lock_bundle = bundle.Bundle(output)
+    lock_bundle.manifest["artifacts"]["shared-1.0-py3-none-any.whl"]["sha256"] = "0"
+    with pytest.raises(
+        bundle.BundleError, match="shared-1.0-py3-none-any.whl is corrupt"
+    ):
+        lock_bundle.extract("lint", tmp_path / "wheelhouse")
+    assert [p.name for p in (tmp_path / "wheelhouse").iterdir()] == [
+        "only_lint-3.0-py3-none-any.whl"
+    ]
+
+
+def test_not_a_bundle(tmp_path):
+    path = tmp_path / "other.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("foo", "bar")
+    with pytest.raises(bundle.BundleError, match="not a lock bundle"):
+        bundle.Bundle(path)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(bundle.MANIFEST, json.dumps({"version": 99}))
+    with pytest.raises(bundle.BundleError, match="unsupported bundle version 99"):
+        bundle.Bundle(path)
+    path.write_text("not a zip file")
+    with pytest.raises(bundle.BundleError, match="not a lock bundle"):
+        bundle.Bundle(path)
+    with pytest.raises(bundle.BundleError, match="cannot open bundle"):
+        bundle.Bundle(tmp_path / "missing.zip")
+
+
+def test_open_bundle(built_bundle):
+    output, _ = built_bundle
+    try:
+        assert bundle.open_bundle(output) is bundle.open_bundle(output)
+    finally:
+        bundle._bundles.clear()
+
+
+def test_cli_bundle(requirements_directory, toxinidir, tmp_path, pip_opts, capsys):
+    output = tmp_path / "locks.bundle"
+    argv = ["--root", str(toxinidir), "bundle", str(output), "--", *pip_opts]
+    assert cli.main(argv) == 0
+    assert capsys.readouterr().out.startswith(f"{output}: 2 envs, 3 artifacts, ")
+    assert bundle.Bundle(output).envs == ["lint", "py310"]
+    (requirements_directory / "py311.txt").write_text("missing==1.0\n")
+    assert cli.main(argv) == 1
+    assert "pip download failed" in capsys.readouterr().err
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from tox_pin_deps import cache
+
+
+@pytest.mark.parametrize(
+    "size,exp_bytes",
+    (("", None), (None, None), ("100", 100), ("2k", 2048), ("5MB", 5 * 1024**2)),
+)
+def test_parse_size(size, exp_bytes):
+    assert cache.parse_size(size) == exp_bytes
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError, match="Invalid size"):
+        cache.parse_size("lots")
+
+
+def test_backend_from_spec(tmp_path):
+    backend = cache.backend_from_spec(str(tmp_path))
+    assert isinstance(backend, cache.DirectoryBackend)
+    assert backend.root == tmp_path
+    assert cache.backend_from_spec(f"file://{tmp_path}").root == tmp_path
+    with pytest.raises(ValueError, match="Unknown lock cache backend"):
+        cache.backend_from_spec("s3://bucket/locks")
+
+
+def test_directory_backend_evict(tmp_path):
+    backend = cache.DirectoryBackend(tmp_path)
+    assert backend.get("aa00") is None
+    for ix, key in enumerate(["aa01", "bb02", "cc03"]):
+        backend.put(key, b"x" * 10)
+        path = backend._path(key)
+        os.utime(path, (ix, ix))
+    # reading an entry makes it the most recently used
+    assert backend.get("aa01") == b"x" * 10
+    assert backend.evict(max_size=20) == 1
+    assert backend.get("bb02") is None
+    assert backend.get("aa01") is not None
+    assert backend.get("cc03") is not None
+
+
+def test_lock_cache(tmp_path):
+    lock_cache = cache.LockCache(cache.DirectoryBackend(tmp_path / "cache"), 1024)
+    lock_file = tmp_path / "requirements" / "py310.txt"
+    assert not lock_cache.restore("abcd", lock_file)
+    assert not lock_file.exists()
+    lock_file.parent.mkdir()
+    lock_file.write_text("foo==1.0\n")
+    lock_cache.store("abcd", lock_file)
+    lock_file.unlink()
+    assert lock_cache.restore("abcd", lock_file)
+    assert lock_file.read_text() == "foo==1.0\n"
+    assert lock_cache.counters == {"hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+    assert lock_cache.backend.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "stores": 1,
+        "evictions": 0,
+    }
+
+
+def test_open_cache_shared(tmp_path):
+    assert cache.open_cache(str(tmp_path)) is cache.open_cache(str(tmp_path))
+    assert cache.open_cache(str(tmp_path)) is not cache.open_cache(str(tmp_path), 10)
@@ -1,3 +1,5 @@
+import argparse
+
 import pytest
 
 from . import tox_mocks
@@ -19,4 +21,52 @@ def add_option_hook(request):
 def test_tox_add_option(parser, add_option_hook):
     add_option_hook(parser)
     added_args = [cal[0][0] for cal in parser.add_argument.call_args_list]
-    assert added_args == ["--pip-compile", "--ignore-pins", "--pip-compile-opts"]
+    assert added_args == [
+        "--pip-compile",
+        "--ignore-pins",
+        "--pip-compile-opts",
+        "--pip-compile-prefetch",
+        "--pip-compile-superset",
+        "--pip-compile-cache",
+        "--pip-compile-cache-max-size",
+        "--pip-compile-metrics",
+        "--pip-compile-hotspots",
+        "--pip-compile-shard",
+        "--pip-compile-memory-budget",
+        "--pip-compile-slim",
+        "--pip-compile-slim-platform",
+        "--pip-compile-slim-drop-excluded",
+        "--pip-compile-upgrade-package",
+        "--pip-compile-keep-satisfied",
+        "--pip-compile-bundle",
+        "--pip-compile-prune-pip-cache",
+    ]
+
+
+def test_tox_add_argument_valid():
+    parser = argparse.ArgumentParser()
+    tox_pin_deps.common.tox_add_argument(parser)
+    options = parser.parse_args(
+        ["--pip-compile-shard", "2/3", "--pip-compile-memory-budget", "4G"]
+    )
+    assert options.pip_compile_shard == "2/3"
+    assert options.pip_compile_memory_budget == "4G"
+
+
+@pytest.mark.parametrize(
+    "args, error",
+    [
+        (["--pip-compile-shard", "3/2"], "Invalid shard '3/2'"),
+        (["--pip-compile-shard", "two"], "Invalid shard 'two'"),
+        (["--pip-compile-memory-budget", "4X"], "Invalid size: '4X'"),
+        (["--pip-compile-cache-max-size", "big"], "Invalid size: 'big'"),
+        (["--pip-compile-prune-pip-cache", "2T"], "Invalid size: '2T'"),
+    ],
+)
+def test_tox_add_argument_invalid(args, error, capsys):
+    parser = argparse.ArgumentParser()
+    tox_pin_deps.common.tox_add_argument(parser)
+    with pytest.raises(SystemExit) as exc_info:
+        parser.parse_args(args)
+    assert exc_info.value.code == 2
+    assert f"{args[0]}: {error}" in capsys.readouterr().err
@@ -0,0 +1,44 @@
+from tox_pin_deps import drift
+from tox_pin_deps.lockfile import LockEntry
+
+
+def test_installed_distributions(tmp_path):
+    purelib = tmp_path / "purelib"
+    platlib = tmp_path / "platlib"
+    for directory, names in [
+        (purelib, ["Foo_Bar-1.0.dist-info", "foo_bar", "pip-23.0.dist-info"]),
+        (platlib, ["baz-2.0-py3.10.egg-info", "devpkg.egg-info", "README"]),
+    ]:
+        directory.mkdir()
+        for name in names:
+            (directory / name).mkdir()
+    assert drift.installed_distributions([purelib, platlib, tmp_path / "missing"]) == {
+        "foo-bar": "1.0",
+        "pip": "23.0",
+        "baz": "2.0",
+    }
+
+
+def test_find_drift():
+    entries = [
+        LockEntry("foo-bar", "1.0", "foo-bar==1.0"),
+        LockEntry("baz", "2.0", "baz==2.0"),
+        LockEntry("missing", "3.0", "missing==3.0"),
+        LockEntry("normalized", "1.0", "normalized==1.0"),
+        LockEntry(
+            "winonly",
+            "1.0",
+            'winonly==1.0 ; sys_platform == "win32"',
+            markers='sys_platform == "win32"',
+        ),
+        LockEntry("pyproj", None, "pyproj @ file:///tmp/pyproj"),
+    ]
+    installed = {"foo-bar": "1.0", "baz": "1.9", "normalized": "1.0.0"}
+    assert drift.find_drift(entries, installed) == [
+        drift.Drift(entries[1], "1.9"),
+        drift.Drift(entries[2], None),
+    ]
+    # entries with markers are checked when installed
+    assert drift.find_drift(entries[4:5], {"winonly": "0.9"}) == [
+        drift.Drift(entries[4], "0.9")
+    ]
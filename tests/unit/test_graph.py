@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import cli, graph
+
+
+@pytest.fixture
+def requirements_dir(toxinidir):
+    rdir = toxinidir / "requirements"
+    rdir.mkdir()
+    (rdir / "py39.txt").write_text(
+        "requests==2.28.1\n"
+        "    # via -r requirements.in\n"
+        "urllib3==1.26.13\n"
+        "    # via requests\n"
+    )
+    (rdir / "py311.txt").write_text(
+        "botocore==1.29.0\n"
+        "    # via -r requirements.in\n"
+        "urllib3==1.26.12\n"
+        "    # via\n"
+        "    #   botocore\n"
+        "    #   requests\n"
+        "requests==2.28.1\n"
+        "    # via -r requirements.in\n"
+    )
+    (rdir / "lint.txt").write_text("flake8==5.0.4\n")
+    return rdir
+
+
+@pytest.fixture
+def index_path(toxinidir):
+    return toxinidir / ".tox" / graph.INDEX_PATH
+
+
+def test_graph_index_queries(requirements_dir, index_path):
+    index = graph.load_index(requirements_dir, index_path)
+    assert index.envnames == ["lint", "py311", "py39"]
+    assert index.envs_containing("URLLib3") == ["py311", "py39"]
+    assert index.versions("urllib3") == {"1.26.12": ["py311"], "1.26.13": ["py39"]}
+    assert index.reverse_dependencies("urllib3") == {
+        "py311": ("botocore", "requests"),
+        "py39": ("requests",),
+    }
+    assert index.spread() == {
+        "urllib3": {"1.26.12": ["py311"], "1.26.13": ["py39"]},
+    }
+    assert index.pins("missing") == []
+
+
+def test_graph_index_incremental(requirements_dir, index_path, monkeypatch):
+    graph.load_index(requirements_dir, index_path)
+    assert index_path.exists()
+
+    parsed = []
+    orig_read_lock = graph.read_lock
+    monkeypatch.setattr(
+        graph, "read_lock", lambda path: parsed.append(path) or orig_read_lock(path)
+    )
+    index = graph.load_index(requirements_dir, index_path)
+    assert parsed == []
+    assert index.envs_containing("flake8") == ["lint"]
+
+    lint = requirements_dir / "lint.txt"
+    lint.write_text("flake8==6.0.0\nurllib3==1.26.13\n")
+    st = lint.stat()
+    os.utime(lint, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    (requirements_dir / "py311.txt").unlink()
+    index = graph.load_index(requirements_dir, index_path)
+    assert parsed == [lint]
+    assert index.versions("urllib3") == {"1.26.13": ["lint", "py39"]}
+    assert graph.GraphIndex.load(index_path).envnames == ["lint", "py39"]
+
+
+def test_graph_index_load_invalid(tmp_path):
+    index_path = tmp_path / "index.json"
+    index_path.write_text(json.dumps({"version": -1, "locks": {"x": {}}}))
+    assert graph.GraphIndex.load(index_path).envnames == []
+    index_path.write_text("not json")
+    assert graph.GraphIndex.load(index_path).envnames == []
+
+
+def test_cli_query(toxinidir, requirements_dir, capsys):
+    assert cli.main(["--root", str(toxinidir), "query", "urllib3", "missing"]) == 1
+    out = capsys.readouterr().out
+    assert out.splitlines() == [
+        "urllib3==1.26.12",
+        "    py311 (via botocore, requests)",
+        "urllib3==1.26.13",
+        "    py39 (via requests)",
+        "missing: not pinned in any env",
+    ]
+    assert cli.main(["--root", str(toxinidir), "query", "--json", "flake8"]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        "flake8": {"lint": {"version": "5.0.4", "via": []}},
+    }
+    assert cli.main(["--root", str(toxinidir), "query", "--spread"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "urllib3",
+        "    1.26.12: py311",
+        "    1.26.13: py39",
+    ]
+    assert (toxinidir / ".tox" / graph.INDEX_PATH).exists()
+    argv = ["--root", str(toxinidir), "query", "--work-dir", "build/tox", "flake8"]
+    assert cli.main(argv) == 0
+    assert (toxinidir / "build" / "tox" / graph.INDEX_PATH).exists()
+
+
+def test_cli_upgrade(toxinidir, requirements_dir, monkeypatch, capsys):
+    run = mock.Mock(return_value=subprocess.CompletedProcess([], 0))
+    monkeypatch.setattr(subprocess, "run", run)
+    argv = ["--root", str(toxinidir), "upgrade"]
+    assert cli.main([*argv, "--tox", "tox", "-P", "urllib3", "--", "-v"]) == 0
+    assert capsys.readouterr().out == "upgrading urllib3 in 2 envs: py311, py39\n"
+    run.assert_called_once_with(
+        [
+            "tox",
+            "-e",
+            "py311,py39",
+            "--notest",
+            "-p",
+            "auto",
+            "--pip-compile-upgrade-package",
+            "urllib3",
+            "-v",
+        ],
+        cwd=str(toxinidir),
+    )
+    run.reset_mock()
+    argv = [*argv, "--tox", "tox"]
+    assert cli.main([*argv, "-e", "py39,lint", "-P", "urllib3", "-P", "flake8"]) == 0
+    assert run.call_args[0][0][:4] == ["tox", "-e", "lint,py39", "--notest"]
+    assert cli.main([*argv, "-n", "-P", "flake8"]) == 0
+    assert run.call_count == 1
+    assert cli.main([*argv, "-P", "missing"]) == 1
+    assert capsys.readouterr().err == "missing: not pinned in any env\n"
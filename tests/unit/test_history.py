@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+import pytest
+
+from tox_pin_deps import history
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    return tmp_path / ".tox"
+
+
+def test_record(work_dir):
+    env_history = history.History(work_dir)
+    assert env_history.recent(history.COMPILE) == {}
+    assert not env_history.path.exists()
+    for seconds in range(1, history.WINDOW + 3):
+        env_history.record("py310", history.COMPILE, float(seconds))
+    env_history.record("py310", history.INSTALL, 3.0)
+    env_history.record("lint", history.COMPILE, 4.0)
+    # only the most recent runs are kept, newest first
+    assert env_history.recent(history.COMPILE) == {
+        "py310": [7.0, 6.0, 5.0, 4.0, 3.0],
+        "lint": [4.0],
+    }
+    assert env_history.estimates([history.COMPILE]) == {"py310": 5.0, "lint": 4.0}
+    assert env_history.estimates([history.COMPILE, history.INSTALL]) == {
+        "py310": 8.0,
+        "lint": 4.0,
+    }
+
+
+def test_record_concurrent(work_dir):
+    env_history = history.History(work_dir)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(
+            executor.map(
+                lambda n: env_history.record(f"py3{n % 4}", history.INSTALL, n),
+                range(16),
+            )
+        )
+    recent = env_history.recent(history.INSTALL)
+    assert sorted(recent) == ["py30", "py31", "py32", "py33"]
+    assert sum(len(durations) for durations in recent.values()) == 16
+
+
+def test_unreadable(work_dir, caplog):
+    env_history = history.History(work_dir)
+    env_history.path.parent.mkdir(parents=True)
+    env_history.path.write_text("not a database " * 100)
+    assert env_history.recent(history.COMPILE) == {}
+    env_history.record("py310", history.COMPILE, 1.0)
+    assert "could not record compile duration of py310" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "previous, seconds, expected",
+    [
+        ([], 300.0, None),
+        ([10.0, 12.0, 11.0], 30.0, 11.0),
+        ([10.0, 12.0, 11.0], 20.0, None),
+        # doubling a short compile is noise
+        ([2.0, 2.0], 8.0, None),
+    ],
+)
+def test_regression(previous, seconds, expected):
+    assert history.regression(previous, seconds) == expected
+
+
+def test_longest_first():
+    envnames = ["lint", "py37", "py310", "docs"]
+    assert history.longest_first(envnames, {}) == envnames
+    assert history.longest_first(
+        envnames, {"py37": 300.0, "py310": 60.0, "lint": 5.0}
+    ) == ["py37", "docs", "py310", "lint"]
+
+
+def test_makespan():
+    assert history.makespan([300.0, 60.0, 60.0, 5.0], workers=2) == 300.0
+    assert history.makespan([5.0, 60.0, 60.0, 300.0], workers=2) == 360.0
+    assert history.makespan([1.0, 2.0], workers=0) == 3.0
+
+
+@pytest.mark.parametrize(
+    "seconds, expected", [(0.4, "0s"), (45.2, "45s"), (60, "1m00s"), (372, "6m12s")]
+)
+def test_format_seconds(seconds, expected):
+    assert history.format_seconds(seconds) == expected
+
+
+def test_schedule(work_dir, caplog):
+    envnames = ["lint", "py37", "py310"]
+    phases = [history.COMPILE, history.INSTALL]
+    assert history.schedule(work_dir, envnames, phases, workers=2) == envnames
+    env_history = history.History(work_dir)
+    env_history.record("py37", history.COMPILE, 300.0)
+    env_history.record("py37", history.INSTALL, 60.0)
+    env_history.record("lint", history.COMPILE, 5.0)
+    env_history.record("lint", history.INSTALL, 1.0)
+    with caplog.at_level(logging.WARNING):
+        ordered = history.schedule(work_dir, envnames, phases, workers=2)
+    assert ordered == ["py37", "py310", "lint"]
+    assert (
+        "starting 3 envs longest first, expected to take 6m00s (2 with history)"
+        in caplog.text
+    )
+    # without compiling, only install times count
+    assert history.schedule(work_dir, envnames, [history.INSTALL], workers=None) == [
+        "py37",
+        "py310",
+        "lint",
+    ]
@@ -0,0 +1,115 @@
+import json
+import subprocess
+import sys
+
+from tox_pin_deps import hotspots
+from tox_pin_deps.compile import PIP_COMPILE_SCRIPT
+
+FAKE_PIP_COMPILE = """
+import logging, sys, time
+from pip._internal.resolution.resolvelib.reporter import PipReporter
+
+class Candidate:
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+def cli():
+    prepare = logging.getLogger("pip._internal.operations.prepare")
+    reporter = PipReporter()
+    prepare.info("Collecting %s", "Slow_Pkg>=1.0")
+    time.sleep(0.2)
+    criterion = type("Criterion", (), {"information": []})()
+    reporter.rejecting_candidate(criterion, Candidate("slow-pkg", "2.0"))
+    reporter.pinning(Candidate("slow-pkg", "1.5"))
+    prepare.info("Collecting %s", "fast (from slow-pkg==1.5)")
+    reporter.pinning(Candidate("fast", "1.0"))
+    print(" ".join(sys.argv))
+    sys.exit(0)
+"""
+
+
+def event(t, kind, name, version=None):
+    return {"t": t, "kind": kind, "name": name, "version": version}
+
+
+def test_analyze():
+    found = hotspots.analyze(
+        [
+            event(10.0, "collect", "Foo_Bar"),
+            event(10.5, "reject", "foo-bar", "2.0"),
+            event(12.5, "reject", "foo-bar", "1.9"),
+            event(13.0, "pin", "foo.bar", "1.8"),
+            event(13.0, "collect", "baz"),
+            event(13.25, "pin", "baz", "1.0"),
+            event(14.0, "end", None),
+        ]
+    )
+    assert found == [
+        hotspots.Hotspot("foo-bar", 3.0, ("2.0", "1.9", "1.8"), 2),
+        hotspots.Hotspot("baz", 1.0, ("1.0",), 0),
+    ]
+
+
+def test_read_events(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text(json.dumps(event(1.0, "pin", "foo", "1.0")) + '\n{"t": 2')
+    assert hotspots.read_events(path) == [event(1.0, "pin", "foo", "1.0")]
+    assert hotspots.read_events(tmp_path / "missing") == []
+
+
+def test_report(tmp_path):
+    found = [
+        hotspots.Hotspot("foo", 3.0, ("2.0", "1.9"), 1),
+        hotspots.Hotspot("bar", 1.0, ("1.0",), 0),
+    ]
+    table = hotspots.format_report(found, top=1).splitlines()
+    assert len(table) == 2
+    assert table[1].split() == ["foo", "3.00", "2", "1"]
+    path = hotspots.report_path(tmp_path, "py310/x")
+    assert path == tmp_path / "tox-pin-deps" / "hotspots" / "py310_x.json"
+    hotspots.save_report(path, "py310/x", found)
+    report = json.loads(path.read_text())
+    assert report["env"] == "py310/x"
+    assert report["seconds"] == 4.0
+    assert report["backtracks"] == 1
+    assert report["packages"][0] == {
+        "name": "foo",
+        "seconds": 3.0,
+        "versions": ["2.0", "1.9"],
+        "backtracks": 1,
+    }
+
+
+def test_hotspot_script(tmp_path):
+    fake = tmp_path / "site" / "piptools" / "scripts"
+    fake.mkdir(parents=True)
+    (fake.parent / "__init__.py").write_text("")
+    (fake / "__init__.py").write_text("")
+    (fake / "compile.py").write_text(FAKE_PIP_COMPILE)
+    events_file = tmp_path / "events.jsonl"
+    result = subprocess.run(
+        [sys.executable, "-c", hotspots.HOTSPOT_SCRIPT + PIP_COMPILE_SCRIPT, "a.in"],
+        env={
+            "PYTHONPATH": str(tmp_path / "site"),
+            hotspots.ENV_EVENTS: str(events_file),
+        },
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    assert result.stdout.strip() == "pip-compile a.in"
+    events = hotspots.read_events(events_file)
+    assert [e["kind"] for e in events] == [
+        "collect",
+        "reject",
+        "pin",
+        "collect",
+        "pin",
+        "end",
+    ]
+    found = hotspots.analyze(events)
+    assert [h.name for h in found] == ["slow-pkg", "fast"]
+    assert found[0].seconds >= 0.2
+    assert found[0].versions == ("2.0", "1.5")
+    assert found[0].backtracks == 1
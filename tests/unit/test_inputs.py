@@ -0,0 +1,47 @@
+import platform
+import sys
+
+from tox_pin_deps import inputs
+
+
+def test_referenced_files(toxinidir):
+    (toxinidir / "requirements-test.txt").write_text("-c constraints.txt\nmock\n")
+    (toxinidir / "constraints.txt").write_text("mock<5\n")
+    assert inputs.referenced_files(
+        ["pytest", "-r requirements-test.txt", "--constraint=missing.txt"],
+        toxinidir,
+    ) == [
+        toxinidir / "requirements-test.txt",
+        toxinidir / "missing.txt",
+        toxinidir / "constraints.txt",
+    ]
+    assert inputs.referenced_files(["-rrequirements-test.txt"], toxinidir) == [
+        toxinidir / "requirements-test.txt",
+        toxinidir / "constraints.txt",
+    ]
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "file.txt"
+    assert inputs.file_digest(path) is None
+    path.write_text("content")
+    assert inputs.file_digest(path) == inputs.file_digest(path)
+
+
+def test_inputs_digest(tmp_path):
+    source = tmp_path / "setup.py"
+    source.write_text("v1")
+    digest = inputs.inputs_digest(["pytest"], [source], ["--pre"])
+    assert digest == inputs.inputs_digest([" pytest "], [source], ["--pre"])
+    assert digest != inputs.inputs_digest(["pytest"], [source], [])
+    assert digest != inputs.inputs_digest(["pytest", "mock"], [source], ["--pre"])
+    source.write_text("v2")
+    assert digest != inputs.inputs_digest(["pytest"], [source], ["--pre"])
+
+
+def test_interpreter_info():
+    info = inputs.interpreter_info(sys.executable)
+    assert info["python"] == platform.python_version()
+    assert info["implementation"] == sys.implementation.name
+    assert "pip" in info
+    assert "pip-tools" in info
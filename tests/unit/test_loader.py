@@ -1,5 +1,6 @@
 """Loader should identify the tox plugin version needed."""
 import sys
+from unittest import mock
 
 from pkg_resources import DistributionNotFound, get_distribution
 import pytest
@@ -55,3 +56,59 @@ def test_loader_no_mock():
         import tox_pin_deps.loader
 
         assert tox_pin_deps.loader.TOX == installed_tox.parsed_version.major
+
+
+@pytest.mark.parametrize(
+    "context, plugin",
+    ((MockTox3Context, "plugin"), (MockTox4Context, "plugin4")),
+)
+@pytest.mark.usefixtures("_del_loader_module")
+def test_loader_exports_hooks(context, plugin):
+    """tox only finds the hooks that the entry point module exports."""
+    with context():
+        import tox_pin_deps.loader
+    module = sys.modules[f"tox_pin_deps.{plugin}"]
+    hooks = {
+        name
+        for name, obj in vars(module).items()
+        if name.startswith("tox_")
+        and getattr(obj, "__module__", None) == module.__name__
+    }
+    assert hooks
+    for name in hooks:
+        assert getattr(tox_pin_deps.loader, name) is getattr(module, name)
+
+
+@pytest.mark.usefixtures("_del_loader_module")
+def test_loader_schedules_longest_first(options, toxinidir):
+    with MockTox4Context():
+        import tox_pin_deps.loader
+        from tox_pin_deps import history
+    options.parallel = 2
+    options.env = mock.Mock(is_all=False)
+    options.env.__iter__ = mock.Mock(return_value=iter([]))
+    options.env.__bool__ = mock.Mock(return_value=False)
+    options.labels = options.factors = []
+    state = mock.Mock()
+    state.conf.options = options
+    core_conf = dict(work_dir=toxinidir / ".tox", env_list=["lint", "py310"])
+    env_history = history.History(core_conf["work_dir"])
+    env_history.record("py310", "compile", 30.0)
+    env_history.record("lint", "compile", 5.0)
+    hook = tox_pin_deps.loader.tox_add_core_config
+    with mock.patch.object(sys.modules[hook.__module__], "CliEnv") as cli_env:
+        hook(core_conf, state)
+    cli_env.assert_called_once_with(["py310", "lint"])
+
+
+@pytest.mark.usefixtures("_del_loader_module")
+def test_loader_prunes_pip_cache(options, toxinidir, monkeypatch):
+    with MockTox4Context():
+        import tox_pin_deps.loader
+    monkeypatch.setenv("TOX_PIN_DEPS_PRUNE_PIP_CACHE", "1G")
+    state = mock.Mock()
+    state.conf.options = options
+    core_conf = dict(tox_root=toxinidir, work_dir=toxinidir / ".tox")
+    with mock.patch("tox_pin_deps.pipcache.prune_at_exit") as prune_at_exit:
+        tox_pin_deps.loader.tox_add_core_config(core_conf, state)
+    prune_at_exit.assert_called_once_with(1024**3, toxinidir, toxinidir / ".tox")
@@ -0,0 +1,134 @@
+import os
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import localdeps
+
+
+@pytest.fixture
+def libs(toxinidir):
+    """Two local projects next to the tox project, and a wheel."""
+    libs = toxinidir.parent / "libs"
+    for name in ("foo", "bar"):
+        package = libs / name / "src" / name
+        package.mkdir(parents=True)
+        (libs / name / "pyproject.toml").write_text(f"[project]\nname = '{name}'\n")
+        (package / "__init__.py").write_text("")
+    (libs / "baz-1.0-py3-none-any.whl").write_bytes(b"wheel")
+    return libs
+
+
+def old(path):
+    """Backdate `path` so that its digest is remembered."""
+    os.utime(path, (1, 1))
+    return path
+
+
+@pytest.mark.parametrize(
+    "line, name, editable",
+    [
+        ("-e ../libs/foo", "foo", True),
+        ("--editable=../libs/foo", "foo", True),
+        ("../libs/foo[test]", "foo", False),
+        ("../libs/foo ; python_version > '3'", "foo", False),
+        ("file:../libs/foo#egg=foo", "foo", False),
+        ("foo @ file://{libs}/foo", "foo", False),
+        ("{libs}/baz-1.0-py3-none-any.whl", "baz-1.0-py3-none-any.whl", False),
+        ("foo", None, None),
+        ("foo>=1", None, None),
+        ("-e git+https://example.com/foo.git#egg=foo", None, None),
+        ("foo @ https://example.com/foo-1.0.tar.gz", None, None),
+        ("../libs/missing", None, None),
+        ("--index-url https://example.com/simple", None, None),
+    ],
+)
+def test_local_deps(toxinidir, libs, line, name, editable):
+    line = line.format(libs=libs)
+    found = localdeps.local_deps(["pytest", line], root=toxinidir)
+    if name is None:
+        assert found == []
+    else:
+        assert found == [localdeps.LocalDep(line, libs / name, editable)]
+
+
+def test_local_deps_included(toxinidir, libs):
+    (toxinidir / "requirements").mkdir()
+    # paths in requirement files are relative to where pip runs
+    (toxinidir / "requirements" / "libs.txt").write_text(
+        "-e ../libs/bar\n../libs/foo\n"
+    )
+    found = localdeps.local_deps(
+        ["-e ../libs/foo", "-r requirements/libs.txt"], root=toxinidir
+    )
+    assert [(dep.path.name, dep.editable) for dep in found] == [
+        ("foo", True),
+        ("bar", True),
+    ]
+
+
+def test_tree_files(libs):
+    foo = libs / "foo"
+    for skipped in (".git", "build", "src/foo/__pycache__", "src/foo.egg-info"):
+        (foo / skipped).mkdir()
+        (foo / skipped / "file").write_text("")
+    (foo / "src" / "foo" / "mod.pyc").write_text("")
+    assert localdeps.tree_files(foo) == [
+        foo / "pyproject.toml",
+        foo / "src" / "foo" / "__init__.py",
+    ]
+
+
+def test_tree_digest(libs, tmp_path):
+    foo = libs / "foo"
+    state_file = tmp_path / "state.json"
+    for file in localdeps.tree_files(foo):
+        old(file)
+    digest = localdeps.tree_digest(foo, state_file)
+    assert digest == localdeps.tree_digest(foo)
+    assert digest != localdeps.tree_digest(libs / "bar")
+    # unchanged files are not read again
+    with mock.patch("tox_pin_deps.localdeps.file_digest") as file_digest:
+        assert localdeps.tree_digest(foo, state_file) == digest
+    file_digest.assert_not_called()
+    # touching a file without changing it keeps the digest
+    os.utime(foo / "pyproject.toml")
+    assert localdeps.tree_digest(foo, state_file) == digest
+    (foo / "src" / "foo" / "__init__.py").write_text("__version__ = '2'\n")
+    changed = localdeps.tree_digest(foo, state_file)
+    assert changed != digest
+    # a file modified just now is read again next time
+    with mock.patch(
+        "tox_pin_deps.localdeps.file_digest", wraps=localdeps.file_digest
+    ) as file_digest:
+        assert localdeps.tree_digest(foo, state_file) == changed
+    assert file_digest.call_count == 2
+    (foo / "src" / "foo" / "__init__.py").rename(foo / "src" / "foo" / "core.py")
+    assert localdeps.tree_digest(foo, state_file) not in (digest, changed)
+
+
+def test_tree_digest_file(libs):
+    wheel = libs / "baz-1.0-py3-none-any.whl"
+    assert localdeps.tree_digest(wheel) == localdeps.file_digest(wheel)
+    assert localdeps.tree_digest(libs / "missing") is None
+
+
+def test_tree_digest_bad_state(libs, tmp_path):
+    state_file = tmp_path / "state.json"
+    state_file.write_text("[not a state")
+    assert localdeps.tree_digest(libs / "foo", state_file) == localdeps.tree_digest(
+        libs / "foo"
+    )
+
+
+def test_session_tree_digest(libs, tmp_path, monkeypatch):
+    monkeypatch.setattr(localdeps, "_digests", {})
+    foo = libs / "foo"
+    for file in localdeps.tree_files(foo):
+        old(file)
+    digest = localdeps.session_tree_digest(foo, tmp_path)
+    assert digest == localdeps.tree_digest(foo)
+    (foo / "pyproject.toml").write_text("[project]\nname = 'foo2'\n")
+    # scanned once per session
+    assert localdeps.session_tree_digest(foo, tmp_path) == digest
+    assert len(list(tmp_path.glob("*.json"))) == 1
@@ -0,0 +1,161 @@
+import hashlib
+
+import pytest
+
+from tox_pin_deps import lockfile
+
+LOCK_WITH_HASHES = """\
+#
+# This file is autogenerated by pip-compile with Python 3.10
+# by the following command:
+#
+#    tox -e nodeps --pip-compile
+#
+--extra-index-url file:///tmp/index/simple
+
+mock-pkg-bar==1.5 \\
+    --hash=sha256:aaaa \\
+    --hash=sha256:bbbb
+    # via mock-pkg-quuc
+Mock_Pkg.Foo==0.1.0 ; python_version >= "3.7" \\
+    --hash=sha256:cccc
+    # via
+    #   -r /tmp/.tox-pin-deps-nodeps-requirements.in
+    #   mock-pkg-bar
+pyproj @ file:///tmp/pyproj
+    # via -r requirements.in
+
+# The following packages are considered to be unsafe in a requirements file:
+# setuptools
+"""
+
+LOCK_LEGACY_VIA = """\
+attrs==22.1.0             # via pytest
+pluggy==1.0.0             # via pytest
+pytest==7.2.0             # via -r requirements.in
+"""
+
+
+def test_parse_lock_hashes():
+    entries = lockfile.parse_lock(LOCK_WITH_HASHES)
+    assert [e.name for e in entries] == ["mock-pkg-bar", "mock-pkg-foo", "pyproj"]
+    bar, foo, pyproj = entries
+    assert bar.version == "1.5"
+    assert bar.requirement == "mock-pkg-bar==1.5"
+    assert bar.hashes == ("sha256:aaaa", "sha256:bbbb")
+    assert bar.via == ("mock-pkg-quuc",)
+    assert foo.version == "0.1.0"
+    assert foo.markers == 'python_version >= "3.7"'
+    assert foo.pin == "mock-pkg-foo==0.1.0"
+    assert foo.via == (
+        "-r /tmp/.tox-pin-deps-nodeps-requirements.in",
+        "mock-pkg-bar",
+    )
+    assert pyproj.version is None
+    assert pyproj.pin == "pyproj @ file:///tmp/pyproj"
+    assert pyproj.via == ("-r requirements.in",)
+
+
+def test_parse_lock_legacy_via():
+    entries = lockfile.parse_lock(LOCK_LEGACY_VIA)
+    assert [e.pin for e in entries] == [
+        "attrs==22.1.0",
+        "pluggy==1.0.0",
+        "pytest==7.2.0",
+    ]
+    assert entries[0].via == ("pytest",)
+    assert entries[2].via == ("-r requirements.in",)
+
+
+@pytest.mark.parametrize(
+    "name,exp_name",
+    (("Foo_Bar", "foo-bar"), ("foo.bar", "foo-bar"), ("foo--bar", "foo-bar")),
+)
+def test_canonical_name(name, exp_name):
+    assert lockfile.canonical_name(name) == exp_name
+
+
+def test_read_lock(tmp_path):
+    assert lockfile.read_lock(tmp_path / "missing.txt") == []
+    lock = tmp_path / "lock.txt"
+    lock.write_text(LOCK_LEGACY_VIA)
+    assert len(lockfile.read_lock(lock)) == 3
+
+
+def test_sidecar(tmp_path, monkeypatch):
+    lock = tmp_path / "lock.txt"
+    lock.write_text(LOCK_WITH_HASHES)
+    assert lockfile.read_sidecar(lock) is None
+    entries = lockfile.write_sidecar(lock, input_digest="abc")
+    assert entries == lockfile.parse_lock(LOCK_WITH_HASHES)
+    assert lockfile.sidecar_path(lock) == tmp_path / ".lock.txt.json"
+    assert lockfile.read_sidecar(lock)["input_digest"] == "abc"
+    with monkeypatch.context() as m:
+        m.setattr(lockfile, "parse_lock", None)
+        # loaded from the sidecar without parsing
+        assert lockfile.read_lock(lock) == entries
+    # stale after the lock changes
+    lock.write_text(LOCK_LEGACY_VIA)
+    assert lockfile.read_sidecar(lock) is None
+    assert len(lockfile.read_lock(lock)) == 3
+
+
+@pytest.mark.parametrize(
+    "sidecar",
+    [
+        "not json",
+        "[]",
+        '{"version": 1, "checksum": "CHECKSUM"}',
+        '{"version": 1, "checksum": "CHECKSUM", "entries": [[1]]}',
+    ],
+    ids=["invalid", "not_dict", "no_entries", "bad_entries"],
+)
+def test_sidecar_invalid(tmp_path, sidecar):
+    lock = tmp_path / "lock.txt"
+    lock.write_text(LOCK_WITH_HASHES)
+    checksum = hashlib.sha256(lock.read_bytes()).hexdigest()
+    lockfile.sidecar_path(lock).write_text(sidecar.replace("CHECKSUM", checksum))
+    assert lockfile.read_lock(lock) == lockfile.parse_lock(LOCK_WITH_HASHES)
+
+
+LOCK_WITH_EDITABLE = """\
+#
+# This file is autogenerated by pip-compile with Python 3.10
+#
+--index-url https://example.com/simple
+
+-e file:///src/foo
+    # via -r requirements.in
+--editable=file:///src/bar \\
+    --config-settings=editable_mode=compat
+    # via
+    #   -r requirements.in
+    #   foo
+attrs==22.1.0
+    # via foo
+"""
+
+
+def test_render_lock_editable_roundtrip():
+    text = lockfile.render_lock(
+        lockfile.parse_lock(LOCK_WITH_EDITABLE),
+        header=lockfile.lock_header(LOCK_WITH_EDITABLE),
+        options=lockfile.lock_options(LOCK_WITH_EDITABLE),
+        editables=lockfile.lock_editables(LOCK_WITH_EDITABLE),
+    )
+    assert lockfile.lock_options(LOCK_WITH_EDITABLE) == [
+        "--index-url https://example.com/simple"
+    ]
+    assert text == LOCK_WITH_EDITABLE
+
+
+def test_render_lock_roundtrip():
+    entries = lockfile.parse_lock(LOCK_WITH_HASHES)
+    text = lockfile.render_lock(
+        entries,
+        header=lockfile.lock_header(LOCK_WITH_HASHES),
+        options=lockfile.lock_options(LOCK_WITH_HASHES),
+    )
+    assert text.startswith("#\n# This file is autogenerated by pip-compile")
+    assert "--extra-index-url file:///tmp/index/simple\n" in text
+    assert lockfile.parse_lock(text) == entries
@@ -0,0 +1,121 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from tox_pin_deps import memory
+from tox_pin_deps.compile import PIP_COMPILE_SCRIPT
+
+MiB = 1024**2
+
+FAKE_PIP_COMPILE = """
+def cli():
+    ballast = bytearray(64 * 1024 * 1024)
+    raise SystemExit(0)
+"""
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return memory.MemoryLedger(
+        tmp_path / "memory", budget=100 * MiB, poll_interval=0.01
+    )
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", ""])
+    proc.wait()
+    return proc.pid
+
+
+def test_read_peak(tmp_path):
+    path = tmp_path / "peak.json"
+    assert memory.read_peak(path) is None
+    path.write_text("{}")
+    assert memory.read_peak(path) is None
+    path.write_text('{"peak_rss": 1234}')
+    assert memory.read_peak(path) == 1234
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no resource module")
+def test_peak_rss_script(tmp_path):
+    fake = tmp_path / "site" / "piptools" / "scripts"
+    fake.mkdir(parents=True)
+    (fake.parent / "__init__.py").write_text("")
+    (fake / "__init__.py").write_text("")
+    (fake / "compile.py").write_text(FAKE_PIP_COMPILE)
+    peak_file = tmp_path / "peak.json"
+    subprocess.run(
+        [sys.executable, "-c", memory.PEAK_RSS_SCRIPT + PIP_COMPILE_SCRIPT],
+        env={"PYTHONPATH": str(tmp_path / "site"), memory.ENV_PEAK_RSS: str(peak_file)},
+        check=True,
+    )
+    assert memory.read_peak(peak_file) > 64 * MiB
+
+
+def test_estimate(ledger):
+    assert ledger.estimate("py310") == memory.DEFAULT_ESTIMATE
+    ledger.record_peak("py310", 300 * MiB)
+    ledger.record_peak("py311", 200 * MiB)
+    assert ledger.estimate("py311") == 200 * MiB
+    # unknown envs are assumed to be as large as the largest known env
+    assert ledger.estimate("lint") == 300 * MiB
+    assert json.loads((ledger.directory / memory.PEAKS_FILE).read_text()) == {
+        "py310": 300 * MiB,
+        "py311": 200 * MiB,
+    }
+
+
+def test_reservations_drop_dead_processes(ledger):
+    ledger.directory.mkdir(parents=True)
+    stale = ledger.directory / "1.1.py310.reservation"
+    stale.write_text(json.dumps({"pid": dead_pid(), "bytes": 90 * MiB}))
+    with ledger.admit("py311", 60 * MiB):
+        assert list(ledger.reservations().values()) == [60 * MiB]
+    assert not stale.exists()
+    assert ledger.reservations() == {}
+
+
+def test_admit_waits_for_budget(ledger):
+    events = []
+    first_admitted = threading.Event()
+    release_first = threading.Event()
+
+    def first():
+        with ledger.admit("big", 80 * MiB):
+            events.append("big start")
+            first_admitted.set()
+            release_first.wait()
+            events.append("big end")
+
+    def second():
+        with ledger.admit("medium", 50 * MiB):
+            events.append("medium start")
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_admitted.wait()
+    waiter = threading.Thread(target=second)
+    waiter.start()
+    time.sleep(0.1)
+    assert events == ["big start"]
+    release_first.set()
+    thread.join()
+    waiter.join()
+    assert events == ["big start", "big end", "medium start"]
+
+
+def test_admit_over_budget_when_idle(ledger):
+    with ledger.admit("huge", 500 * MiB):
+        assert sum(ledger.reservations().values()) == 500 * MiB
+        assert ledger._try_reserve("small", 1) is None
+
+
+def test_open_ledger(tmp_path):
+    ledger = memory.open_ledger(tmp_path, 100)
+    assert ledger.directory == tmp_path / memory.LEDGER_DIR
+    assert memory.open_ledger(tmp_path, 100) is ledger
+    memory._ledgers.clear()
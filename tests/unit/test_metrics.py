@@ -0,0 +1,106 @@
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import metrics
+
+
+@pytest.fixture(autouse=True)
+def session():
+    metrics.reset()
+    with mock.patch("tox_pin_deps.metrics.atexit.register") as register:
+        yield register
+    metrics.reset()
+    metrics._output = None
+
+
+def test_render_empty():
+    text = metrics.render()
+    assert "# TYPE tox_pin_deps_envs_compiled_total counter" in text
+    assert "tox_pin_deps_envs_compiled_total 0" in text.splitlines()
+    assert "# TYPE tox_pin_deps_lock_packages gauge" in text
+    assert 'tox_pin_deps_compile_seconds_bucket{le="+Inf"} 0' in text
+    # Prometheus text format: `_total` counter families and no `# EOF`
+    assert "# EOF" not in text
+    assert text.endswith("_count 0\n")
+
+
+def test_render_samples():
+    metrics.inc("envs_compiled")
+    metrics.inc("envs_compiled")
+    metrics.inc("envs_skipped", reason="cache")
+    metrics.inc("envs_skipped", reason="superset", value=2)
+    metrics.set_gauge("lock_packages", 12, env='py"310')
+    metrics.observe("compile_seconds", 0.3)
+    metrics.observe("compile_seconds", 4.0)
+    lines = metrics.render().splitlines()
+    assert "tox_pin_deps_envs_compiled_total 2" in lines
+    assert 'tox_pin_deps_envs_skipped_total{reason="cache"} 1' in lines
+    assert 'tox_pin_deps_envs_skipped_total{reason="superset"} 2' in lines
+    assert 'tox_pin_deps_lock_packages{env="py\\"310"} 12' in lines
+    assert 'tox_pin_deps_compile_seconds_bucket{le="0.1"} 0' in lines
+    assert 'tox_pin_deps_compile_seconds_bucket{le="0.5"} 1' in lines
+    assert 'tox_pin_deps_compile_seconds_bucket{le="5.0"} 2' in lines
+    assert 'tox_pin_deps_compile_seconds_bucket{le="+Inf"} 2' in lines
+    assert "tox_pin_deps_compile_seconds_sum 4.3" in lines
+    assert "tox_pin_deps_compile_seconds_count 2" in lines
+
+
+def test_write(tmp_path):
+    metrics.inc("lock_cache_hits")
+    path = tmp_path / "textfile" / "tox.prom"
+    metrics.write(path)
+    assert "tox_pin_deps_lock_cache_hits_total 1" in path.read_text().splitlines()
+    assert [p.name for p in path.parent.iterdir()] == ["tox.prom"]
+
+
+def test_write_session(tmp_path):
+    """Processes of one tox session (tox3 -p) add up their metrics."""
+    path = tmp_path / "tox.prom"
+    metrics.inc("envs_compiled")
+    metrics.set_gauge("lock_packages", 3, env="py310")
+    metrics.observe("compile_seconds", 1.0)
+    metrics.write(path, session="one")
+    metrics.reset()
+    metrics.inc("envs_compiled")
+    metrics.set_gauge("lock_packages", 5, env="py311")
+    metrics.observe("compile_seconds", 2.0)
+    metrics.write(path, session="one")
+    metrics.reset()
+    # the parent process has no samples of its own
+    metrics.write(path, session="one")
+    lines = path.read_text().splitlines()
+    assert "tox_pin_deps_envs_compiled_total 2" in lines
+    assert 'tox_pin_deps_lock_packages{env="py310"} 3' in lines
+    assert 'tox_pin_deps_lock_packages{env="py311"} 5' in lines
+    assert "tox_pin_deps_compile_seconds_count 2" in lines
+    assert "tox_pin_deps_compile_seconds_sum 3.0" in lines
+    # another session starts over
+    metrics.inc("lock_cache_hits")
+    metrics.write(path, session="two")
+    lines = path.read_text().splitlines()
+    assert "tox_pin_deps_envs_compiled_total 0" in lines
+    assert "tox_pin_deps_lock_cache_hits_total 1" in lines
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix == ".prom") == [
+        "tox.prom"
+    ]
+
+
+def test_write_session_bad_state(tmp_path):
+    path = tmp_path / "tox.prom"
+    (tmp_path / ".tox.prom.json").write_text('{"session": "one", "counters": 1}')
+    metrics.inc("envs_compiled")
+    metrics.write(path, session="one")
+    assert "tox_pin_deps_envs_compiled_total 1" in path.read_text().splitlines()
+
+
+def test_enable(tmp_path, session):
+    metrics.enable("")
+    assert not metrics.enabled()
+    session.assert_not_called()
+    metrics.enable(tmp_path / "a.prom")
+    metrics.enable(tmp_path / "b.prom")
+    assert metrics.enabled()
+    session.assert_called_once_with(metrics._write_output)
+    metrics._write_output()
+    assert [p.name for p in tmp_path.glob("*.prom")] == ["b.prom"]
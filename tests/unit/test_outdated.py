@@ -0,0 +1,295 @@
+import functools
+import http.server
+import json
+import socketserver
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from tox_pin_deps import cli, outdated, watch
+
+pytest.importorskip("dumb_pypi")
+
+PACKAGE_FILES = [
+    "requests-2.28.0-py3-none-any.whl",
+    "requests-2.31.0-py3-none-any.whl",
+    "requests-3.0.0b1.tar.gz",
+    "urllib3-1.26.5-py2.py3-none-any.whl",
+    "urllib3-1.26.18-py2.py3-none-any.whl",
+    "urllib3-2.0.7-py3-none-any.whl",
+    "six-1.16.0-py2.py3-none-any.whl",
+    "Flake8-5.0.4.tar.gz",
+    "flake8-6.0.0.tar.gz",
+]
+YANKED_FILES = ["requests-2.32.0-py3-none-any.whl"]
+LOCKS = {
+    "py310": "requests==2.28.0\nurllib3==1.26.5\nsix==1.16.0\n",
+    "py311": "requests==2.31.0\nurllib3==1.26.5\n",
+    "lint": "flake8==5.0.4\nunknown-pkg==1.0\n",
+}
+
+
+@pytest.fixture(scope="module")
+def dumb_pypi_index(tmp_path_factory):
+    path = tmp_path_factory.mktemp("index")
+    package_json = path / "packages.json"
+    package_json.write_text(
+        "\n".join(
+            [json.dumps({"filename": f}) for f in PACKAGE_FILES]
+            + [
+                json.dumps({"filename": f, "yanked_reason": "bad"})
+                for f in YANKED_FILES
+            ]
+        )
+    )
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "dumb_pypi.main",
+            "--package-list-json",
+            str(package_json),
+            "--packages-url",
+            "../../pool/",
+            "--output-dir",
+            str(path / "index"),
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return path / "index"
+
+
+@pytest.fixture
+def requirements_directory(toxinidir):
+    directory = toxinidir / "requirements"
+    directory.mkdir()
+    for envname, text in LOCKS.items():
+        (directory / f"{envname}.txt").write_text(text)
+    return directory
+
+
+@pytest.fixture
+def http_index(dumb_pypi_index):
+    requests = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args):
+            requests.append((self.client_address, self.path))
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(Handler, directory=str(dumb_pypi_index)),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/simple", requests
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize(
+    "filename, version",
+    [
+        ("foo_bar-1.0-py3-none-any.whl", "1.0"),
+        ("foo_bar-1.0-1-py3-none-any.whl", "1.0"),
+        ("foo-bar-2.0rc1.tar.gz", "2.0rc1"),
+        ("foo-0.1.zip", "0.1"),
+        ("foo.exe", None),
+        ("foo.tar.gz", None),
+    ],
+)
+def test_file_version(filename, version):
+    assert outdated.file_version(filename) == version
+
+
+def test_parse_project_page():
+    page = (
+        '<a href="../../pool/foo-1.0.tar.gz#sha256=abc">foo-1.0.tar.gz</a>'
+        '<a href="../../pool/foo-1.0-py3-none-any.whl">foo-1.0-py3-none-any.whl</a>'
+        '<a href="../../pool/foo-1.1.tar.gz" data-yanked="">foo-1.1.tar.gz</a>'
+        '<a href="/pool/foo-1.2.tar.gz" data-yanked="oops">foo-1.2.tar.gz</a>'
+        '<a href="/pool/foo-1.2-py3-none-any.whl">foo-1.2-py3-none-any.whl</a>'
+    )
+    assert outdated.parse_project_page(page) == {
+        "1.0": False,
+        "1.1": True,
+        "1.2": False,
+    }
+
+
+def test_deps_specifiers(tmp_path):
+    (tmp_path / "requirements-test.txt").write_text("-c constraints.txt\nurllib3\n")
+    (tmp_path / "constraints.txt").write_text("Requests<3  # comment\n")
+    specifiers = outdated.deps_specifiers(
+        ["requests >= 2", "-r requirements-test.txt", "./local", "--pre"],
+        tmp_path,
+    )
+    assert {name: str(spec) for name, spec in specifiers.items()} == {
+        "requests": "<3,>=2",
+        "urllib3": "",
+    }
+
+
+def test_scan(dumb_pypi_index, requirements_directory):
+    client = outdated.IndexClient([dumb_pypi_index.joinpath("simple").as_uri()])
+    result = outdated.scan(
+        outdated.read_locks(requirements_directory),
+        client,
+        constraints={
+            "py310": {"urllib3": outdated.deps_specifiers(["urllib3<2"])["urllib3"]},
+            "py311": {"urllib3": outdated.deps_specifiers(["urllib3<1.26"])["urllib3"]},
+        },
+    )
+    assert result.errors == {}
+    assert result.outdated == [
+        outdated.Outdated("lint", "flake8", "5.0.4", "6.0.0", "6.0.0"),
+        outdated.Outdated("py310", "requests", "2.28.0", "2.31.0", "2.31.0"),
+        outdated.Outdated("py310", "urllib3", "1.26.5", "1.26.18", "2.0.7"),
+        outdated.Outdated("py311", "urllib3", "1.26.5", None, "2.0.7"),
+    ]
+    assert outdated.format_report(result.outdated).splitlines() == [
+        "lint",
+        "    flake8 5.0.4 -> 6.0.0",
+        "py310",
+        "    requests 2.28.0 -> 2.31.0",
+        "    urllib3 1.26.5 -> 1.26.18 (latest 2.0.7)",
+        "py311",
+        "    urllib3 1.26.5: held back by deps (latest 2.0.7)",
+    ]
+    pre = outdated.scan(
+        outdated.read_locks(requirements_directory, ["py311"]), client, pre=True
+    )
+    assert pre.outdated == [
+        outdated.Outdated("py311", "requests", "2.31.0", "3.0.0b1", "3.0.0b1"),
+        outdated.Outdated("py311", "urllib3", "1.26.5", "2.0.7", "2.0.7"),
+    ]
+
+
+def test_scan_http(http_index, requirements_directory):
+    index_url, requests = http_index
+    client = outdated.IndexClient([index_url])
+    try:
+        result = outdated.scan(
+            outdated.read_locks(requirements_directory),
+            client,
+            max_workers=2,
+        )
+    finally:
+        client.close()
+    assert result.errors == {}
+    assert len(result.outdated) == 4
+    paths = sorted(path for _, path in requests)
+    # each unique package is fetched once, and connections are reused
+    assert paths == [
+        "/simple/flake8/",
+        "/simple/requests/",
+        "/simple/six/",
+        "/simple/unknown-pkg/",
+        "/simple/urllib3/",
+    ]
+    assert len({client_address for client_address, _ in requests}) < len(requests)
+
+
+def test_scan_errors(requirements_directory):
+    client = outdated.IndexClient(["http://127.0.0.1:1/simple"], timeout=5)
+    result = outdated.scan(
+        outdated.read_locks(requirements_directory, ["py311"]), client
+    )
+    assert result.outdated == []
+    assert sorted(result.errors) == ["requests", "urllib3"]
+
+
+def test_scan_protocol_errors(requirements_directory):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.rfile.readline()
+            self.wfile.write(b"not http\r\n")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = outdated.IndexClient(
+        [f"http://127.0.0.1:{server.server_address[1]}/simple"], timeout=5
+    )
+    try:
+        with pytest.raises(OSError, match="BadStatusLine"):
+            client.get(f"{client.index_urls[0]}/requests/")
+        result = outdated.scan(
+            outdated.read_locks(requirements_directory, ["py311"]), client
+        )
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    assert result.outdated == []
+    assert sorted(result.errors) == ["requests", "urllib3"]
+
+
+def test_cli_outdated(dumb_pypi_index, requirements_directory, toxinidir, capsys):
+    argv = ["--root", str(toxinidir), "outdated", "--no-tox", "-e", "py310,lint"]
+    index_args = ["--index-url", dumb_pypi_index.joinpath("simple").as_uri()]
+    assert cli.main([*argv, *index_args, "--json"]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        "lint": {"flake8": {"current": "5.0.4", "allowed": "6.0.0", "latest": "6.0.0"}},
+        "py310": {
+            "requests": {"current": "2.28.0", "allowed": "2.31.0", "latest": "2.31.0"},
+            "urllib3": {"current": "1.26.5", "allowed": "2.0.7", "latest": "2.0.7"},
+        },
+    }
+
+
+def test_cli_outdated_tox_deps(
+    dumb_pypi_index,
+    requirements_directory,
+    toxinidir,
+    monkeypatch,
+    capsys,
+):
+    read_tox_config_calls = []
+
+    def read_tox_config(**kwargs):
+        read_tox_config_calls.append(kwargs)
+        return {"py310": {"deps": "requests\nurllib3 < 2"}}
+
+    monkeypatch.setattr(watch, "read_tox_config", read_tox_config)
+    monkeypatch.setenv("PIP_INDEX_URL", dumb_pypi_index.joinpath("simple").as_uri())
+    monkeypatch.delenv("PIP_EXTRA_INDEX_URL", raising=False)
+    assert cli.main(["--root", str(toxinidir), "outdated", "-e", "py310"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "py310",
+        "    requests 2.28.0 -> 2.31.0",
+        "    urllib3 1.26.5 -> 1.26.18 (latest 2.0.7)",
+    ]
+    assert read_tox_config_calls[0]["envs"] == ["py310"]
+    assert read_tox_config_calls[0]["keys"] == ("deps",)
+
+
+def test_cli_outdated_no_tox_config(
+    dumb_pypi_index,
+    requirements_directory,
+    toxinidir,
+    capsys,
+):
+    argv = [
+        "--root",
+        str(toxinidir),
+        "outdated",
+        "--tox",
+        f"{sys.executable} -c 'raise SystemExit(1)'",
+        "--index-url",
+        dumb_pypi_index.joinpath("simple").as_uri(),
+        "-e",
+        "py311",
+    ]
+    assert cli.main(argv) == 0
+    captured = capsys.readouterr()
+    assert "comparing pins to the latest releases" in captured.err
+    assert "    urllib3 1.26.5 -> 2.0.7" in captured.out.splitlines()
@@ -0,0 +1,214 @@
+import logging
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import cli, pipcache
+
+from .conftest import make_wheel, sha256
+
+MiB = 1024**2
+
+
+def touch(path, used, data=None):
+    if data is not None:
+        path.write_bytes(data)
+    os.utime(path, (used, used))
+    return path
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    """A pip cache with entries last used at t=0 (oldest) to t=6 (newest)."""
+    cache_dir = tmp_path / "pip-cache"
+    built = cache_dir / "wheels" / "ab" / "cd" / "0123"
+    built.mkdir(parents=True)
+    touch(make_wheel(built, "built_pkg", "1.0", "py3-none-any"), 1)
+    touch(built / "origin.json", 1, b"{}")
+    stale = cache_dir / "wheels" / "ab" / "ef" / "4567"
+    stale.mkdir(parents=True)
+    touch(make_wheel(stale, "stale_built", "0.1", "py3-none-any"), 2)
+    http = cache_dir / "http-v2" / "a" / "b"
+    http.mkdir(parents=True)
+    for used, key, name, version in [
+        (3, "shared", "Shared", "1.0.0"),
+        (4, "unused", "unused", "1.0"),
+    ]:
+        wheel = make_wheel(http, name, version, "py3-none-any")
+        touch(wheel.rename(http / f"{key}.body"), used)
+        touch(http / key, used, b"headers")
+    touch(http / "sdist.body", 5, b"an sdist" * 1000)
+    touch(http / "index.body", 6, b"<html>" * 1000)
+    legacy = cache_dir / "http" / "c"
+    legacy.mkdir(parents=True)
+    touch(legacy / "legacy", 0, b"cached response" * 1000)
+    return cache_dir
+
+
+@pytest.fixture
+def locks(toxinidir, cache_dir):
+    requirements = toxinidir / "requirements"
+    requirements.mkdir()
+    (requirements / "py310.txt").write_text(
+        "shared==1.0\n"
+        f"sdist-pkg==2.0 \\\n    --hash={sha256(cache_dir / 'http-v2/a/b/sdist.body')}\n"
+    )
+    staged = toxinidir / ".tox" / "tox-pin-deps" / "bundle"
+    staged.mkdir(parents=True)
+    (staged / "lint.txt").write_text("Built.Pkg==1.0\n")
+    return pipcache.lock_files(requirements, toxinidir / ".tox")
+
+
+def names(entries):
+    return [entry.paths[-1].name for entry in entries]
+
+
+def test_cache_entries(cache_dir):
+    entries = pipcache.cache_entries(cache_dir)
+    assert names(entries) == [
+        "legacy",
+        "origin.json",
+        "stale_built-0.1-py3-none-any.whl",
+        "shared.body",
+        "unused.body",
+        "sdist.body",
+        "index.body",
+    ]
+    assert sorted(p.name for p in entries[1].paths) == [
+        "built_pkg-1.0-py3-none-any.whl",
+        "origin.json",
+    ]
+    assert sorted(p.name for p in entries[3].paths) == ["shared", "shared.body"]
+    assert entries[3].size == sum(p.stat().st_size for p in entries[3].paths)
+    assert pipcache.cache_entries(cache_dir / "missing") == []
+
+
+def test_referenced(locks, cache_dir):
+    assert [lock.name for lock in locks] == ["py310.txt", "lint.txt"]
+    needed = pipcache.referenced(locks)
+    assert sorted(name for name, _ in needed.pins) == [
+        "built-pkg",
+        "sdist-pkg",
+        "shared",
+    ]
+    assert needed.hashes == {sha256(cache_dir / "http-v2/a/b/sdist.body")[7:]}
+    referenced = [
+        entry
+        for entry in pipcache.cache_entries(cache_dir)
+        if pipcache.is_referenced(entry, needed)
+    ]
+    # by wheel filename, dist-info of a downloaded wheel, and hash
+    assert names(referenced) == ["origin.json", "shared.body", "sdist.body"]
+
+
+@pytest.mark.parametrize(
+    "max_size, evicted",
+    [
+        (
+            0,
+            ["legacy", "stale_built-0.1-py3-none-any.whl", "unused.body", "index.body"],
+        ),
+        (16 * 1024, ["legacy"]),
+        (MiB, []),
+    ],
+)
+def test_prune(locks, cache_dir, max_size, evicted):
+    before = pipcache.cache_entries(cache_dir)
+    removed = [entry for entry in before if names([entry])[0] in evicted]
+    result = pipcache.prune(cache_dir, locks, max_size=max_size, dry_run=True)
+    assert pipcache.cache_entries(cache_dir) == before
+    assert result == pipcache.prune(cache_dir, locks, max_size=max_size)
+    after = pipcache.cache_entries(cache_dir)
+    assert names(after) == [n for n in names(before) if n not in evicted]
+    assert result.entries == len(before)
+    assert result.evicted == len(evicted)
+    assert result.freed == sum(entry.size for entry in removed)
+    assert result.size == sum(entry.size for entry in before)
+    assert all(not path.exists() for entry in removed for path in entry.paths)
+
+
+def test_prune_referenced_over_budget(locks, cache_dir, caplog):
+    with caplog.at_level(logging.WARNING):
+        result = pipcache.prune(cache_dir, locks, max_size=0)
+    assert result.referenced > 0
+    assert "referenced by lock files exceed the budget" in caplog.text
+    assert names(pipcache.cache_entries(cache_dir)) == [
+        "origin.json",
+        "shared.body",
+        "sdist.body",
+    ]
+
+
+def test_prune_under_budget(locks, cache_dir):
+    with mock.patch(
+        "tox_pin_deps.pipcache.is_referenced", return_value=False
+    ) as is_referenced:
+        result = pipcache.prune(cache_dir, locks, max_size=MiB)
+        pipcache.prune(cache_dir, locks, max_size=16 * 1024)
+    # only the oldest entry was over the budget
+    is_referenced.assert_called_once()
+    assert is_referenced.call_args[0][0].paths[-1].name == "legacy"
+    assert result == (7, 0, result.size, 0, 0)
+
+
+def test_prune_piptools_downloads(toxinidir, tmp_path):
+    downloads = tmp_path / "pip-tools" / "pkgs"
+    (downloads / "ab" / "cd").mkdir(parents=True)
+    touch(downloads / "ab" / "cd" / "Shared-1.0.tar.gz", 1, b"sdist")
+    touch(downloads / "unused-2.0.zip", 2, b"sdist")
+    touch(tmp_path / "pip-tools" / "depcache-cp3.11.json", 3, b"{}")
+    lock = toxinidir / "py310.txt"
+    lock.write_text("shared==1.0.0\n")
+    result = pipcache.prune(tmp_path / "pip-tools", [lock], max_size=0)
+    assert result.evicted == 1
+    assert names(pipcache.cache_entries(tmp_path / "pip-tools")) == [
+        "Shared-1.0.tar.gz"
+    ]
+    assert (tmp_path / "pip-tools" / "depcache-cp3.11.json").exists()
+
+
+def test_cache_dirs(tmp_path):
+    assert pipcache.pip_cache_dir({"PIP_CACHE_DIR": str(tmp_path)}) == tmp_path
+    assert pipcache.pip_cache_dir({"XDG_CACHE_HOME": str(tmp_path)}) == tmp_path / "pip"
+    assert pipcache.cache_dirs({"XDG_CACHE_HOME": str(tmp_path)}) == [
+        tmp_path / "pip",
+        tmp_path / "pip-tools",
+    ]
+    assert pipcache.piptools_cache_dir({"PIP_TOOLS_CACHE_DIR": "/x"}) == Path("/x")
+
+
+def test_prune_at_exit(locks, cache_dir, toxinidir, tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("PIP_CACHE_DIR", str(cache_dir))
+    monkeypatch.setenv("PIP_TOOLS_CACHE_DIR", str(tmp_path / "missing"))
+    monkeypatch.setattr(pipcache, "_prune_args", None)
+    with mock.patch("atexit.register") as register:
+        pipcache.prune_at_exit(None, toxinidir, toxinidir / ".tox")
+        register.assert_not_called()
+        pipcache.prune_at_exit(0, toxinidir, toxinidir / ".tox")
+        pipcache.prune_at_exit(0, toxinidir, toxinidir / ".tox")
+    register.assert_called_once_with(pipcache._prune_at_exit)
+    with caplog.at_level(logging.WARNING):
+        pipcache._prune_at_exit()
+    assert f"tox-pin-deps: {cache_dir}: evicted 4 of 7 entries" in caplog.text
+    assert len(pipcache.cache_entries(cache_dir)) == 3
+
+
+def test_cli_prune_cache(locks, cache_dir, toxinidir, capsys):
+    argv = [
+        "--root",
+        str(toxinidir),
+        "prune-cache",
+        "--max-size",
+        "16K",
+        "--cache-dir",
+        str(cache_dir),
+    ]
+    assert cli.main([*argv, "--dry-run"]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith(f"{cache_dir}: evicted 1 of 7 entries, freed ")
+    assert out.rstrip().endswith("(dry run)")
+    assert len(pipcache.cache_entries(cache_dir)) == 7
+    assert cli.main(argv) == 0
+    assert len(pipcache.cache_entries(cache_dir)) == 6
@@ -0,0 +1,91 @@
+import pytest
+
+from tox_pin_deps import inputs, plan
+
+
+@pytest.fixture
+def compile_plan(toxinidir):
+    (toxinidir / "pyproject.toml").write_text("[project]\nname = 'demo'\n")
+    (toxinidir / "constraints.txt").write_text("foo<2\n")
+    return plan.CompilePlan(
+        envname="py310",
+        deps=("foo", "-c constraints.txt"),
+        sources=plan.digests([toxinidir / "pyproject.toml"]),
+        included=plan.digests([toxinidir / "constraints.txt"]),
+        opts=("--generate-hashes",),
+        extras=("test",),
+        pre=True,
+        output_file=str(toxinidir / "requirements" / "py310.txt"),
+        toxinidir=str(toxinidir),
+        custom_compile_command="tox -e py310 --pip-compile",
+    )
+
+
+def test_compile_plan_value(compile_plan):
+    assert not hasattr(compile_plan, "__dict__")
+    with pytest.raises(AttributeError):
+        compile_plan.pre = False
+    same = compile_plan._replace()
+    assert same == compile_plan
+    assert {compile_plan: 1}[same] == 1
+
+
+def test_compile_plan_args(compile_plan, toxinidir):
+    assert compile_plan.compile_opts == ["--generate-hashes", "--extra", "test"]
+    assert compile_plan.args("deps.in") == [
+        "--pre",
+        "deps.in",
+        str(toxinidir / "pyproject.toml"),
+        "--output-file",
+        str(toxinidir / "requirements" / "py310.txt"),
+        "--generate-hashes",
+        "--extra",
+        "test",
+    ]
+    assert compile_plan._replace(pre=False).args()[0] == str(
+        toxinidir / "pyproject.toml"
+    )
+
+
+def test_compile_plan_digest(compile_plan, toxinidir):
+    expected = inputs.inputs_digest(
+        deps=compile_plan.deps,
+        sources=[toxinidir / "pyproject.toml", toxinidir / "constraints.txt"],
+        options=[
+            "env=py310",
+            "custom_compile_command=tox -e py310 --pip-compile",
+            "pre=True",
+            "--generate-hashes",
+            "--extra",
+            "test",
+        ],
+    )
+    assert compile_plan.digest == expected
+    # content is digested when the plan is made
+    (toxinidir / "constraints.txt").write_text("foo<3\n")
+    assert compile_plan.digest == expected
+    slimmed = compile_plan._replace(slim=True)
+    assert slimmed.digest != expected
+    assert slimmed._replace(slim_platforms=("win_amd64",)).digest != slimmed.digest
+    assert slimmed._replace(slim_drop_excluded=True).digest != slimmed.digest
+    assert compile_plan._replace(envname="lint").digest != expected
+    assert compile_plan._replace(custom_compile_command="make lock").digest != expected
+    assert compile_plan._replace(interpreter=(("python", "3.10.9"),)).digest != expected
+    pip_tools = compile_plan._replace(interpreter=(("pip-tools", "7.3.0"),))
+    assert (
+        pip_tools._replace(interpreter=(("pip-tools", "7.4.0"),)).digest
+        != pip_tools.digest
+    )
+    local = compile_plan._replace(local=(("/libs/foo", "abc"),))
+    assert local.digest != expected
+    assert local._replace(local=(("/libs/foo", "def"),)).digest != local.digest
+
+
+def test_compile_plan_options_digest(compile_plan):
+    options_digest = compile_plan.options_digest
+    edited = compile_plan._replace(
+        deps=("bar",), sources=(), local=(("/libs/foo", "abc"),)
+    )
+    assert edited.options_digest == options_digest
+    assert compile_plan._replace(pre=False).options_digest != options_digest
+    assert compile_plan._replace(opts=()).options_digest != options_digest
@@ -1,13 +1,18 @@
+import os
 from pathlib import Path
 import shlex
 from unittest import mock
 
 import pytest
 
-from . import tox_mocks
+from . import test_superset, tox_mocks
 
 with tox_mocks.MockTox3Context():
     import tox_pin_deps.common
+    import tox_pin_deps.history
+    import tox_pin_deps.installer
+    import tox_pin_deps.lockfile
+    import tox_pin_deps.metrics
     import tox_pin_deps.plugin
 
 
@@ -16,6 +21,7 @@ def config(tmp_path, toxinidir, options):
     """tox3 global config"""
     config = mock.Mock()
     config.toxinidir = toxinidir
+    config.toxworkdir = toxinidir / ".tox"
     config.option = options
     config.envconfigs = {}
     config.envlist = []
@@ -32,6 +38,7 @@ def envconfig(venv_name, config):
     envconfig.recreate = False
     envconfig.pip_pre = False
     envconfig.extras = []
+    envconfig.envpython = config.toxinidir / ".tox" / venv_name / "bin" / "python"
     config.envconfigs[venv_name] = envconfig
     config.envlist.append(venv_name)
     return envconfig
@@ -142,6 +149,89 @@ def test_tox_configure(
         assert not venv.envconfig.recreate
 
 
+@pytest.mark.parametrize("parallel", [0, 2, None])
+def test_tox_configure_schedule(config, options, parallel):
+    options.parallel = parallel
+    config.envlist = ["lint", "py37", "py310"]
+    config.envconfigs = {name: mock.Mock(envname=name) for name in config.envlist}
+    env_history = tox_pin_deps.history.History(config.toxworkdir)
+    env_history.record("py37", "compile", 300.0)
+    env_history.record("py310", "compile", 30.0)
+    env_history.record("lint", "compile", 5.0)
+    assert tox_pin_deps.plugin.tox_configure(config) is None
+    if parallel == 0:
+        assert config.envlist == ["lint", "py37", "py310"]
+    else:
+        assert config.envlist == ["py37", "py310", "lint"]
+
+
+def test_tox_configure_parallel_session(
+    venv, config, options, action, monkeypatch, tmp_path
+):
+    options.parallel = 2
+    options.pip_compile_metrics = str(tmp_path / "tox.prom")
+    config.envlist = ["lint", "py37", ".pkg"]
+    config.envconfigs = {name: mock.Mock(envname=name) for name in config.envlist}
+    monkeypatch.setattr(tox_pin_deps.metrics, "_output", None)
+    with mock.patch("tox_pin_deps.metrics.atexit.register") as register:
+        assert tox_pin_deps.plugin.tox_configure(config) is None
+    # the parent writes the metrics of all envs once they are done
+    register.assert_called_once_with(tox_pin_deps.metrics._write_output)
+    session = os.environ[tox_pin_deps.common.ENV_SESSION]
+    # each env's tox process selects only that env, and inherits the session
+    monkeypatch.setenv("TOX_PARALLEL_ENV", "py37")
+    config.envlist = ["py37"]
+    assert tox_pin_deps.plugin.tox_configure(config) is None
+    assert os.environ[tox_pin_deps.common.ENV_SESSION] == session
+    venv.envconfig.config = config
+    pct3 = tox_pin_deps.installer.PipCompileTox3(venv, action)
+    assert sorted(pct3.selected_envs()) == ["lint", "py37"]
+
+
+@pytest.mark.parametrize("parallel_env", ["", "py37"])
+def test_tox_configure_prune_pip_cache(config, options, monkeypatch, parallel_env):
+    options.pip_compile_prune_pip_cache = "2G"
+    monkeypatch.setenv("TOX_PARALLEL_ENV", parallel_env)
+    with mock.patch("tox_pin_deps.pipcache.prune_at_exit") as prune_at_exit:
+        assert tox_pin_deps.plugin.tox_configure(config) is None
+    if parallel_env:
+        # only the parent tox process prunes
+        prune_at_exit.assert_not_called()
+    else:
+        prune_at_exit.assert_called_once_with(
+            2 * 1024**3, config.toxinidir, config.toxworkdir
+        )
+
+
+def test_tox_upgrade_package(
+    venv, config, options, envconfig, action, deps_present, toxinidir
+):
+    options.pip_compile = False
+    options.pip_compile_upgrade_package = ["Foo"]
+    lock = tox_pin_deps.common.requirements_file(toxinidir, envconfig.envname)
+    lock.parent.mkdir()
+    lock.write_text("foo==1.0\nbar==2.0\n")
+    other = mock.Mock(envname="other", recreate=False, deps=deps_present)
+    config.envconfigs["other"] = other
+    config.envlist.append("other")
+    other_lock = tox_pin_deps.common.requirements_file(toxinidir, "other")
+    other_lock.write_text("bar==2.0\n")
+    assert tox_pin_deps.plugin.tox_configure(config) is None
+    # the env pinning foo is recreated from its deps, the other uses its lock
+    assert envconfig.recreate
+    assert envconfig.deps == deps_present
+    assert not other.recreate
+    assert [str(dep) for dep in other.deps] == [f"-r{other_lock}"]
+    assert tox_pin_deps.plugin.tox_testenv_install_deps(venv, action) is None
+    cmds = [c[1][0] for c in venv._pcall.mock_calls]
+    assert cmds[0] == ["pip", "install", "pip-tools"]
+    assert cmds[1][0] == "pip-compile"
+    assert str(lock) not in cmds[1][: cmds[1].index("--output-file")]
+    assert cmds[1][cmds[1].index("--output-file") + 1] == str(lock)
+    assert cmds[1][-2:] == ["--upgrade-package", "foo"]
+    assert [str(dep) for dep in envconfig.deps] == [f"-r{lock}"]
+
+
 def test_tox_configure_dot_envname(
     dot_venv,
     config,
@@ -193,6 +283,35 @@ def test_tox_testenv_install_deps(
         venv._pcall.assert_not_called()
 
 
+def test_tox_runtest_pre_install_timing(venv, config, action, deps, env_requirements):
+    tox_pin_deps.metrics.reset()
+    tox_pin_deps.plugin.tox_testenv_install_deps(venv, action)
+    installed_from_lock = str(venv.envconfig.deps[0]).startswith("-r")
+    assert tox_pin_deps.plugin.tox_runtest_pre(venv) is None
+    lines = tox_pin_deps.metrics.render().splitlines()
+    tox_pin_deps.metrics.reset()
+    count = 1 if installed_from_lock else 0
+    assert f"tox_pin_deps_install_from_lock_seconds_count {count}" in lines
+    assert not tox_pin_deps.plugin._install_started
+    recent = tox_pin_deps.history.History(config.toxworkdir).recent("install")
+    assert len(recent.get(venv.envconfig.envname, [])) == count
+
+
+def test_tox_testenv_install_deps_bundle(
+    venv, action, options, deps_present, lock_bundle
+):
+    options.pip_compile = False
+    options.pip_compile_bundle = str(lock_bundle)
+    assert tox_pin_deps.plugin.tox_testenv_install_deps(venv, action) is None
+    toxinidir = venv.envconfig.config.toxinidir
+    staged = Path(
+        toxinidir, ".tox", "tox-pin-deps", "bundle", f"{venv.envconfig.envname}.txt"
+    )
+    assert [dep.name for dep in venv.envconfig.deps] == [f"-r{staged}"]
+    assert tox_pin_deps.lockfile.read_lock(staged)[0].pin == "foo==1.0"
+    venv._pcall.assert_not_called()
+
+
 def test_tox_testenv_install_deps_will_install(
     venv,
     action,
@@ -258,3 +377,115 @@ def test_tox_testenv_install_deps_dot_envname(
     dot_venv.get_resolved_dependencies.assert_not_called()
     dot_venv._pcall.assert_not_called()
     assert dot_venv.envconfig.deps == deps_present
+
+
+def test_tox_testenv_install_deps_conflicting(
+    venv, envconfig, toxinidir, options, action, caplog
+):
+    options.pip_compile = True
+    (toxinidir / "pyproject.toml").write_text(
+        "[project]\nname = 'demo'\ndependencies = ['attrs>=22']\n"
+    )
+    envconfig.skip_install = False
+    envconfig.config.skipsdist = False
+    envconfig.deps = [tox_pin_deps.plugin.DepConfig("attrs<22")]
+    venv.get_resolved_dependencies = mock.Mock(return_value=envconfig.deps)
+    with pytest.raises(tox_mocks.InvocationError) as exc_info:
+        tox_pin_deps.plugin.tox_testenv_install_deps(venv, action)
+    assert "conflicting requirements: attrs>=22" in str(exc_info.value)
+    assert "conflicting requirements: attrs>=22" in caplog.text
+    venv._pcall.assert_not_called()
+
+
+def test_tox_testenv_install_deps_bad_bundle(
+    venv, envconfig, toxinidir, options, action, deps_present, caplog
+):
+    options.pip_compile = False
+    options.pip_compile_bundle = "locks.bundle"
+    (toxinidir / "locks.bundle").write_text("not a zip file")
+    venv.get_resolved_dependencies = mock.Mock(return_value=envconfig.deps)
+    with pytest.raises(tox_mocks.InvocationError) as exc_info:
+        tox_pin_deps.plugin.tox_testenv_install_deps(venv, action)
+    assert str(exc_info.value) == f"{toxinidir / 'locks.bundle'}: not a lock bundle"
+    assert "not a lock bundle" in caplog.text
+    venv._pcall.assert_not_called()
+
+
+def test_tox_testenv_install_deps_superset(venv, envconfig, config, options, action):
+    options.pip_compile_superset = True
+    envconfig.deps = [tox_pin_deps.plugin.DepConfig("requests")]
+    venv.get_resolved_dependencies = mock.Mock(return_value=envconfig.deps)
+    for ec in [envconfig, mock.Mock()]:
+        ec.config = config
+        ec.basepython = "python3.10"
+        ec.pip_compile_opts = None
+        ec.pip_pre = False
+        ec.extras = []
+        ec.skip_install = False
+    config.skipsdist = False
+    other = ec
+    other.envname = "other"
+    other.envpython = config.toxinidir / ".tox" / "other" / "bin" / "python"
+    other.deps = [tox_pin_deps.plugin.DepConfig("pytest")]
+    config.envconfigs["other"] = other
+    config.envlist.append("other")
+
+    requirements = config.toxinidir / "requirements"
+    requirements.mkdir()
+    (requirements / f"{envconfig.envname}.txt").write_text(
+        "requests==2.28.0\nurllib3==1.26.12\n"
+    )
+    (requirements / "other.txt").write_text("pytest==7.2.0\nurllib3==1.26.13\n")
+    seeds = []
+
+    def _pcall(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            output_file = Path(cmd[cmd.index("--output-file") + 1])
+            seeds.append(tox_pin_deps.lockfile.parse_lock(output_file.read_text()))
+            output_file.write_text(test_superset.SUPERSET_LOCK)
+
+    venv._pcall.side_effect = _pcall
+    assert tox_pin_deps.plugin.tox_testenv_install_deps(venv, action) is None
+    assert len(venv._pcall.mock_calls) == 2
+    # the union starts from the members' pins
+    assert [e.pin for e in seeds[0]] == [
+        "pytest==7.2.0",
+        "requests==2.28.0",
+        "urllib3==1.26.13",
+    ]
+    cmd = venv._pcall.mock_calls[1][1][0]
+    assert cmd[1].endswith(".in")
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=config.toxinidir,
+        envname=envconfig.envname,
+    )
+    assert venv.envconfig.deps[0].name == f"-r{env_requirements}"
+    assert [e.pin for e in tox_pin_deps.lockfile.read_lock(env_requirements)] == [
+        "requests==2.28.1",
+        "urllib3==1.26.13",
+    ]
+    other_requirements = env_requirements.parent / "other.txt"
+    assert [e.name for e in tox_pin_deps.lockfile.read_lock(other_requirements)] == [
+        "attrs",
+        "iniconfig",
+        "pytest",
+        "urllib3",
+    ]
+    # the second member reuses the projected lock without running pip-compile
+    other_venv = mock.Mock()
+    other_venv.envconfig = other
+    other_venv.get_resolved_dependencies = mock.Mock(return_value=other.deps)
+    assert tox_pin_deps.plugin.tox_testenv_install_deps(other_venv, action) is None
+    other_venv._pcall.assert_not_called()
+    assert other.deps[0].name == f"-r{other_requirements}"
+
+
+def test_tox_superset_parallel(venv, config, options, action, deps_present, caplog):
+    options.pip_compile_superset = True
+    options.parallel = 2
+    assert tox_pin_deps.plugin.tox_configure(config) is None
+    assert "--pip-compile-superset is not supported with tox3 -p" in caplog.text
+    with mock.patch.dict("os.environ", TOX_PARALLEL_ENV=venv.envconfig.envname):
+        pct3 = tox_pin_deps.installer.PipCompileTox3(venv, action)
+        assert not pct3.want_superset
+    assert pct3.want_superset
@@ -1,19 +1,28 @@
+import json
 from pathlib import Path
 import shlex
 from unittest import mock
 
 import pytest
 
+from . import tox_mocks
 from .tox_mocks import MockTox4Context, ShimBaseMock
 
 with MockTox4Context():
     import tox_pin_deps.plugin4
+    import tox_pin_deps.installer4
+    import tox_pin_deps.history
+    import tox_pin_deps.localdeps
+    import tox_pin_deps.metrics
+    import tox_pin_deps.pipcache
+    import tox_pin_deps.preflight
+    import tox_pin_deps.profiling
 
 
 @pytest.fixture
 def core(toxinidir):
     """tox4 global config"""
-    return dict(toxinidir=toxinidir, skipsdist=False)
+    return dict(toxinidir=toxinidir, work_dir=toxinidir / ".tox", skipsdist=False)
 
 
 @pytest.fixture
@@ -49,9 +58,14 @@ def venv(venv_name, core, conf, options, toxinidir, executor):
     venv.conf = conf
     venv.options = options
     venv.execute = executor
+    venv.environment_variables = {}
+    venv.journal = mock.MagicMock()
+    venv.env_python.return_value = toxinidir / "dot-tox" / venv_name / "bin" / "python"
     venv.toxinidir = toxinidir
     venv.path = toxinidir / "dot-tox" / venv_name
     venv.path.mkdir(parents=True)
+    venv.env_site_package_dir.return_value = venv.path / "lib" / "site-packages"
+    venv.creator.platlib = venv.path / "lib64" / "site-packages"
     return venv
 
 
@@ -68,14 +82,14 @@ def dot_venv(venv, toxinidir):
 def deps(deps):
     """`deps` for tox4 Installer[Python].install function."""
     if deps:
-        return tox_pin_deps.plugin4.PythonDeps(raw="\n".join(deps))
+        return tox_pin_deps.installer4.PythonDeps(raw="\n".join(deps))
     return None  # TODO: what does tox4 really do when there are no deps
 
 
 @pytest.fixture
 def deps_present(deps_present):
     """Set `deps_present` in the tox4 envconfig."""
-    return tox_pin_deps.plugin4.PythonDeps(raw="\n".join(deps_present))
+    return tox_pin_deps.installer4.PythonDeps(raw="\n".join(deps_present))
 
 
 @pytest.fixture
@@ -121,7 +135,7 @@ def test_install(
     deps,
     env_requirements,
 ):
-    pip_compile_installer = tox_pin_deps.plugin4.PipCompileInstaller(venv)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
     assert pip_compile_installer.install(deps, None, None) is None
     pip_mock = ShimBaseMock._get_last_instance_and_reset(assert_n_instances=1)
     if ignore_pins:
@@ -135,7 +149,7 @@ def test_install(
                 toxinidir=toxinidir,
                 envname=venv_name,
             )
-        exp_deps = tox_pin_deps.plugin4.PythonDeps(
+        exp_deps = tox_pin_deps.installer4.PythonDeps(
             f"-r{env_requirements}", env_requirements.parent
         )
         pip_mock._install_mock.assert_called_once_with(
@@ -150,7 +164,7 @@ def test_install(
         start_idx = cmd.index("--output-file")
         assert cmd[start_idx:] == ["--output-file", str(env_requirements)]
     elif env_requirements:
-        exp_deps = tox_pin_deps.plugin4.PythonDeps(
+        exp_deps = tox_pin_deps.installer4.PythonDeps(
             f"-r{env_requirements}",
             env_requirements.parent,
         )
@@ -185,7 +199,7 @@ def test_install_will_install(
     setup_cfg,
     pyproject_toml,
 ):
-    pip_compile_installer = tox_pin_deps.plugin4.PipCompileInstaller(venv)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
     assert pip_compile_installer.install(deps_present, None, None) is None
     pip_mock = ShimBaseMock._get_last_instance_and_reset(assert_n_instances=1)
     pip_mock._install_mock.assert_called_once()
@@ -228,9 +242,612 @@ def test_install_will_install(
     assert cmd[start_idx:] == exp_opts
 
 
+def test_install_prefetch(venv, venv_name, toxinidir, options, deps_present):
+    options.pip_compile_prefetch = True
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    env_requirements.parent.mkdir(parents=True)
+    env_requirements.write_text("foo==1.0\nbar==2.0\n")
+    with mock.patch("tox_pin_deps.compile.prefetch", return_value=True) as prefetch:
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        assert pip_compile_installer.install(deps_present, None, None) is None
+    ShimBaseMock._reset()
+    prefetch.assert_called_once()
+    assert prefetch.call_args[1]["python"] == venv.env_python.return_value
+    assert prefetch.call_args[1]["requirements"] == ["foo==1.0", "bar==2.0"]
+    assert len(venv.execute.mock_calls) == 2
+
+
+def test_install_lock_cache(
+    venv, venv_name, toxinidir, options, deps_present, tmp_path
+):
+    options.pip_compile_cache = str(tmp_path / "cache")
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            env_requirements.write_text("foo==1.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    info = {"python": "3.10.9", "pip": "23.0", "pip-tools": "7.3.0"}
+    with mock.patch("tox_pin_deps.compile.interpreter_info", return_value=info):
+        for _ in range(2):
+            pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+            assert pip_compile_installer.install(deps_present, None, None) is None
+            env_requirements.unlink()
+    ShimBaseMock._reset()
+    # the second install is restored from the cache without running pip-compile
+    cmds = [c[2]["cmd"][0] for c in venv.execute.mock_calls]
+    assert cmds == ["pip", "pip-compile", "pip"]
+    lock_cache = pip_compile_installer.lock_cache
+    assert lock_cache.counters == {"hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+    assert pip_compile_installer.report["lock"] == "cache"
+    # another pip-tools version may resolve differently, so it is a miss
+    info = {**info, "pip-tools": "7.4.0"}
+    with mock.patch("tox_pin_deps.compile.interpreter_info", return_value=info):
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        assert pip_compile_installer.install(deps_present, None, None) is None
+    ShimBaseMock._reset()
+    assert pip_compile_installer.report["lock"] == "compiled"
+
+
+def test_install_metrics(venv, venv_name, toxinidir, options, deps_present, tmp_path):
+    options.pip_compile_metrics = str(tmp_path / "tox.prom")
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            env_requirements.write_text("foo==1.0\nbar==2.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    tox_pin_deps.metrics.reset()
+    with mock.patch("tox_pin_deps.metrics.atexit.register"):
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        pip_compile_installer._install_mock.side_effect = (
+            lambda **kwargs: pip_compile_installer._execute_installer(["foo"], "deps")
+        )
+        assert pip_compile_installer.install(deps_present, None, None) is None
+    ShimBaseMock._reset()
+    lines = tox_pin_deps.metrics.render().splitlines()
+    tox_pin_deps.metrics.reset()
+    tox_pin_deps.metrics._output = None
+    assert "tox_pin_deps_envs_compiled_total 1" in lines
+    assert f'tox_pin_deps_lock_packages{{env="{venv_name}"}} 2' in lines
+    assert "tox_pin_deps_compile_seconds_count 1" in lines
+    assert "tox_pin_deps_install_from_lock_seconds_count 1" in lines
+
+
+def test_install_journal(venv, venv_name, toxinidir, options, deps_present):
+    options.pip_compile = True
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            env_requirements.write_text("foo==1.0\nbar==2.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    for expect_lock in ("compiled", "used"):
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        assert pip_compile_installer.install(deps_present, None, "deps") is None
+        ShimBaseMock._reset()
+        venv.journal.__setitem__.assert_called_once_with(
+            "tox_pin_deps", pip_compile_installer.report
+        )
+        venv.journal.reset_mock()
+        report = pip_compile_installer.report
+        assert report["lock"] == expect_lock
+        assert report["lock_path"] == str(env_requirements)
+        assert report["lock_digest"] == tox_pin_deps.inputs.file_digest(
+            env_requirements
+        )
+        assert report["packages"] == 2
+        sidecar = tox_pin_deps.lockfile.read_sidecar(env_requirements)
+        assert (
+            sidecar["input_digest"]
+            == pip_compile_installer.compile_plan(deps_present.lines()).digest
+        )
+        options.pip_compile = False
+    durations = report["durations"]
+    assert sorted(durations) == ["drift", "install-deps", "pip_compile"]
+    assert all(d >= 0 for d in durations.values())
+
+
+def test_install_hotspots(venv, venv_name, toxinidir, options, deps_present, caplog):
+    options.pip_compile = True
+    options.pip_compile_hotspots = True
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[1] == "-c" and tox_pin_deps.hotspots.HOTSPOT_SCRIPT in cmd[2]:
+            events_file = venv.environment_variables[tox_pin_deps.hotspots.ENV_EVENTS]
+            Path(events_file).write_text(
+                '{"t": 1.0, "kind": "collect", "name": "foo", "version": null}\n'
+                '{"t": 4.0, "kind": "pin", "name": "foo", "version": "1.0"}\n'
+                '{"t": 4.5, "kind": "end", "name": null, "version": null}\n'
+            )
+            env_requirements.write_text("foo==1.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    cmd = venv.execute.mock_calls[1][2]["cmd"]
+    assert cmd[0] == str(venv.env_python.return_value)
+    assert "--output-file" in cmd
+    report_path = tox_pin_deps.hotspots.report_path(venv.core["work_dir"], venv_name)
+    assert json.loads(report_path.read_text())["packages"] == [
+        {"name": "foo", "seconds": 3.5, "versions": ["1.0"], "backtracks": 0},
+    ]
+    assert "pip-compile hotspots" in caplog.text
+
+
+@pytest.mark.parametrize("number", [1, 2])
+def test_install_shard(venv, venv_name, toxinidir, options, deps_present, number):
+    options.pip_compile_shard = f"{number}/2"
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    requirements = env_requirements.parent
+    requirements.mkdir()
+    env_requirements.write_text("foo==0.9\n")
+    # the other env is slower, so this env gets a shard of its own
+    env_history = tox_pin_deps.history.History(venv.core["work_dir"])
+    env_history.record("other", tox_pin_deps.history.COMPILE, 100)
+    env_history.record(venv_name, tox_pin_deps.history.COMPILE, 10)
+    tox_pin_deps.plugin4._env_confs.update({venv_name: None, "other": None})
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            env_requirements.write_text("foo==1.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    try:
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        assert pip_compile_installer.shard_assignment == {"other": 1, venv_name: 2}
+        assert pip_compile_installer.install(deps_present, None, "deps") is None
+    finally:
+        tox_pin_deps.plugin4._env_confs.clear()
+    ShimBaseMock._reset()
+    manifest = requirements / tox_pin_deps.shard.MANIFEST_FILE
+    if number == 1:
+        # locked by the other shard, so the existing lock is used
+        assert pip_compile_installer.report["lock"] == "used"
+        assert env_requirements.read_text() == "foo==0.9\n"
+        assert not manifest.exists()
+    else:
+        assert pip_compile_installer.report["lock"] == "compiled"
+        assert env_requirements.read_text() == "foo==1.0\n"
+        assert json.loads(manifest.read_text()) == {
+            "session": tox_pin_deps.common.session_id(),
+            "shard": [2, 2],
+            "compiled": [venv_name],
+            "assignment": {"other": 1, venv_name: 2},
+        }
+        recent = env_history.recent(tox_pin_deps.history.COMPILE)
+        assert recent["other"] == [100]
+        assert recent[venv_name][0] < 10
+
+
+def test_install_memory_budget(venv, venv_name, toxinidir, options, deps_present):
+    options.pip_compile_memory_budget = "1G"
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+    reserved = []
+
+    def execute(cmd, **kwargs):
+        if cmd[1] == "-c" and tox_pin_deps.memory.PEAK_RSS_SCRIPT in cmd[2]:
+            ledger = pip_compile_installer.memory_ledger
+            reserved.extend(ledger.reservations().values())
+            peak_file = venv.environment_variables[tox_pin_deps.memory.ENV_PEAK_RSS]
+            Path(peak_file).write_text('{"peak_rss": 123456789}')
+            env_requirements.write_text("foo==1.0\n")
+        return outcome
+
+    venv.execute.side_effect = execute
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    try:
+        assert pip_compile_installer.install(deps_present, None, "deps") is None
+        ledger = pip_compile_installer.memory_ledger
+    finally:
+        tox_pin_deps.memory._ledgers.clear()
+    ShimBaseMock._reset()
+    assert reserved == [tox_pin_deps.memory.DEFAULT_ESTIMATE]
+    assert ledger.budget == 1024**3
+    assert ledger.directory == Path(
+        venv.core["work_dir"], tox_pin_deps.memory.LEDGER_DIR
+    )
+    assert ledger.reservations() == {}
+    assert ledger.estimate(venv_name) == 123456789
+    assert pip_compile_installer.report["peak_rss"] == 123456789
+    assert "memory_wait" in pip_compile_installer.report["durations"]
+
+
+def test_install_slim(venv, venv_name, toxinidir, options, deps_present):
+    options.pip_compile_slim = True
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+
+    outcome = venv.execute.return_value
+
+    def execute(cmd, **kwargs):
+        if cmd[0] == "pip-compile":
+            env_requirements.write_text(
+                "foo==1.0 \\\n    --hash=sha256:any \\\n    --hash=sha256:win\n"
+            )
+        return outcome
+
+    venv.execute.side_effect = execute
+    target = tox_pin_deps.slim.Target(tags=frozenset(["py3-none-any"]), markers={})
+    links = [
+        tox_pin_deps.outdated.Link("foo-1.0-py3-none-any.whl", "sha256:any", False),
+        tox_pin_deps.outdated.Link(
+            "foo-1.0-cp310-cp310-win32.whl", "sha256:win", False
+        ),
+    ]
+    with mock.patch(
+        "tox_pin_deps.slim.interpreter_target", return_value=target
+    ) as interpreter_target, mock.patch(
+        "tox_pin_deps.outdated.IndexClient.links", return_value=links
+    ):
+        pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+        assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    assert interpreter_target.call_args[0] == (venv.env_python.return_value,)
+    assert env_requirements.read_text() == "foo==1.0 \\\n    --hash=sha256:any\n"
+    assert pip_compile_installer.report["slim"] == {
+        "hashes_removed": 1,
+        "entries_removed": 0,
+    }
+    assert "slim" in pip_compile_installer.report["durations"]
+
+
+def test_install_bundle(
+    venv, venv_name, core, toxinidir, options, deps_present, lock_bundle
+):
+    options.pip_compile = False
+    options.pip_compile_bundle = str(lock_bundle)
+    core["work_dir"] = toxinidir / "build" / "tox"
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    pip_mock = ShimBaseMock._get_last_instance_and_reset(assert_n_instances=1)
+    staged = core["work_dir"] / "tox-pin-deps" / "bundle" / f"{venv_name}.txt"
+    # kept when pruning the pip cache
+    assert staged in tox_pin_deps.pipcache.lock_files(
+        env_requirements.parent, core["work_dir"]
+    )
+    pip_mock._install_mock.assert_called_once_with(
+        arguments=tox_pin_deps.installer4.PythonDeps(
+            f"-r{staged}", env_requirements.parent
+        ),
+        section=None,
+        of_type="deps",
+    )
+    assert staged.read_text().startswith("--no-index\n--find-links ")
+    assert [p.name for p in (staged.parent / "wheelhouse").iterdir()] == [
+        "foo-1.0-py3-none-any.whl"
+    ]
+    venv.execute.assert_not_called()
+    report = pip_compile_installer.report
+    assert report["lock"] == "bundle"
+    assert report["lock_path"] == str(staged)
+    assert report["packages"] == 1
+
+
+def test_install_bundle_missing(venv, toxinidir, options, deps_present):
+    options.pip_compile = False
+    options.pip_compile_bundle = "missing.bundle"
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    with pytest.raises(tox_mocks.Fail) as exc_info:
+        pip_compile_installer.install(deps_present, None, "deps")
+    ShimBaseMock._reset()
+    assert isinstance(exc_info.value.__cause__, tox_pin_deps.bundle.BundleError)
+    assert str(exc_info.value).startswith(
+        f"{toxinidir / 'missing.bundle'}: cannot open bundle: "
+    )
+    venv.execute.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "lock, compiled",
+    [("foo==1.0\nurllib3==1.26.12\n", True), ("foo==1.0\n", False)],
+    ids=["pinned", "not_pinned"],
+)
+def test_install_upgrade_package(
+    venv, venv_name, toxinidir, options, deps_present, tmp_path, lock, compiled
+):
+    options.pip_compile = False
+    options.pip_compile_upgrade_package = ["requests,URLLib3"]
+    options.pip_compile_cache = str(tmp_path / "cache")
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    env_requirements.parent.mkdir()
+    env_requirements.write_text(lock)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    with mock.patch("tox_pin_deps.compile.interpreter_info") as interpreter_info:
+        assert pip_compile_installer.install(deps_present, None, None) is None
+    ShimBaseMock._reset()
+    cmds = [c[2]["cmd"] for c in venv.execute.mock_calls]
+    if compiled:
+        assert pip_compile_installer.upgrade_packages == ["urllib3"]
+        assert pip_compile_installer.report["lock"] == "compiled"
+        assert cmds[1][0] == "pip-compile"
+        assert cmds[1][-2:] == ["--upgrade-package", "urllib3"]
+        # an upgrade is not restored from, nor stored in, the lock cache
+        interpreter_info.assert_not_called()
+        assert not (tmp_path / "cache").exists()
+    else:
+        assert pip_compile_installer.upgrade_packages == []
+        assert pip_compile_installer.report["lock"] == "used"
+        assert cmds == []
+
+
+def test_install_conflicting(venv, venv_name, toxinidir, options):
+    (toxinidir / "pyproject.toml").write_text(
+        "[project]\nname = 'demo'\ndependencies = ['attrs>=22']\n"
+    )
+    deps = tox_pin_deps.installer4.PythonDeps(raw="pytest\nattrs<22")
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    with pytest.raises(tox_mocks.Fail) as exc_info:
+        pip_compile_installer.install(deps, None, None)
+    ShimBaseMock._reset()
+    assert isinstance(exc_info.value.__cause__, tox_pin_deps.preflight.ConflictError)
+    assert str(exc_info.value) == (
+        f"{venv_name}: conflicting requirements: "
+        "attrs>=22 (pyproject.toml) conflicts with attrs<22 (deps)"
+    )
+    # pip-tools is not even installed
+    venv.execute.assert_not_called()
+    assert "preflight" in pip_compile_installer.report["durations"]
+
+
+@pytest.mark.parametrize(
+    "lock, outcome",
+    [
+        ("foo==1.0\n    # via -r requirements.in\n", "satisfied"),
+        (
+            "bar==2.0\n    # via -r requirements.in\n"
+            "foo==1.0\n    # via -r requirements.in\n",
+            "compiled",
+        ),
+    ],
+    ids=["satisfied", "orphaned"],
+)
+def test_install_keep_satisfied(
+    venv, venv_name, toxinidir, options, deps_present, lock, outcome
+):
+    options.pip_compile_keep_satisfied = True
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    env_requirements.parent.mkdir()
+    env_requirements.write_text(lock)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    plan = pip_compile_installer.compile_plan(["bar"])
+    tox_pin_deps.lockfile.write_sidecar(
+        env_requirements,
+        input_digest=plan.digest,
+        options_digest=plan.options_digest,
+    )
+    target = tox_pin_deps.slim.Target(tags=frozenset(), markers={})
+    with mock.patch("tox_pin_deps.slim.interpreter_target", return_value=target):
+        assert pip_compile_installer.install(deps_present, None, None) is None
+    ShimBaseMock._reset()
+    report = pip_compile_installer.report
+    assert report["lock"] == outcome
+    sidecar = tox_pin_deps.lockfile.read_sidecar(env_requirements)
+    if outcome == "satisfied":
+        venv.execute.assert_not_called()
+        assert env_requirements.read_text() == lock
+        assert "satisfy" in report["durations"]
+        # the lock is recorded as compiled from the current deps
+        assert (
+            sidecar["input_digest"]
+            == pip_compile_installer.compile_plan(["foo"]).digest
+        )
+    else:
+        cmds = [c[2]["cmd"] for c in venv.execute.mock_calls]
+        assert cmds[1][0] == "pip-compile"
+
+
+def test_install_drift(venv, venv_name, toxinidir, options, deps_present):
+    options.pip_compile = False
+    env_requirements = tox_pin_deps.common.requirements_file(
+        toxinidir=toxinidir,
+        envname=venv_name,
+    )
+    env_requirements.parent.mkdir()
+    env_requirements.write_text(
+        "--index-url https://example.com/simple\n\n"
+        "foo==1.0 \\\n    --hash=sha256:aaa\n"
+        "bar==2.0 \\\n    --hash=sha256:bbb\n"
+        "baz==3.0 \\\n    --hash=sha256:ccc\n"
+    )
+    site_packages = venv.env_site_package_dir.return_value
+    site_packages.mkdir(parents=True)
+    platlib = venv.creator.platlib
+    platlib.mkdir(parents=True)
+    (site_packages / "foo-1.0.dist-info").mkdir()
+    (platlib / "bar-1.5.dist-info").mkdir()
+    repairs = []
+
+    def execute(cmd, **kwargs):
+        repairs.append(Path(cmd[-1]).read_text())
+        return mock.DEFAULT
+
+    venv.execute.side_effect = execute
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    assert pip_compile_installer.report["drift"] == ["bar", "baz"]
+    cmd = venv.execute.call_args[1]["cmd"]
+    assert cmd[:4] == ["pip", "install", "--no-deps", "-r"]
+    assert Path(cmd[-1]).parent == env_requirements.parent
+    assert repairs == [
+        "--index-url https://example.com/simple\n\n"
+        "bar==2.0 \\\n    --hash=sha256:bbb\n"
+        "baz==3.0 \\\n    --hash=sha256:ccc\n"
+    ]
+    # nothing to repair once the env matches the lock
+    (platlib / "bar-1.5.dist-info").rename(platlib / "bar-2.0.dist-info")
+    (platlib / "baz-3.0.dist-info").mkdir()
+    venv.execute.reset_mock()
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    assert pip_compile_installer.report["drift"] == []
+    venv.execute.assert_not_called()
+    # a fresh install from the lock needs no repair
+    (platlib / "baz-3.0.dist-info").rmdir()
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    pip_compile_installer._install_mock.side_effect = (
+        lambda **kwargs: pip_compile_installer._execute_installer(["foo"], "deps")
+    )
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    assert "drift" not in pip_compile_installer.report
+    venv.execute.assert_not_called()
+
+
+def test_site_packages(venv):
+    purelib = venv.env_site_package_dir.return_value
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.site_packages == [purelib, venv.creator.platlib]
+    venv.creator.platlib = purelib
+    assert pip_compile_installer.site_packages == [purelib]
+    # an env without virtualenv's creator
+    venv.creator = None
+    assert pip_compile_installer.site_packages == [purelib]
+    ShimBaseMock._reset()
+
+
+def test_install_history(venv, venv_name, toxinidir, options, deps_present, caplog):
+    tox_pin_deps.metrics.reset()
+    env_history = tox_pin_deps.history.History(toxinidir / ".tox")
+    env_history.record(venv_name, "compile", 1.0)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    pip_compile_installer._install_mock.side_effect = (
+        lambda **kwargs: pip_compile_installer._execute_installer(["foo"], "deps")
+    )
+    assert pip_compile_installer.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    report = pip_compile_installer.report
+    assert report["expected"] == 1.0
+    assert "regression" not in report
+    recent = env_history.recent
+    assert recent("compile")[venv_name][1:] == [1.0]
+    assert len(recent("install")[venv_name]) == 1
+    # a reused env that tox does not install into records no install time
+    options.pip_compile = False
+    reused = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert reused.install(deps_present, None, "deps") is None
+    ShimBaseMock._reset()
+    assert len(recent("install")[venv_name]) == 1
+    # a compile much slower than the recent runs is flagged
+    pip_compile_installer.record_duration("compile", 60.0)
+    assert report["regression"] == {"seconds": 60.0, "median": mock.ANY}
+    assert f"{venv_name}: pip-compile took 1m00s" in caplog.text
+    assert (
+        f'tox_pin_deps_compile_regressions_total{{env="{venv_name}"}} 1'
+        in tox_pin_deps.metrics.render().splitlines()
+    )
+    tox_pin_deps.metrics.reset()
+
+
+def test_compile_plan(venv, venv_name, toxinidir, conf, options):
+    (toxinidir / "setup.py").write_text("")
+    conf.update(pip_compile_opts="--generate-hashes", pip_pre=True, extras=["test"])
+    options.pip_compile_opts = "--resolver backtracking"
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    compile_plan = pip_compile_installer.compile_plan(["foo"])
+    assert compile_plan.sources == ((str(toxinidir / "setup.py"), mock.ANY),)
+    assert compile_plan.opts == ("--generate-hashes", "--resolver", "backtracking")
+    assert compile_plan.extras == ("test",)
+    assert compile_plan.pre is True
+    assert compile_plan.custom_compile_command == (
+        f"tox -e {venv_name} --pip-compile --pip-compile-opts "
+        "'--resolver backtracking'"
+    )
+    # captured once per deps
+    conf["pip_pre"] = False
+    assert pip_compile_installer.compile_plan(["foo"]) is compile_plan
+    assert pip_compile_installer.compile_plan(["bar"]).pre is False
+
+
+def test_compile_plan_local(venv, toxinidir, monkeypatch):
+    monkeypatch.setattr(tox_pin_deps.localdeps, "_digests", {})
+    lib = toxinidir.parent / "libs" / "foo"
+    lib.mkdir(parents=True)
+    (lib / "pyproject.toml").write_text("[project]\nname = 'foo'\n")
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    compile_plan = pip_compile_installer.compile_plan(["bar", "-e ../libs/foo"])
+    assert compile_plan.local == ((str(lib), tox_pin_deps.localdeps.tree_digest(lib)),)
+    assert pip_compile_installer.compile_plan(["bar"]).local == ()
+    # an edited library changes the digest of the envs installing it
+    digest = compile_plan.digest
+    (lib / "pyproject.toml").write_text("[project]\nname = 'foo'\nversion = '2'\n")
+    tox_pin_deps.localdeps._digests.clear()
+    other = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert other.compile_plan(["bar", "-e ../libs/foo"]).digest != digest
+    assert other.compile_plan(["bar"]).digest == (
+        pip_compile_installer.compile_plan(["bar"]).digest
+    )
+
+
+def test_install_journal_disabled(venv):
+    venv.journal.__bool__.return_value = False
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.install(mock.Mock(), None, "package") is None
+    ShimBaseMock._reset()
+    venv.journal.__setitem__.assert_not_called()
+    assert pip_compile_installer.report["lock"] is None
+
+
 def test_install_passthru(venv):
     mockdep = mock.Mock()
-    pip_compile_installer = tox_pin_deps.plugin4.PipCompileInstaller(venv)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
     assert pip_compile_installer.install(mockdep, None, None) is None
     pip_mock = ShimBaseMock._get_last_instance_and_reset(assert_n_instances=1)
     pip_mock._install_mock.assert_called_once_with(
@@ -245,7 +862,7 @@ def test_install_dot_in_name(
     dot_venv,
     deps_present,
 ):
-    pip_compile_installer = tox_pin_deps.plugin4.PipCompileInstaller(dot_venv)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(dot_venv)
     assert pip_compile_installer.install(deps_present, None, None) is None
     pip_mock = ShimBaseMock._get_last_instance_and_reset(assert_n_instances=1)
     pip_mock._install_mock.assert_called_once_with(
@@ -269,6 +886,7 @@ def test_register_config(venv):
     inst = tox_pin_deps.plugin4.PinDepsVirtualEnvRunner(None)
     inst.name = venv.name
     inst.core = venv.core
+    inst.options = venv.options
     inst.conf = mock.Mock()
 
     inst.register_config()
@@ -280,11 +898,43 @@ def test_register_config(venv):
     )
 
     orig_installer = inst.installer
-    assert isinstance(orig_installer, tox_pin_deps.plugin4.PipCompileInstaller)
+    assert isinstance(orig_installer, tox_pin_deps.installer4.PipCompileInstaller)
     # subsequent access to the installer should return the same instance
     assert inst.installer is orig_installer
 
 
+@pytest.mark.parametrize("bundle", ["", "locks.bundle"], ids=["no_bundle", "bundle"])
+@pytest.mark.parametrize("has_lock", [True, False], ids=["lock", "no_lock"])
+def test_installer_uses_pins(venv, options, ignore_pins, pip_compile, has_lock, bundle):
+    options.pip_compile_bundle = bundle
+    if has_lock:
+        env_requirements = tox_pin_deps.common.requirements_file(
+            toxinidir=venv.core["toxinidir"],
+            envname=venv.name,
+        )
+        env_requirements.parent.mkdir()
+        env_requirements.write_text("foo==1.0\n")
+    inst = tox_pin_deps.plugin4.PinDepsVirtualEnvRunner(None)
+    inst.name = venv.name
+    inst.core = venv.core
+    inst.options = options
+    uses_pins = not ignore_pins and bool(pip_compile or has_lock or bundle)
+    assert inst.uses_pins is uses_pins
+    assert (
+        isinstance(inst.installer, tox_pin_deps.installer4.PipCompileInstaller)
+        is uses_pins
+    )
+
+
+def test_plugin4_installer_alias():
+    assert (
+        tox_pin_deps.plugin4.PipCompileInstaller
+        is tox_pin_deps.installer4.PipCompileInstaller
+    )
+    with pytest.raises(AttributeError):
+        tox_pin_deps.plugin4.NotHere
+
+
 @pytest.mark.parametrize(
     "installed_from_lock_file", [True, False], ids=["installed_from_lock_file", ""]
 )
@@ -293,7 +943,7 @@ def test_install_package_deps(venv, installed_from_lock_file, weird_type):
     mockdep = mock.Mock()
     exp_package_deps = ["foo", "bar"]
     mockdep.deps = exp_package_deps
-    pip_compile_installer = tox_pin_deps.plugin4.PipCompileInstaller(venv)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
     if installed_from_lock_file:
         pip_compile_installer._installed_from_lock_file = installed_from_lock_file
     if weird_type:
@@ -313,3 +963,98 @@ def test_install_package_deps(venv, installed_from_lock_file, weird_type):
         assert mockdep.deps == []
     else:
         assert mockdep.deps == exp_package_deps
+
+
+def test_tox_add_env_config(venv_name, monkeypatch):
+    monkeypatch.setattr(tox_pin_deps.plugin4, "_env_confs", {})
+    monkeypatch.setattr(tox_pin_deps.plugin4, "_state", None)
+    state = mock.Mock()
+    # tox configures every defined env, the session only runs venv_name
+    state.envs.iter.side_effect = lambda only_active: iter([venv_name])
+    env_conf = {"env_name": venv_name, "pip_compile_opts": ""}
+    other_conf = {"env_name": "other", "pip_compile_opts": ""}
+    tox_pin_deps.plugin4.tox_add_env_config(env_conf, state)
+    tox_pin_deps.plugin4.tox_add_env_config(other_conf, state)
+    tox_pin_deps.plugin4.tox_add_env_config({"env_name": ".pkg"}, state)
+    tox_pin_deps.plugin4.tox_add_env_config(
+        {"env_name": ".pkg", "pip_compile_opts": ""}, state
+    )
+    assert tox_pin_deps.plugin4._env_confs == {
+        venv_name: env_conf,
+        "other": other_conf,
+    }
+    assert tox_pin_deps.plugin4.session_env_confs() == {venv_name: env_conf}
+
+
+@pytest.fixture
+def state(options, toxinidir):
+    """tox4 State."""
+    state = mock.Mock()
+    state.conf.options = options
+    options.env = mock.Mock(is_all=False)
+    options.env.__iter__ = mock.Mock(return_value=iter([]))
+    options.env.__bool__ = mock.Mock(return_value=False)
+    options.labels = []
+    options.factors = []
+    return state
+
+
+@pytest.mark.parametrize(
+    "parallel, cli_envs, expected",
+    [
+        (0, [], None),
+        (4, [], ["py37", "py310", "lint"]),
+        (None, ["py310", "lint", "py37"], ["py37", "py310", "lint"]),
+        (4, ["py37", "lint"], None),
+    ],
+    ids=["sequential", "env_list", "cli", "in_order"],
+)
+def test_tox_add_core_config(state, options, toxinidir, parallel, cli_envs, expected):
+    options.parallel = parallel
+    options.env.__iter__.return_value = iter(cli_envs)
+    options.env.__bool__.return_value = bool(cli_envs)
+    env = options.env
+    core_conf = dict(work_dir=toxinidir / ".tox", env_list=["lint", "py37", "py310"])
+    env_history = tox_pin_deps.history.History(core_conf["work_dir"])
+    env_history.record("py37", "compile", 300.0)
+    env_history.record("py310", "compile", 30.0)
+    env_history.record("lint", "compile", 5.0)
+    with mock.patch("tox_pin_deps.plugin4.CliEnv") as cli_env:
+        assert tox_pin_deps.plugin4.tox_add_core_config(core_conf, state) is None
+    if expected is None:
+        cli_env.assert_not_called()
+        assert options.env is env
+    else:
+        cli_env.assert_called_once_with(expected)
+        assert options.env is cli_env.return_value
+    # envs run in threads, which cProfile cannot tell apart
+    assert tox_pin_deps.profiling._disabled == (parallel != 0)
+
+
+def test_tox_add_core_config_prune_pip_cache(state, options, toxinidir, monkeypatch):
+    monkeypatch.setenv("TOX_PIN_DEPS_PRUNE_PIP_CACHE", "500M")
+    core_conf = dict(tox_root=toxinidir, work_dir=toxinidir / ".tox", env_list=[])
+    with mock.patch("tox_pin_deps.pipcache.prune_at_exit") as prune_at_exit:
+        assert tox_pin_deps.plugin4.tox_add_core_config(core_conf, state) is None
+    prune_at_exit.assert_called_once_with(
+        500 * 1024**2, toxinidir, toxinidir / ".tox"
+    )
+
+
+def test_superset_members_session_envs(venv, venv_name, conf, monkeypatch):
+    conf["base_python"] = ["py310"]
+    conf["deps"] = tox_pin_deps.installer4.PythonDeps("foo")
+    state = mock.Mock()
+    state.envs.iter.side_effect = lambda only_active: iter([venv_name, "lint"])
+    monkeypatch.setattr(
+        tox_pin_deps.plugin4,
+        "_env_confs",
+        {venv_name: conf, "lint": dict(conf), "unselected": dict(conf)},
+    )
+    monkeypatch.setattr(tox_pin_deps.plugin4, "_state", state)
+    pip_compile_installer = tox_pin_deps.installer4.PipCompileInstaller(venv)
+    assert pip_compile_installer.selected_envs() == ["lint", venv_name]
+    assert pip_compile_installer.superset_members() == {
+        venv_name: ["foo"],
+        "lint": ["foo"],
+    }
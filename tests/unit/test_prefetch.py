@@ -0,0 +1,82 @@
+import subprocess
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import lockfile, prefetch
+
+
+@pytest.fixture
+def mock_run(monkeypatch):
+    requested = []
+
+    def run(cmd, **kwargs):
+        with open(cmd[-1]) as f:
+            requested.append(f.read())
+        return mock.Mock(returncode=1 if "bad==1.0" in requested[-1] else 0)
+
+    run_mock = mock.Mock(side_effect=run)
+    run_mock.requested = requested
+    monkeypatch.setattr(subprocess, "run", run_mock)
+    return run_mock
+
+
+def test_index_opts():
+    assert prefetch.index_opts(
+        [
+            "--generate-hashes",
+            "-i",
+            "https://example.com/simple",
+            "--extra-index-url=https://extra.example.com/simple",
+            "--pre",
+            "--extra",
+            "ex1",
+        ]
+    ) == [
+        "-i",
+        "https://example.com/simple",
+        "--extra-index-url=https://extra.example.com/simple",
+        "--pre",
+    ]
+
+
+def test_prefetch_requirements():
+    entries = lockfile.parse_lock(
+        'foo==1.0\nbar @ file:///bar\nwinonly==2.0 ; sys_platform == "win32"\n'
+    )
+    assert prefetch.prefetch_requirements(entries) == [
+        "foo==1.0",
+        'winonly==2.0 ; sys_platform == "win32"',
+    ]
+
+
+def test_prefetch(tmp_path, mock_run):
+    assert prefetch.prefetch(
+        python="python",
+        requirements=["foo==1.0", "baz==2.0"],
+        dest=tmp_path,
+        pip_opts=["--pre"],
+    )
+    # one pip run for all requirements
+    mock_run.assert_called_once()
+    cmd = mock_run.call_args[0][0]
+    assert cmd[:-1] == [
+        "python",
+        "-m",
+        "pip",
+        "download",
+        "--no-deps",
+        "--quiet",
+        "--dest",
+        str(tmp_path),
+        "--pre",
+        "-r",
+    ]
+    assert mock_run.requested == ["foo==1.0\nbaz==2.0\n"]
+    assert list(tmp_path.iterdir()) == []
+    assert not prefetch.prefetch("python", ["foo==1.0", "bad==1.0"], tmp_path)
+
+
+def test_prefetch_nothing(tmp_path, mock_run):
+    assert prefetch.prefetch("python", [], tmp_path)
+    mock_run.assert_not_called()
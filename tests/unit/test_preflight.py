@@ -0,0 +1,87 @@
+import pytest
+
+from tox_pin_deps import preflight
+from tox_pin_deps.satisfy import RequirementLine
+
+
+def lines(*requirements, source="deps", constraint=False):
+    return [RequirementLine(line, source, constraint) for line in requirements]
+
+
+@pytest.mark.parametrize(
+    "requirements",
+    [
+        ["attrs<22", "attrs>=21"],
+        ["attrs==22.1.0", "attrs>=22"],
+        ["attrs<=22", "attrs>=22"],
+        ["attrs~=22.1", "attrs<23"],
+        ["attrs==22.*", "attrs>=22.2"],
+        ["attrs==22.1.0", "attrs!=22.0.0"],
+        ["attrs!=22.*", "attrs==22.1.0"],
+        # markers may not apply to the env
+        ["attrs<22", "attrs>=22 ; python_version < '3'"],
+        ["attrs===22.1", "attrs<22"],
+        ["attrs<22", "attrs @ https://example.com/attrs-22.1.0.tar.gz"],
+        ["attrs<22", "-e ."],
+    ],
+)
+def test_no_conflict(requirements):
+    assert preflight.find_conflicts(lines(*requirements)) == []
+
+
+@pytest.mark.parametrize(
+    "requirements, first, second",
+    [
+        (["attrs<22", "attrs>=22"], "attrs>=22", "attrs<22"),
+        (["attrs>22", "attrs<=22"], "attrs>22", "attrs<=22"),
+        (["attrs==21.4.0", "attrs>=22"], "attrs>=22", "attrs==21.4.0"),
+        (["attrs~=21.4", "Attrs>=22"], "Attrs>=22", "attrs~=21.4"),
+        (["attrs==21.*", "attrs>=22"], "attrs>=22", "attrs==21.*"),
+        (["attrs==22.1.0", "attrs!=22.1"], "attrs==22.1.0", "attrs!=22.1"),
+        (["attrs>=22,<21"], "attrs>=22,<21", "attrs>=22,<21"),
+    ],
+)
+def test_conflict(requirements, first, second):
+    (conflict,) = preflight.find_conflicts(lines(*requirements))
+    assert conflict == ("attrs", (first, "deps"), (second, "deps"))
+
+
+def test_constraint():
+    constraint = lines("idna>=4", source="constraints.txt", constraint=True)
+    # constraints on packages that are not required directly are not checked
+    assert preflight.find_conflicts([*lines("idna<4"), *constraint]) == [
+        ("idna", ("idna>=4", "constraints.txt"), ("idna<4", "deps"))
+    ]
+    assert preflight.find_conflicts([*lines("requests"), *constraint]) == []
+
+
+def test_preflight(toxinidir):
+    (toxinidir / "constraints.txt").write_text("attrs<22\n")
+    conflicts = preflight.preflight(
+        ["pytest", "-c constraints.txt"], root=toxinidir, dist=["attrs>=22.1"]
+    )
+    assert conflicts == [
+        (
+            "attrs",
+            ("attrs>=22.1", "pyproject.toml"),
+            ("attrs<22", str(toxinidir / "constraints.txt")),
+        )
+    ]
+    assert preflight.preflight(["attrs<22"], root=toxinidir, dist=None) == []
+
+
+def test_conflict_error():
+    error = preflight.ConflictError(
+        "py27",
+        [
+            preflight.Conflict(
+                "attrs", ("attrs<22", "deps"), ("attrs>=22", "pyproject.toml")
+            ),
+            preflight.Conflict("six", ("six>2,<1", "deps"), ("six>2,<1", "deps")),
+        ],
+    )
+    assert str(error) == (
+        "py27: conflicting requirements: "
+        "attrs<22 (deps) conflicts with attrs>=22 (pyproject.toml); "
+        "six>2,<1 (deps) cannot be satisfied"
+    )
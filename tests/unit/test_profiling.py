@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from tox_pin_deps import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setenv(profiling.ENV_PROFILE, str(profile_dir))
+    yield profile_dir
+    profiling._written.clear()
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_profiled_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv(profiling.ENV_PROFILE, raising=False)
+    with profiling.profiled("py310", "pip_compile"):
+        busy()
+    assert profiling._written == []
+    assert profiling.write_summary() is None
+
+
+def test_profiled_nested(profile_dir):
+    with profiling.profiled("py310/x", "install-deps"):
+        with profiling.profiled("py310/x", "pip_compile"):
+            busy()
+        busy()
+    with profiling.profiled("py310/x", "install-deps"):
+        pass
+    assert sorted(p.name for p in profile_dir.iterdir()) == [
+        "py310_x.install-deps.2.pstats",
+        "py310_x.install-deps.pstats",
+        "py310_x.pip_compile.pstats",
+    ]
+    summary_path = profiling.write_summary()
+    assert summary_path == profile_dir / profiling.SUMMARY_FILE
+    summary = summary_path.read_text()
+    assert "py310_x.pip_compile.pstats" in summary
+    assert "busy" in summary
+
+
+def test_profiled_threads(profile_dir):
+    """Only one thread is profiled at a time."""
+    started, done = threading.Event(), threading.Event()
+
+    def other():
+        with profiling.profiled("py311", "pip_compile"):
+            started.set()
+            done.wait()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    started.wait()
+    with profiling.profiled("py310", "pip_compile"):
+        busy()
+    done.set()
+    thread.join()
+    with profiling.profiled("py312", "pip_compile"):
+        busy()
+    assert sorted(p.name for p in profile_dir.iterdir()) == [
+        "py311.pip_compile.pstats",
+        "py312.pip_compile.pstats",
+    ]
+
+
+def test_disable(profile_dir, caplog):
+    profiling.disable("as tox -p runs envs in threads")
+    assert f"{profiling.ENV_PROFILE} is ignored, as tox -p" in caplog.text
+    with profiling.profiled("py310", "pip_compile"):
+        busy()
+    assert not profile_dir.exists()
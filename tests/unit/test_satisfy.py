@@ -0,0 +1,144 @@
+import pytest
+
+from tox_pin_deps import satisfy
+from tox_pin_deps.lockfile import parse_lock
+
+LINUX = {"sys_platform": "linux", "python_version": "3.10"}
+LOCK = """\
+pytest==7.2.0
+    # via -r requirements.in
+iniconfig==1.1.1
+    # via pytest
+requests[socks]==2.28.1
+    # via -r requirements.in
+urllib3==1.26.12
+    # via requests
+pysocks==1.7.1
+    # via requests
+colorama==0.4.6 ; sys_platform == "win32"
+    # via pytest
+"""
+
+
+def requirements(*lines, constraints=()):
+    return satisfy.Requirements(list(lines), list(constraints))
+
+
+@pytest.mark.parametrize(
+    "lines, constraints, expected",
+    [
+        (["pytest", "requests[socks]"], [], []),
+        (["pytest>=7", "requests[socks]<3,>=2.28"], [], []),
+        (["pytest", "requests[socks]", 'tomli ; python_version < "3.8"'], [], []),
+        (["pytest", "requests[socks]"], ["urllib3<2", "unrelated<1"], []),
+        (
+            ["pytest>=7.3", "requests[socks]"],
+            [],
+            ["pytest>=7.3: pinned 7.2.0"],
+        ),
+        (
+            ["pytest", "requests[socks]", "tomli"],
+            [],
+            ["tomli: not pinned"],
+        ),
+        (
+            ["pytest", "requests[socks,security]"],
+            [],
+            ["requests[socks,security]: pinned without extras"],
+        ),
+        (
+            ["pytest", "requests[socks]", "colorama"],
+            [],
+            ['colorama: pinned only for sys_platform == "win32"'],
+        ),
+        (
+            ["pytest", "requests[socks]"],
+            ["urllib3>=2"],
+            ["urllib3>=2: pinned 1.26.12"],
+        ),
+        # removing a requirement leaves its closure behind
+        (
+            ["pytest"],
+            [],
+            [
+                "requests: no longer required",
+                "urllib3: no longer required",
+                "pysocks: no longer required",
+            ],
+        ),
+    ],
+)
+def test_unsatisfied(lines, constraints, expected):
+    entries = parse_lock(LOCK)
+    result = satisfy.unsatisfied(
+        requirements(*lines, constraints=constraints), entries, LINUX
+    )
+    assert result == expected
+
+
+def test_unsatisfied_without_annotations():
+    entries = parse_lock("pytest==7.2.0\n")
+    assert satisfy.unsatisfied(requirements("pytest"), entries, LINUX) == [
+        "lock has no `# via` annotations"
+    ]
+
+
+def test_deps_requirements(toxinidir):
+    (toxinidir / "constraints.txt").write_text("urllib3<2\n-r nested.txt\n")
+    (toxinidir / "nested.txt").write_text("idna<4  # comment\n")
+    (toxinidir / "test.txt").write_text("pytest>=7\n\n# comment\n")
+    deps = ["requests", "-r test.txt", "-c constraints.txt", ""]
+    assert satisfy.deps_requirements(deps, root=toxinidir) == (
+        ["requests", "pytest>=7"],
+        ["urllib3<2", "idna<4"],
+    )
+
+
+def test_requirement_lines(toxinidir):
+    (toxinidir / "constraints.txt").write_text("urllib3<2\n")
+    assert satisfy.requirement_lines(
+        ["requests", "-c constraints.txt", "-e ."], root=toxinidir
+    ) == [
+        ("requests", "deps", False),
+        ("-e .", "deps", False),
+        ("urllib3<2", str(toxinidir / "constraints.txt"), True),
+    ]
+    assert satisfy.requirement_lines(["-r missing.txt"], root=toxinidir) is None
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "-e .",
+        "--index-url https://example.com/simple",
+        "-r missing.txt",
+        "./local/path",
+        "demo @ https://example.com/demo-1.0.tar.gz",
+    ],
+)
+def test_deps_requirements_unchecked(toxinidir, line):
+    assert satisfy.deps_requirements(["pytest", line], root=toxinidir) is None
+
+
+def test_dist_requirements(toxinidir):
+    pyproject = toxinidir / "pyproject.toml"
+    pyproject.write_text(
+        "[project]\n"
+        "name = 'demo'\n"
+        "dependencies = ['requests>=2']\n"
+        "[project.optional-dependencies]\n"
+        "test = ['pytest']\n"
+        "docs = ['sphinx']\n"
+    )
+    assert satisfy.dist_requirements([pyproject]) == ["requests>=2"]
+    assert satisfy.dist_requirements([pyproject], extras=["test"]) == [
+        "requests>=2",
+        "pytest",
+    ]
+    assert satisfy.dist_requirements([]) == []
+    pyproject.write_text("[project]\nname = 'demo'\ndynamic = ['dependencies']\n")
+    assert satisfy.dist_requirements([pyproject]) is None
+    pyproject.write_text("[project\n")
+    assert satisfy.dist_requirements([pyproject]) is None
+    (toxinidir / "setup.py").write_text("")
+    assert satisfy.dist_requirements([toxinidir / "setup.py"]) is None
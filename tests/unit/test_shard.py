@@ -0,0 +1,194 @@
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+from tox_pin_deps import cli, common, lockfile, shard
+
+
+@pytest.mark.parametrize(
+    "spec,exp",
+    (
+        ("", None),
+        (None, None),
+        ("1/1", shard.Shard(1, 1)),
+        ("2/4", shard.Shard(2, 4)),
+    ),
+)
+def test_parse_shard(spec, exp):
+    assert shard.parse_shard(spec) == exp
+
+
+@pytest.mark.parametrize("spec", ("2", "0/2", "3/2", "a/b", "1/"))
+def test_parse_shard_invalid(spec):
+    with pytest.raises(ValueError, match="Invalid shard"):
+        shard.parse_shard(spec)
+
+
+def test_assign_balanced():
+    durations = {"slow": 100.0, "medium": 60.0, "fast1": 30.0, "fast2": 30.0}
+    assignment = shard.assign(durations, durations, 2)
+    assert assignment == {"slow": 1, "medium": 2, "fast1": 2, "fast2": 2}
+    # independent of order, and of unrelated durations
+    assert shard.assign(reversed(list(durations)), {**durations, "x": 5.0}, 2) == (
+        assignment
+    )
+
+
+def test_assign_unknown_durations():
+    # unknown envs cost the mean of the known ones
+    assignment = shard.assign(["a", "b", "c", "d"], {"a": 10.0, "b": 30.0}, 2)
+    assert assignment == {"b": 1, "c": 2, "d": 2, "a": 1}
+    assert shard.assign(["a", "b", "c"], {}, 3) == {"a": 1, "b": 2, "c": 3}
+    assert shard.assign(["a", "b"], {}, 3) == {"a": 1, "b": 2}
+
+
+def run_shards(tmp_path, envnames, total, durations=None):
+    """Simulate every shard compiling its own envs."""
+    assignment = shard.assign(envnames, durations or {}, total)
+    directories = []
+    for number in range(1, total + 1):
+        directory = tmp_path / f"shard{number}"
+        directory.mkdir()
+        for envname, assigned in assignment.items():
+            if assigned == number:
+                (directory / f"{envname}.txt").write_text(f"{envname}==1.0\n")
+                lockfile.write_sidecar(directory / f"{envname}.txt")
+                shard.record_compiled(
+                    directory,
+                    shard=shard.Shard(number, total),
+                    assignment=assignment,
+                    envname=envname,
+                )
+        directories.append(directory)
+    return assignment, directories
+
+
+def test_merge(tmp_path):
+    requirements = tmp_path / "requirements"
+    requirements.mkdir()
+    (requirements / "old.txt").write_text("old==1.0\n")
+    _, directories = run_shards(tmp_path, ["a", "b", "c"], 2)
+    assert shard.merge(directories, requirements) == []
+    assert sorted(p.name for p in requirements.glob("*.txt")) == [
+        "a.txt",
+        "b.txt",
+        "c.txt",
+        "old.txt",
+    ]
+    assert (requirements / "b.txt").read_text() == "b==1.0\n"
+    assert lockfile.read_sidecar(requirements / "b.txt")["entries"] == [
+        ["b", "1.0", "b==1.0", None, [], []]
+    ]
+
+
+def test_merge_into_shard_directory(tmp_path):
+    _, directories = run_shards(tmp_path, ["a", "b"], 2)
+    assert shard.merge(directories, directories[0]) == []
+    assert sorted(p.name for p in directories[0].glob("*.txt")) == ["a.txt", "b.txt"]
+
+
+def test_manifest_reset_per_session(tmp_path, monkeypatch):
+    manifest = tmp_path / shard.MANIFEST_FILE
+    manifest.write_text(
+        json.dumps(
+            {
+                "session": "old",
+                "shard": [1, 2],
+                "compiled": ["stale"],
+                "assignment": {"a": 1, "b": 1},
+            }
+        )
+    )
+    shard.record_compiled(tmp_path, shard.Shard(1, 2), {"a": 1, "b": 1}, "a")
+    shard.record_compiled(tmp_path, shard.Shard(1, 2), {"a": 1, "b": 1}, "a")
+    assert json.loads(manifest.read_text()) == {
+        "session": common.session_id(),
+        "shard": [1, 2],
+        "compiled": ["a"],
+        "assignment": {"a": 1, "b": 1},
+    }
+    # a tox process of the same session (tox3 -p) adds to the manifest
+    shard.record_compiled(
+        tmp_path, shard.Shard(1, 2), {"a": 1, "b": 1}, "b", lock_dir=tmp_path
+    )
+    assert json.loads(manifest.read_text())["compiled"] == ["a", "b"]
+    assert (tmp_path / shard.LOCK_FILE).exists()
+    monkeypatch.setenv(common.ENV_SESSION, "new")
+    shard.record_compiled(tmp_path, shard.Shard(1, 2), {"a": 1, "b": 1}, "b")
+    assert json.loads(manifest.read_text())["compiled"] == ["b"]
+
+
+def test_record_concurrent(tmp_path):
+    """Processes of one session record their envs under a file lock."""
+    script = (
+        "import sys\n"
+        "from pathlib import Path\n"
+        "from tox_pin_deps import shard\n"
+        "envname, directory = sys.argv[1:]\n"
+        "shard.record_compiled(\n"
+        "    directory, shard.Shard(1, 1), {}, envname, lock_dir=Path(directory)\n"
+        ")\n"
+    )
+    envnames = [f"py{n}" for n in range(8)]
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(Path(shard.__file__).parents[1]),
+        common.ENV_SESSION: common.session_id(),
+    }
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-c", script, envname, str(tmp_path)], env=env
+        )
+        for envname in envnames
+    ]
+    assert [proc.wait() for proc in procs] == [0] * len(envnames)
+    manifest = json.loads((tmp_path / shard.MANIFEST_FILE).read_text())
+    assert manifest["compiled"] == envnames
+
+
+def test_merge_problems(tmp_path):
+    requirements = tmp_path / "requirements"
+    assert shard.merge([], requirements) == ["no shards given"]
+    assert shard.merge([tmp_path], requirements) == [
+        f"{tmp_path}: no {shard.MANIFEST_FILE}"
+    ]
+    _, directories = run_shards(tmp_path, ["a", "b", "c"], 3)
+    assert shard.merge(directories[:2], requirements) == ["shard 3/3 missing"]
+    assert shard.merge([*directories, directories[0]], requirements) == [
+        f"{directories[0]}: shard 1/3 given twice"
+    ]
+    # shard 1 also compiled an env of shard 2, and lost the lock of its own
+    shard.record_compiled(
+        directories[0], shard.Shard(1, 3), {"a": 1, "b": 2, "c": 3}, "b"
+    )
+    (directories[0] / "a.txt").unlink()
+    assert shard.merge(directories, requirements) == [
+        "a: lock missing from shard 1/3",
+        "b: lock missing from shard 1/3",
+        "b: compiled by 2 shards (1/3, 2/3)",
+    ]
+    assert not requirements.exists()
+
+
+def test_merge_inconsistent(tmp_path):
+    (tmp_path / "two").mkdir()
+    (tmp_path / "three").mkdir()
+    _, two = run_shards(tmp_path / "two", ["a", "b"], 2)
+    _, three = run_shards(tmp_path / "three", ["a", "b", "c"], 3)
+    assert shard.merge([two[0], three[1]], tmp_path / "requirements") == [
+        "shard counts differ: [2, 3]",
+        "shards computed different assignments",
+    ]
+
+
+def test_cli_merge_shards(tmp_path, capsys):
+    _, directories = run_shards(tmp_path, ["a", "b"], 2)
+    argv = ["--root", str(tmp_path), "merge-shards"]
+    assert cli.main([*argv, *map(str, directories)]) == 0
+    assert (tmp_path / "requirements" / "a.txt").exists()
+    assert cli.main([*argv, str(directories[0])]) == 1
+    assert capsys.readouterr().err == "shard 2/2 missing\n"
@@ -0,0 +1,261 @@
+import json
+import subprocess
+import sys
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import outdated, slim
+from tox_pin_deps.lockfile import LockEntry, read_lock
+
+from .conftest import make_wheel, sha256
+
+LINUX = slim.Target(
+    tags=frozenset(["cp310-cp310-manylinux_2_17_x86_64", "py3-none-any"]),
+    markers={"sys_platform": "linux", "python_version": "3.10"},
+)
+LINKS = {
+    "demo": [
+        outdated.Link("demo-1.0-py3-none-any.whl", "sha256:any", False),
+        outdated.Link(
+            "demo-1.0-cp310-cp310-manylinux_2_17_x86_64.manylinux2014_x86_64.whl",
+            "sha256:linux",
+            False,
+        ),
+        outdated.Link("demo-1.0-cp310-cp310-win_amd64.whl", "sha256:win", False),
+        outdated.Link("demo-1.0-cp39-cp39-macosx_11_0_arm64.whl", "sha256:mac", False),
+        outdated.Link("demo-1.0.tar.gz", "sha256:sdist", False),
+    ],
+    "winonly": [
+        outdated.Link("winonly-1.0-cp310-cp310-win_amd64.whl", "sha256:w", False),
+    ],
+}
+
+
+def test_wheel_tags():
+    assert slim.wheel_tags("demo-1.0-py2.py3-none-any.whl") == {
+        "py2-none-any",
+        "py3-none-any",
+    }
+    assert slim.wheel_tags("demo-1.0-1-cp310-abi3-linux_x86_64.whl") == {
+        "cp310-abi3-linux_x86_64"
+    }
+    assert slim.wheel_tags("demo.whl") == set()
+
+
+@pytest.mark.parametrize(
+    "markers, expected",
+    [
+        (None, True),
+        ('sys_platform == "linux"', True),
+        ('sys_platform == "win32"', False),
+        ('python_version < "3.8"', False),
+        ('extra == "test"', False),
+        ("not a marker", True),
+    ],
+)
+def test_markers_match(markers, expected):
+    assert slim.markers_match(markers, LINUX) is expected
+
+
+def test_slim_entries():
+    entries = [
+        LockEntry(
+            "demo",
+            "1.0",
+            "demo==1.0",
+            hashes=(
+                "sha256:any",
+                "sha256:linux",
+                "sha256:win",
+                "sha256:mac",
+                "sha256:sdist",
+                "sha256:unknown",
+            ),
+        ),
+        LockEntry(
+            "winonly",
+            "1.0",
+            'winonly==1.0 ; sys_platform == "win32"',
+            markers='sys_platform == "win32"',
+            hashes=("sha256:w",),
+        ),
+        LockEntry("nohash", "2.0", "nohash==2.0"),
+        LockEntry("winwheel", "1.0", "winwheel==1.0", hashes=("sha256:ww",)),
+    ]
+    links = {
+        **LINKS,
+        "winwheel": [
+            outdated.Link("winwheel-1.0-py3-none-win32.whl", "sha256:ww", False)
+        ],
+    }
+    result = slim.slim_entries(entries, LINUX, links)
+    assert result.hashes_removed == 2
+    assert result.entries_removed == 0
+    assert [(e.name, e.hashes) for e in result.entries] == [
+        ("demo", ("sha256:any", "sha256:linux", "sha256:sdist", "sha256:unknown")),
+        # excluded by its markers, so meant for another platform
+        ("winonly", ("sha256:w",)),
+        ("nohash", ()),
+        # nothing installable, the hashes are kept for pip to report
+        ("winwheel", ("sha256:ww",)),
+    ]
+    dropped = slim.slim_entries(entries, LINUX, links, drop_excluded=True)
+    assert dropped.entries_removed == 1
+    assert [e.name for e in dropped.entries] == ["demo", "nohash", "winwheel"]
+
+
+def test_with_platforms():
+    target = slim.with_platforms(LINUX, ["win_amd64"])
+    assert target.markers == LINUX.markers
+    assert target.tags == {
+        "cp310-cp310-manylinux_2_17_x86_64",
+        "cp310-cp310-win_amd64",
+        "py3-none-any",
+        "py3-none-win_amd64",
+    }
+    assert slim.with_platforms(LINUX, []) == LINUX
+
+
+def test_interpreter_target():
+    target = slim.interpreter_target(sys.executable)
+    assert "py3-none-any" in target.tags
+    assert target.markers["sys_platform"] == sys.platform
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="targets a non-windows platform")
+def test_slim_lock_hash_checking(tmp_path):
+    pytest.importorskip("dumb_pypi")
+    pool = tmp_path / "pool"
+    pool.mkdir()
+    files = [
+        make_wheel(pool, "demo", "1.0", "py3-none-any"),
+        make_wheel(pool, "demo", "1.0", "cp27-cp27m-win32"),
+        make_wheel(pool, "winonly", "1.0", "py3-none-any"),
+    ]
+    (tmp_path / "packages.json").write_text(
+        "\n".join(
+            json.dumps({"filename": f.name, "hash": sha256(f).replace(":", "=")})
+            for f in files
+        )
+    )
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "dumb_pypi.main",
+            "--package-list-json",
+            str(tmp_path / "packages.json"),
+            "--packages-url",
+            "../../../pool/",
+            "--output-dir",
+            str(tmp_path / "index"),
+        ],
+        capture_output=True,
+        check=True,
+    )
+    index_url = (tmp_path / "index" / "simple").as_uri()
+    lock = tmp_path / "py310.txt"
+    lock.write_text(
+        "#\n# This file is autogenerated by pip-compile\n#\n"
+        f"--index-url {index_url}\n\n"
+        "demo==1.0 \\\n"
+        f"    --hash={sha256(files[0])} \\\n"
+        f"    --hash={sha256(files[1])}\n"
+        "    # via -r requirements.in\n"
+        'winonly==1.0 ; sys_platform == "win32" \\\n'
+        f"    --hash={sha256(files[2])}\n"
+        "    # via -r requirements.in\n"
+    )
+    client = outdated.IndexClient([index_url])
+    result = slim.slim_lock(
+        lock, slim.interpreter_target(sys.executable), client, drop_excluded=True
+    )
+    assert (result.hashes_removed, result.entries_removed) == (1, 1)
+    assert lock.read_text() == (
+        "#\n# This file is autogenerated by pip-compile\n#\n"
+        f"--index-url {index_url}\n\n"
+        "demo==1.0 \\\n"
+        f"    --hash={sha256(files[0])}\n"
+        "    # via -r requirements.in\n"
+    )
+    assert [e.name for e in read_lock(lock)] == ["demo"]
+    # pip accepts the slim lock in hash-checking mode
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "download",
+            "--quiet",
+            "--no-deps",
+            "--require-hashes",
+            "--dest",
+            str(tmp_path / "downloaded"),
+            "-r",
+            str(lock),
+        ],
+        check=True,
+    )
+    assert [p.name for p in (tmp_path / "downloaded").iterdir()] == [files[0].name]
+    # nothing left to prune
+    assert slim.slim_lock(lock, slim.interpreter_target(sys.executable), client) == (
+        read_lock(lock),
+        0,
+        0,
+    )
+
+
+def test_slim_lock_index_unavailable(tmp_path):
+    lock = tmp_path / "py310.txt"
+    text = "demo==1.0 \\\n    --hash=sha256:aaa \\\n    --hash=sha256:bbb\n"
+    lock.write_text(text)
+    client = outdated.IndexClient(["http://127.0.0.1:1/simple"], timeout=5)
+    result = slim.slim_lock(lock, LINUX, client)
+    assert (result.hashes_removed, result.entries_removed) == (0, 0)
+    assert lock.read_text() == text
+
+
+def test_slim_lock_keeps_editables(tmp_path):
+    lock = tmp_path / "py310.txt"
+    lock.write_text(
+        "-e file:///src/foo\n"
+        "    # via -r requirements.in\n"
+        "demo==1.0\n"
+        "    # via foo\n"
+        'winonly==1.0 ; sys_platform == "win32"\n'
+        "    # via foo\n"
+    )
+    client = mock.Mock()
+    result = slim.slim_lock(lock, LINUX, client, drop_excluded=True)
+    assert (result.hashes_removed, result.entries_removed) == (0, 1)
+    assert lock.read_text() == (
+        "-e file:///src/foo\n"
+        "    # via -r requirements.in\n"
+        "demo==1.0\n"
+        "    # via foo\n"
+    )
+
+
+def test_slim_lock_keeps_other_platform_entries(tmp_path):
+    lock = tmp_path / "py310.txt"
+    lock.write_text(
+        "demo==1.0 \\\n"
+        "    --hash=sha256:any \\\n"
+        "    --hash=sha256:win\n"
+        "    # via -r requirements.in\n"
+        'winonly==1.0 ; sys_platform == "win32" \\\n'
+        "    --hash=sha256:w\n"
+        "    # via -r requirements.in\n"
+    )
+    client = mock.Mock()
+    client.links.side_effect = LINKS.__getitem__
+    windows = slim.with_platforms(LINUX, ["win_amd64"])
+    assert slim.slim_lock(lock, windows, client)[1:] == (0, 0)
+    result = slim.slim_lock(lock, LINUX, client)
+    assert (result.hashes_removed, result.entries_removed) == (1, 0)
+    # the win32-only dep survives a Linux slim, with its hashes
+    assert [(e.name, e.hashes) for e in read_lock(lock)] == [
+        ("demo", ("sha256:any",)),
+        ("winonly", ("sha256:w",)),
+    ]
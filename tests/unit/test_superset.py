@@ -0,0 +1,94 @@
+import pytest
+
+from tox_pin_deps import lockfile, superset
+
+SUPERSET_LOCK = """\
+attrs==22.1.0
+    # via pytest
+iniconfig==1.1.1
+    # via pytest
+mock-pkg-foo==0.1.0
+    # via pyproj (pyproject.toml)
+pytest==7.2.0
+    # via -r /tmp/superset.in
+requests==2.28.1
+    # via -r /tmp/superset.in
+urllib3==1.26.13
+    # via
+    #   pytest
+    #   requests
+"""
+
+
+@pytest.mark.parametrize(
+    "deps,exp_roots",
+    (
+        ([], set()),
+        (
+            ["pytest", "Requests[socks] >= 2", "foo_bar; python_version<'3'"],
+            {"pytest", "requests", "foo-bar"},
+        ),
+        (["pkg @ https://example.com/pkg.whl"], {"pkg"}),
+        (["pytest", "-r other.txt"], None),
+        (["./local/path"], None),
+    ),
+)
+def test_root_names(deps, exp_roots):
+    assert superset.root_names(deps) == exp_roots
+
+
+def test_union_requirements():
+    assert superset.union_requirements([["a", "b "], ["b", "c"], [""]]) == [
+        "a",
+        "b",
+        "c",
+    ]
+
+
+def test_conflicting_envs():
+    assert superset.conflicting_envs(
+        {
+            "py27": ["attrs < 22", "pytest", "six==1.16.0"],
+            "py310": ["attrs>=22", "pytest>=7", "six"],
+            "lint": ["attrs >= 22", "pytest<7", "-r other.txt"],
+        }
+    ) == {"attrs": ["lint", "py27", "py310"], "pytest": ["lint", "py310"]}
+    # differently written, but compatible
+    assert superset.conflicting_envs({"a": ["pytest"], "b": ["pytest>=7"]}) == {}
+
+
+def test_merge_locks():
+    py27 = lockfile.parse_lock("attrs==21.4.0\nsix==1.16.0\n-e file:///src/foo\n")
+    py310 = lockfile.parse_lock("attrs==22.1.0\nfoo @ file:///src/foo\n")
+    assert [e.pin for e in superset.merge_locks([py27, py310, []])] == [
+        "attrs==22.1.0",
+        "six==1.16.0",
+    ]
+
+
+def test_project():
+    entries = lockfile.parse_lock(SUPERSET_LOCK)
+    projected = superset.project(entries, roots={"requests"})
+    assert [e.pin for e in projected] == ["requests==2.28.1", "urllib3==1.26.13"]
+    assert projected[1].via == ("requests",)
+
+    projected = superset.project(entries, roots={"pytest"}, include_dist=True)
+    assert [e.name for e in projected] == [
+        "attrs",
+        "iniconfig",
+        "mock-pkg-foo",
+        "pytest",
+        "urllib3",
+    ]
+
+
+def test_group_state(tmp_path):
+    key = superset.group_key("a", "b")
+    assert key == superset.group_key("a", "b")
+    assert key != superset.group_key("a", "c")
+    assert not superset.is_failed(key)
+    superset.mark_failed(key)
+    assert superset.is_failed(key)
+    assert not superset.is_projected(tmp_path / "x.txt")
+    superset.mark_projected(tmp_path / "x.txt")
+    assert superset.is_projected(tmp_path / "x.txt")
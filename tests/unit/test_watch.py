@@ -0,0 +1,149 @@
+import os
+import subprocess
+from unittest import mock
+
+import pytest
+
+from tox_pin_deps import watch
+
+TOX4_CONFIG = """\
+[testenv:py310]
+deps =
+  pytest
+  -r requirements-test.txt
+extras =
+pip_compile_opts =
+skip_install = False
+
+[testenv:lint]
+deps = flake8
+skip_install = True
+
+[testenv:.pkg]
+deps =
+"""
+
+TOX3_CONFIG = """\
+[tox]
+toxinipath = /tmp/tox.ini
+
+[testenv:py310]
+deps = [pytest, -rrequirements-test.txt]
+skip_install = False
+"""
+
+
+def touch_later(path, content):
+    path.write_text(content)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def project(toxinidir):
+    (toxinidir / "tox.ini").write_text("[tox]\n")
+    (toxinidir / "setup.py").write_text("# v1\n")
+    (toxinidir / "requirements-test.txt").write_text("-c constraints.txt\nmock\n")
+    (toxinidir / "constraints.txt").write_text("mock<5\n")
+    return toxinidir
+
+
+def test_parse_tox_config():
+    configs = watch.parse_tox_config(TOX4_CONFIG)
+    assert sorted(configs) == [".pkg", "lint", "py310"]
+    assert watch.deps_lines(configs["py310"]["deps"]) == [
+        "pytest",
+        "-r requirements-test.txt",
+    ]
+    configs3 = watch.parse_tox_config(TOX3_CONFIG)
+    assert watch.deps_lines(configs3["py310"]["deps"]) == [
+        "pytest",
+        "-rrequirements-test.txt",
+    ]
+
+
+def test_env_inputs(project):
+    configs = watch.parse_tox_config(TOX4_CONFIG)
+    env_inputs = watch.env_inputs(project, configs)
+    assert sorted(env_inputs) == ["lint", "py310"]
+    assert env_inputs["py310"].files == (
+        project / "requirements-test.txt",
+        project / "constraints.txt",
+        project / "setup.py",
+    )
+    assert env_inputs["lint"].files == ()
+
+    (project / "setup.py").write_text("# v2\n")
+    new_inputs = watch.env_inputs(project, configs)
+    assert watch.changed_envs(env_inputs, new_inputs) == ["py310"]
+    (project / "constraints.txt").write_text("mock<6\n")
+    assert watch.changed_envs(new_inputs, watch.env_inputs(project, configs)) == [
+        "py310"
+    ]
+    configs["lint"]["deps"] = "flake8\nblack"
+    assert watch.changed_envs({}, watch.env_inputs(project, configs)) == [
+        "py310",
+        "lint",
+    ]
+
+
+def test_env_inputs_local(project):
+    lib = project.parent / "libs" / "foo"
+    (lib / "foo").mkdir(parents=True)
+    (lib / "pyproject.toml").write_text("[project]\nname = 'foo'\n")
+    (lib / "foo" / "__init__.py").write_text("")
+    configs = watch.parse_tox_config(TOX4_CONFIG)
+    configs["lint"]["deps"] = "flake8\n-e ../libs/foo"
+    env_inputs = watch.env_inputs(project, configs)
+    assert env_inputs["lint"].files == (
+        lib,
+        lib / "foo",
+        lib / "pyproject.toml",
+        lib / "foo" / "__init__.py",
+    )
+    (lib / "foo" / "__init__.py").write_text("__version__ = '2'\n")
+    assert watch.changed_envs(env_inputs, watch.env_inputs(project, configs)) == [
+        "lint"
+    ]
+
+
+@pytest.fixture
+def mock_subprocess(monkeypatch):
+    run = mock.Mock(
+        return_value=subprocess.CompletedProcess([], 0, stdout=TOX4_CONFIG),
+    )
+    popen = mock.Mock()
+    popen.return_value.poll.return_value = None
+    monkeypatch.setattr(subprocess, "run", run)
+    monkeypatch.setattr(subprocess, "Popen", popen)
+    return run, popen
+
+
+def test_watcher(project, mock_subprocess):
+    run, popen = mock_subprocess
+    watcher = watch.Watcher(project, tox_cmd=["tox"], tox_args=["-v"], debounce=1)
+    watcher.start()
+    assert run.call_args[0][0][:2] == ["tox", "config"]
+    assert project / "constraints.txt" in watcher.watched_files
+
+    watcher.step(now=0)
+    popen.assert_not_called()
+
+    touch_later(project / "constraints.txt", "mock<6\n")
+    watcher.step(now=10)
+    watcher.step(now=10.5)  # debouncing
+    popen.assert_not_called()
+    watcher.step(now=11)
+    popen.assert_called_once()
+    assert popen.call_args[0][0] == ["tox", "-e", "py310", "--pip-compile", "-v"]
+
+    # changes while compiling are queued until the compile finishes
+    touch_later(project / "setup.py", "# v2\n")
+    watcher.step(now=20)
+    watcher.step(now=21)
+    assert watcher.pending == ["py310"]
+    assert popen.call_count == 1
+    popen.return_value.poll.return_value = 0
+    watcher.step(now=22)
+    assert watcher.pending == []
+    assert popen.call_count == 2
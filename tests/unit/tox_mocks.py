@@ -106,11 +106,23 @@ def noop_decorator(f, *args, **kwargs):
 class DepConfig:
     name = attr.ib()
 
+    def __str__(self):
+        return self.name
+
+
+class InvocationError(Exception):
+    """tox3 tox.exception.InvocationError"""
+
+
+class Fail(Exception):
+    """tox4 tox.tox_env.errors.Fail"""
+
 
 class MockTox3Context(MockImportContext):
     MOCK_MODULES = [r"tox(\..+|$)"]
     SPECIAL_MOCKS = {
         SpecialMockSpec("tox.config", "DepConfig"): DepConfig,
+        SpecialMockSpec("tox.exception", "InvocationError"): InvocationError,
         SpecialMockSpec("tox", "hookimpl"): noop_decorator,
         SpecialMockSpec("tox.plugin", "impl"): ImportError("No tox.plugin in tox3"),
     }
@@ -124,6 +136,9 @@ class InstallShim(ShimBaseMock):
     def install(self, *args, **kwargs):
         return self._install_mock(*args, **kwargs)
 
+    def _execute_installer(self, *args, **kwargs):
+        return self.__getattr__("execute_installer")(*args, **kwargs)
+
 
 class TestEnvShim(ShimBaseMock):
     @property
@@ -133,6 +148,10 @@ class TestEnvShim(ShimBaseMock):
     def register_config(self, *args, **kwargs):
         return self._register_config_mock(*args, **kwargs)
 
+    @property
+    def installer(self):
+        return self.__getattr__("installer")
+
 
 @attr.s(frozen=True)
 class PythonDeps:
@@ -149,6 +168,7 @@ class MockTox4Context(MockImportContext):
         SpecialMockSpec("tox", "hookimpl"): ImportError("No tox.hookimpl in tox4"),
         SpecialMockSpec("tox.config.cli.parser", "DEFAULT_VERBOSITY"): 2,
         SpecialMockSpec("tox.plugin", "impl"): noop_decorator,
+        SpecialMockSpec("tox.tox_env.errors", "Fail"): Fail,
         SpecialMockSpec("tox.tox_env.python.pip.pip_install", "Pip"): InstallShim,
         SpecialMockSpec("tox.tox_env.python.pip.req_file", "PythonDeps"): PythonDeps,
         SpecialMockSpec(